@@ -0,0 +1,66 @@
+"""
+Compare the markdown aware message packer with fixed offset slicing.
+
+    python benchmarks/bench_packer.py [body size in KB]
+"""
+
+import os
+import random
+import sys
+import timeit
+
+source_path = "../src/err-backend-discord"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), source_path)))
+
+from discordlib.packer import pack_message  # noqa: E402
+
+LIMIT = 2000
+
+
+def slice_message(body, limit=LIMIT):
+    return [body[i : i + limit] for i in range(0, len(body), limit)]
+
+
+def make_body(size):
+    """
+    Typical command output: prose, tables and code blocks.
+    """
+    rnd = random.Random(0)
+    lines = []
+    length = 0
+    while length < size:
+        if rnd.random() < 0.1:
+            block = ["```python"] + [
+                "    " + "x" * rnd.randint(10, 90) for _ in range(rnd.randint(5, 60))
+            ]
+            block.append("```")
+        else:
+            block = [" ".join("word" for _ in range(rnd.randint(1, 25)))]
+        lines.extend(block)
+        length += sum(len(line) + 1 for line in block)
+    return "\n".join(lines)
+
+
+def broken(chunks):
+    """
+    Count chunks with an unbalanced code fence.
+    """
+    fences = sum(
+        1 for chunk in chunks if sum(1 for line in chunk.splitlines() if line.startswith("```")) % 2
+    )
+    return fences
+
+
+def main(size_kb):
+    body = make_body(size_kb * 1024)
+    for name, split in [("slicing", slice_message), ("packer", lambda b: list(pack_message(b)))]:
+        chunks = split(body)
+        seconds = min(timeit.repeat(lambda: split(body), number=10, repeat=3)) / 10
+        print(
+            f"{name:8} {len(body)} chars -> {len(chunks)} chunks,"
+            f" {broken(chunks)} with broken code blocks, {seconds * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
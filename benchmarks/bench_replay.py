@@ -0,0 +1,165 @@
+"""
+Replay gateway events through the backend event handlers.
+
+Replays a recording made with the `gateway_record_file` setting, or a generated one
+with a guild, chat messages, edits and member updates.  With --raw-events the backend
+runs without the message and member caches.
+
+    python benchmarks/bench_replay.py [events | recording file] [speed] [--raw-events]
+"""
+
+import asyncio
+import cProfile
+import importlib
+import logging
+import os
+import pstats
+import resource
+import sys
+import time
+from tempfile import mkdtemp
+
+from rest_standin import RestStandIn  # isort: skip (sets up the source path)
+
+from discordlib.replay import GatewayReplayer, read_events
+from errbot.bootstrap import bot_config_defaults
+from mock import MagicMock
+
+DiscordBackend = importlib.import_module("err-backend-discord").DiscordBackend
+
+GUILD_ID = 1000000000000000000
+CHANNEL_ID = 1000000000000000001
+USERS = 50
+BOT_ID = 1000000000000000002
+
+
+def make_config(raw_events=False):
+    __import__("errbot.config-template")
+    config = sys.modules["errbot.config-template"]
+    bot_config_defaults(config)
+    config.BOT_DATA_DIR = mkdtemp()
+    config.BOT_LOG_FILE = os.path.join(config.BOT_DATA_DIR, "log.txt")
+    config.BOT_EXTRA_PLUGIN_DIR = []
+    config.BOT_PREFIX = "!"
+    config.BOT_IDENTITY = {
+        "token": "token",
+        "initial_intents": "all",
+        "raw_events": raw_events,
+        # Recordings may be replayed several times, their messages are always processed.
+        "message_dedup_window": 0,
+    }
+    return config
+
+
+def user(i):
+    return {
+        "id": str(GUILD_ID + 100 + i),
+        "username": f"user{i}",
+        "discriminator": "0001",
+        "avatar": None,
+    }
+
+
+def make_events(count):
+    """
+    Generate a guild followed by chat messages, a few edits and member updates.
+    """
+    now = time.time()
+    members = [
+        {"user": user(i), "roles": [], "joined_at": "2022-01-01T00:00:00+00:00"}
+        for i in range(USERS)
+    ]
+    yield now, "GUILD_CREATE", {
+        "id": str(GUILD_ID),
+        "name": "bench",
+        "channels": [{"id": str(CHANNEL_ID), "type": 0, "name": "general", "position": 0}],
+        "members": members,
+        "member_count": USERS,
+        "roles": [],
+        "emojis": [],
+        "stickers": [],
+        "threads": [],
+    }
+    for i in range(count):
+        now += 0.01
+        message_id = str(GUILD_ID + 10000 + i)
+        if i % 10 == 9:
+            yield now, "MESSAGE_UPDATE", {
+                "id": str(GUILD_ID + 10000 + i - 1),
+                "channel_id": str(CHANNEL_ID),
+                "guild_id": str(GUILD_ID),
+                "content": f"chat message {i - 1} (edited)",
+            }
+        elif i % 10 == 8:
+            yield now, "GUILD_MEMBER_UPDATE", {
+                "guild_id": str(GUILD_ID),
+                "user": user(i % USERS),
+                "nick": f"nick{i}",
+                "roles": [],
+                "joined_at": "2022-01-01T00:00:00+00:00",
+            }
+        else:
+            yield now, "MESSAGE_CREATE", {
+                "id": message_id,
+                "channel_id": str(CHANNEL_ID),
+                "guild_id": str(GUILD_ID),
+                "author": user(i % USERS),
+                "member": {"roles": [], "joined_at": "2022-01-01T00:00:00+00:00"},
+                "content": f"chat message {i}",
+                "type": 0,
+                "attachments": [],
+                "embeds": [],
+                "mentions": [],
+                "mention_roles": [],
+                "pinned": False,
+                "mention_everyone": False,
+                "tts": False,
+                "timestamp": "2022-01-01T00:00:00+00:00",
+                "edited_timestamp": None,
+                "flags": 0,
+            }
+
+
+async def main(source, speed, raw_events):
+    events = list(read_events(source) if os.path.exists(source) else make_events(int(source)))
+
+    standin = await RestStandIn().start()
+    backend = DiscordBackend(make_config(raw_events))
+    backend.initialise_client()
+    # Normally set by on_ready, the recording may not start with the READY event.
+    backend.bot_identifier = MagicMock(id=BOT_ID)
+    # Measure the backend alone, without plugins.
+    backend.plugin_manager = MagicMock(**{"get_all_active_plugins.return_value": []})
+    async with backend.client:
+        # Handlers call the REST API, served by the stand-in.
+        await backend.client.login(backend.token)
+        replayer = GatewayReplayer(backend.client, speed=speed)
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        count = await replayer.replay(events)
+        # Let the handlers scheduled by the last events finish.
+        handlers = [t for t in asyncio.all_tasks() if t.get_name().startswith("discord.py: on_")]
+        await asyncio.gather(*handlers, return_exceptions=True)
+        profile.disable()
+        elapsed = time.perf_counter() - start
+
+    await standin.stop()
+    print(
+        f"{count} events in {elapsed:.3f}s ({count / elapsed:.0f} events/s),"
+        f" requests: {standin.report()},"
+        f" peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024}MB"
+    )
+    pstats.Stats(profile).sort_stats("cumulative").print_stats(15)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    args = [arg for arg in sys.argv[1:] if arg != "--raw-events"]
+    asyncio.run(
+        main(
+            args[0] if args else "5000",
+            float(args[1]) if len(args) > 1 else 0,
+            "--raw-events" in sys.argv,
+        )
+    )
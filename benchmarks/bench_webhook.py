@@ -0,0 +1,52 @@
+"""
+Measure webhook sender throughput against the local REST stand-in.
+
+    python benchmarks/bench_webhook.py [messages] [channels] [latency]
+"""
+
+import asyncio
+import sys
+import time
+
+from rest_standin import RestStandIn  # isort: skip (sets up the source path)
+
+from discordlib.webhook import WebhookSender
+from mock import MagicMock
+
+TOKEN = "t" * 68
+
+
+async def main(messages: int, channels: int, latency: float):
+    standin = await RestStandIn(latency=latency).start()
+
+    rooms = {
+        1000000000000000000
+        + i: f"https://discord.com/api/webhooks/{2000000000000000000 + i}/{TOKEN}"
+        for i in range(channels)
+    }
+    sender = WebhookSender(MagicMock(user=None), rooms)
+    channel_ids = list(rooms)
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(sender.send(channel_ids[i % channels], content=f"alert {i}") for i in range(messages))
+    )
+    elapsed = time.perf_counter() - start
+
+    await sender.close()
+    await standin.stop()
+    print(
+        f"{messages} messages to {channels} channels in {elapsed:.3f}s"
+        f" ({messages / elapsed:.0f} msg/s), requests: {standin.report()}"
+    )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(
+        main(
+            int(args[0]) if len(args) > 0 else 500,
+            int(args[1]) if len(args) > 1 else 5,
+            float(args[2]) if len(args) > 2 else 0.0,
+        )
+    )
@@ -0,0 +1,130 @@
+"""
+Local stand-in for the Discord REST API used by the benchmarks.
+
+Only the endpoints exercised by the benchmarks are implemented.  Responses can be
+delayed to emulate network latency and every request is counted per route.
+"""
+
+import asyncio
+import collections
+import json
+import os
+import sys
+
+from aiohttp import web
+
+source_path = "../src/err-backend-discord"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), source_path)))
+
+import discord  # noqa: E402
+
+
+class RestStandIn:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = collections.Counter()
+        self._runner = None
+        self.url = None
+
+    @staticmethod
+    def _json(data):
+        # discord.py only decodes responses with this exact content type.
+        return web.Response(body=json.dumps(data).encode("utf-8"), content_type="application/json")
+
+    async def _webhook(self, request):
+        self.requests["webhook"] += 1
+        await asyncio.sleep(self.latency)
+        if request.query.get("wait") in ("1", "true"):
+            return self._json(self._message(request.match_info["webhook_id"]))
+        return web.Response(status=204)
+
+    async def _channel_message(self, request):
+        self.requests["channel_message"] += 1
+        await asyncio.sleep(self.latency)
+        return self._json(self._message(request.match_info["channel_id"]))
+
+    async def _typing(self, request):
+        self.requests["typing"] += 1
+        await asyncio.sleep(self.latency)
+        return web.Response(status=204)
+
+    async def _me(self, request):
+        self.requests["me"] += 1
+        return self._json(
+            {"id": "1", "username": "standin", "discriminator": "0", "avatar": None, "bot": True}
+        )
+
+    async def _application(self, request):
+        self.requests["application"] += 1
+        user = {"id": "1", "username": "standin", "discriminator": "0", "avatar": None}
+        return self._json(
+            {
+                "id": "1",
+                "name": "standin",
+                "description": "",
+                "icon": None,
+                "rpc_origins": [],
+                "bot_public": False,
+                "bot_require_code_grant": False,
+                "owner": user,
+                "verify_key": "",
+            }
+        )
+
+    async def _dm_channel(self, request):
+        self.requests["dm_channel"] += 1
+        await asyncio.sleep(self.latency)
+        recipient = (await request.json())["recipient_id"]
+        return self._json(
+            {
+                "id": str(discord.utils.time_snowflake(discord.utils.utcnow())),
+                "type": 1,
+                "recipients": [
+                    {"id": recipient, "username": "user", "discriminator": "0", "avatar": None}
+                ],
+            }
+        )
+
+    def _message(self, channel_id):
+        snowflake = str(discord.utils.time_snowflake(discord.utils.utcnow()))
+        return {
+            "id": snowflake,
+            "channel_id": channel_id,
+            "type": 0,
+            "content": "",
+            "author": {"id": snowflake, "username": "standin", "discriminator": "0"},
+            "attachments": [],
+            "embeds": [],
+            "mentions": [],
+            "mention_roles": [],
+            "pinned": False,
+            "mention_everyone": False,
+            "tts": False,
+            "timestamp": discord.utils.utcnow().isoformat(),
+            "edited_timestamp": None,
+            "flags": 0,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/api/v10/webhooks/{webhook_id}/{token}", self._webhook)
+        app.router.add_post("/api/v10/channels/{channel_id}/messages", self._channel_message)
+        app.router.add_post("/api/v10/channels/{channel_id}/typing", self._typing)
+        app.router.add_get("/api/v10/users/@me", self._me)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self._application)
+        app.router.add_post("/api/v10/users/@me/channels", self._dm_channel)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        # Point the discord module at the stand-in.
+        discord.http.Route.BASE = f"{self.url}/api/v10"
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def report(self):
+        return json.dumps(dict(self.requests))
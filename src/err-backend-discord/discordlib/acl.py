@@ -0,0 +1,179 @@
+import fnmatch
+import logging
+import re
+from typing import Callable, Dict, FrozenSet, Iterable, NamedTuple, Optional, Union
+
+from errbot.backends.base import RoomOccupant
+
+log = logging.getLogger(__name__)
+
+BLOCK_COMMAND = (None, None, None)
+
+# ACL patterns matched by id rather than by name.
+RE_USER_PATTERN = re.compile(r"^(?:<@!?(?P<mention>[0-9]+)>|(?P<snowflake>[0-9]{17,}))$")
+RE_ROLE_PATTERN = re.compile(r"^(?:<@&(?P<mention>[0-9]+)>|role:(?P<role_id>[0-9]+))$")
+
+
+class AclIdentity(NamedTuple):
+    """
+    Attributes of a message author that ACL patterns are matched against.
+    """
+
+    id: Optional[int]
+    # errbot ACL attribute, name#discriminator for discord users.
+    name: str
+    role_ids: FrozenSet[int] = frozenset()
+
+
+class AclPatterns:
+    """
+    A list of errbot ACL patterns compiled for matching.
+
+    Patterns without wildcards, user ids and role ids are looked up in sets, the
+    remaining glob patterns are combined in a single regular expression.  Besides
+    errbot's glob patterns on the ACL attribute, users can be matched by `<@id>` or a
+    bare id, and by role with `<@&id>` or `role:id`.
+    """
+
+    def __init__(self, patterns: Union[str, Iterable[str]]):
+        if isinstance(patterns, str):
+            patterns = (patterns,)
+        names, user_ids, role_ids, globs = set(), set(), set(), []
+        for pattern in map(str, patterns):
+            user, role = RE_USER_PATTERN.match(pattern), RE_ROLE_PATTERN.match(pattern)
+            if user:
+                user_ids.add(int(user.group("mention") or user.group("snowflake")))
+            elif role:
+                role_ids.add(int(role.group("mention") or role.group("role_id")))
+            elif any(c in pattern for c in "*?["):
+                globs.append(fnmatch.translate(pattern))
+            else:
+                names.add(pattern)
+        self.names = frozenset(names)
+        self.user_ids = frozenset(user_ids)
+        self.role_ids = frozenset(role_ids)
+        self.globs = re.compile("|".join(globs)) if globs else None
+
+    def matches(self, identity: Union[AclIdentity, str]) -> bool:
+        if not isinstance(identity, AclIdentity):
+            identity = AclIdentity(None, str(identity))
+        return (
+            identity.name in self.names
+            or identity.id in self.user_ids
+            or not self.role_ids.isdisjoint(identity.role_ids)
+            or (self.globs is not None and self.globs.match(identity.name) is not None)
+        )
+
+
+class AclFilter:
+    """
+    Command filter equivalent to errbot's ACLS core plugin filter, matching precompiled
+    patterns against precomputed identities.
+
+    The ACL of each command and the compiled patterns are computed once, the identity of
+    message authors is provided by the backend which caches it per user.
+    """
+
+    def __init__(self, bot, identity: Callable[[object], AclIdentity]):
+        """
+        :param bot: errbot backend, its configuration and commands are used.
+        :param identity: function returning the ACL identity of a message author.
+        """
+        self.bot = bot
+        self.identity = identity
+        config = bot.bot_config
+        self.admins = AclPatterns(config.BOT_ADMINS)
+        self._acls: Dict[str, dict] = {}
+
+    def _acl(self, cmd_str: str) -> dict:
+        """
+        Return the ACL of a command, with its patterns compiled.
+        """
+        acl = self._acls.get(cmd_str)
+        if acl is not None:
+            return acl
+        config = self.bot.bot_config
+        acl = config.ACCESS_CONTROLS_DEFAULT.copy()
+        for pattern, acls in config.ACCESS_CONTROLS.items():
+            if ":" not in pattern:
+                pattern = f"*:{pattern}"
+            if fnmatch.fnmatchcase(cmd_str.lower(), pattern.lower()):
+                acl.update(acls)
+                break
+        for key in ("allowusers", "denyusers", "allowrooms", "denyrooms"):
+            if key in acl:
+                acl[key] = AclPatterns(acl[key])
+        self._acls[cmd_str] = acl
+        return acl
+
+    def access_denied(self, msg, reason: str, dry_run: bool):
+        if not dry_run and not self.bot.bot_config.HIDE_RESTRICTED_ACCESS:
+            self.bot.send_simple_reply(msg, reason)
+        return BLOCK_COMMAND
+
+    @staticmethod
+    def _glob(text, patterns) -> bool:
+        if isinstance(patterns, str):
+            patterns = (patterns,)
+        return any(fnmatch.fnmatchcase(str(text), str(pattern)) for pattern in patterns)
+
+    def __call__(self, msg, cmd, args, dry_run):
+        f = self.bot.all_commands[cmd]
+        acl = self._acl(f"{f.__self__.name}:{cmd}")
+        usr = self.identity(msg.frm)
+
+        if "allowargs" in acl and not self._glob(args, acl["allowargs"]):
+            return self.access_denied(
+                msg,
+                "You're not allowed to access this command using the provided arguments",
+                dry_run,
+            )
+        if "denyargs" in acl and self._glob(args, acl["denyargs"]):
+            return self.access_denied(
+                msg,
+                "You're not allowed to access this command using the provided arguments",
+                dry_run,
+            )
+
+        if "allowusers" in acl and not acl["allowusers"].matches(usr):
+            return self.access_denied(
+                msg, "You're not allowed to access this command from this user", dry_run
+            )
+        if "denyusers" in acl and acl["denyusers"].matches(usr):
+            return self.access_denied(
+                msg, "You're not allowed to access this command from this user", dry_run
+            )
+
+        if msg.is_group:
+            if not isinstance(msg.frm, RoomOccupant):
+                raise Exception(f"msg.frm is not a RoomOccupant. Class of frm: {msg.frm.__class__}")
+            room = getattr(msg.frm.room, "aclattr", str(msg.frm.room))
+            if "allowmuc" in acl and acl["allowmuc"] is False:
+                return self.access_denied(
+                    msg, "You're not allowed to access this command from a chatroom", dry_run
+                )
+            if "allowrooms" in acl and not acl["allowrooms"].matches(room):
+                return self.access_denied(
+                    msg, "You're not allowed to access this command from this room", dry_run
+                )
+            if "denyrooms" in acl and acl["denyrooms"].matches(room):
+                return self.access_denied(
+                    msg, "You're not allowed to access this command from this room", dry_run
+                )
+        elif "allowprivate" in acl and acl["allowprivate"] is False:
+            return self.access_denied(
+                msg, "You're not allowed to access this command via private message to me", dry_run
+            )
+
+        if f._err_command_admin_only:
+            if not self.admins.matches(usr):
+                return self.access_denied(
+                    msg, "This command requires bot-admin privileges", dry_run
+                )
+            # Admin only commands are direct message only unless allowmuc is set.
+            if msg.is_group and not acl.get("allowmuc", False):
+                return self.access_denied(
+                    msg, "This command may only be issued through a direct message", dry_run
+                )
+
+        return msg, cmd, args
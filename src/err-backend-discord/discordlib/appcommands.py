@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import re
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+try:
+    import discord
+    from discord import app_commands
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+# Discord application command constraints.
+RE_COMMAND_NAME = re.compile(r"^[-_a-z0-9]{1,32}$")
+MAX_DESCRIPTION = 100
+MAX_COMMANDS = 100
+
+
+def command_definitions(commands: Dict[str, Callable]) -> List[Tuple[str, str]]:
+    """
+    Return the (name, description) of the errbot commands that can be exposed as
+    discord application commands, sorted by name.
+    """
+    definitions = []
+    for name, method in sorted(commands.items()):
+        if getattr(method, "_err_command_hidden", False):
+            continue
+        if not RE_COMMAND_NAME.match(name):
+            log.debug(f"Command {name} isn't a valid application command name, skipping it.")
+            continue
+
+        doc = (method.__doc__ or "").strip().splitlines()
+        description = doc[0].strip() if doc else f"Run the {name} command."
+        if len(description) > MAX_DESCRIPTION:
+            description = description[: MAX_DESCRIPTION - 3] + "..."
+        definitions.append((name, description))
+
+    if len(definitions) > MAX_COMMANDS:
+        log.warning(
+            f"Only the first {MAX_COMMANDS} of {len(definitions)} commands are registered"
+            " as application commands."
+        )
+    return definitions[:MAX_COMMANDS]
+
+
+def definitions_hash(definitions: List[Tuple[str, str]], guild_ids: List[int]) -> str:
+    data = json.dumps({"commands": definitions, "guilds": sorted(guild_ids)}, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class AppCommandSync:
+    """
+    Expose errbot commands as discord application (slash) commands.
+
+    Every command takes an optional free form `arguments` option and is handed to the
+    `dispatch` coroutine with its name and arguments.  The command tree is only synced
+    with discord when the hash of the command definitions differs from the one stored
+    after the previous sync, avoiding slow bulk overwrites on every start.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        dispatch: Callable[[discord.Interaction, str, str], Awaitable[None]],
+        hash_file: str,
+        guild_ids: Optional[List[int]] = None,
+    ):
+        """
+        :param client: discord client the command tree is attached to.
+        :param dispatch: coroutine function called with (interaction, name, arguments).
+        :param hash_file: path of the file storing the hash of the synced definitions.
+        :param guild_ids: sync commands to these guilds instead of globally.
+        """
+        self.tree = app_commands.CommandTree(client)
+        self.dispatch = dispatch
+        self.hash_file = hash_file
+        self.guild_ids = [int(guild_id) for guild_id in guild_ids or []]
+
+    def stored_hash(self) -> Optional[str]:
+        try:
+            with open(self.hash_file, "r") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def store_hash(self, digest: str) -> None:
+        with open(self.hash_file, "w") as f:
+            f.write(digest)
+
+    def _command(self, name: str, description: str) -> app_commands.Command:
+        async def callback(interaction: discord.Interaction, arguments: Optional[str] = None):
+            await self.dispatch(interaction, name, arguments or "")
+
+        return app_commands.Command(name=name, description=description, callback=callback)
+
+    def register(self, definitions: List[Tuple[str, str]]) -> None:
+        """
+        Replace the commands of the local command tree.
+        """
+        guilds = [discord.Object(id=guild_id) for guild_id in self.guild_ids] or [None]
+        for guild in guilds:
+            self.tree.clear_commands(guild=guild)
+            for name, description in definitions:
+                self.tree.add_command(self._command(name, description), guild=guild)
+
+    async def sync(self, commands: Dict[str, Callable]) -> bool:
+        """
+        Register the commands and sync them with discord if they changed.
+
+        :return: True if the command tree was synced.
+        """
+        definitions = command_definitions(commands)
+        self.register(definitions)
+
+        digest = definitions_hash(definitions, self.guild_ids)
+        if digest == self.stored_hash():
+            log.debug("Application commands are unchanged, skipping sync.")
+            return False
+
+        if self.guild_ids:
+            for guild_id in self.guild_ids:
+                await self.tree.sync(guild=discord.Object(id=guild_id))
+        else:
+            await self.tree.sync()
+
+        log.info(f"Synced {len(definitions)} application commands.")
+        self.store_hash(digest)
+        return True
@@ -0,0 +1,213 @@
+import asyncio
+import collections
+import logging
+import os
+import re
+import sys
+import tempfile
+from typing import AsyncIterator, BinaryIO, Dict, Optional
+
+from discordlib.bridge import DEFAULT, LoopBridge
+
+log = logging.getLogger(__name__)
+
+try:
+    import aiohttp
+    import discord
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+CHUNK_SIZE = 64 * 1024
+# File extensions kept on cached attachments, anything else is dropped.
+RE_EXTENSION = re.compile(r"^\.[A-Za-z0-9]{1,10}$")
+
+
+class AttachmentHandle:
+    """
+    Lazy handle of an inbound message attachment, passed to plugins in the message
+    extras.  Only the metadata is available until the content is asked for, either
+    streamed in chunks or downloaded to the on-disk attachment cache.
+
+    The blocking methods are for plugins running in errbot's threads, their `_async`
+    counterparts for plugins running on the discord event loop.
+    """
+
+    def __init__(self, store: "AttachmentStore", attachment: discord.Attachment):
+        self.store = store
+        self.id: int = attachment.id
+        self.filename: str = attachment.filename
+        self.size: int = attachment.size
+        self.content_type: Optional[str] = attachment.content_type
+        self.url: str = attachment.url
+        self.width: Optional[int] = attachment.width
+        self.height: Optional[int] = attachment.height
+
+    def __repr__(self):
+        return f"<AttachmentHandle {self.filename} {self.size} bytes {self.content_type}>"
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """
+        Stream the content from discord without caching it.
+        """
+        return self.store.stream(self.url, chunk_size)
+
+    async def download_async(self) -> str:
+        """
+        Download the attachment to the cache, unless it is already cached.
+
+        :return: path of the cached file.
+        """
+        return await self.store.download(self)
+
+    def download(self, timeout=DEFAULT) -> str:
+        """
+        Download the attachment to the cache, unless it is already cached.
+
+        :param timeout: seconds to wait for the download, defaults to `send_timeout`.
+        :return: path of the cached file.
+        """
+        return self.store.bridge.run(self.download_async(), timeout=timeout)
+
+    def open(self, timeout=DEFAULT) -> BinaryIO:
+        """
+        Open the cached file of the attachment for reading, downloading it if needed.
+        """
+        return open(self.download(timeout), "rb")
+
+    async def read_async(self) -> bytes:
+        """
+        Return the whole content of the attachment, buffered in memory.
+        """
+        return b"".join([chunk async for chunk in self.chunks()])
+
+    def read(self, timeout=DEFAULT) -> bytes:
+        """
+        Return the whole content of the attachment, buffered in memory.
+        """
+        return self.store.bridge.run(self.read_async(), timeout=timeout)
+
+
+class AttachmentStore:
+    """
+    Download attachments through a shared HTTP session into a size bounded directory.
+
+    Files are written in chunks as they are received, a download never holds more than
+    a chunk in memory.  When the cache grows over `max_size` the least recently used
+    files are removed.  Concurrent downloads of the same attachment share one request.
+    Must be used from the discord event loop, except the blocking handle methods.
+    """
+
+    def __init__(self, bridge: LoopBridge, directory: str, max_size: int, pool_size: int = 10):
+        """
+        :param bridge: bridge running the downloads of blocking handle methods.
+        :param directory: cache directory, created if needed.
+        :param max_size: maximum size of the cached files in bytes.
+        :param pool_size: maximum number of pooled HTTP connections.
+        """
+        self.bridge = bridge
+        self.directory = directory
+        self.max_size = max_size
+        self.pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._downloads: Dict[str, asyncio.Task] = {}
+        # file name -> size, least recently used first.
+        self._files: collections.OrderedDict = collections.OrderedDict()
+        self.size = 0
+        self._scan()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size)
+            )
+        return self._session
+
+    def _scan(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("."):
+                # Partial download left behind by a crash.
+                os.unlink(entry.path)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self.size += size
+        self._evict()
+
+    def handle(self, attachment: discord.Attachment) -> AttachmentHandle:
+        return AttachmentHandle(self, attachment)
+
+    @staticmethod
+    def _name(handle: AttachmentHandle) -> str:
+        extension = os.path.splitext(handle.filename)[1]
+        return f"{handle.id}{extension if RE_EXTENSION.match(extension) else ''}"
+
+    async def stream(self, url: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def download(self, handle: AttachmentHandle) -> str:
+        name = self._name(handle)
+        path = os.path.join(self.directory, name)
+        if name in self._files:
+            self._files.move_to_end(name)
+            os.utime(path)
+            return path
+
+        if handle.size > self.max_size:
+            raise ValueError(
+                f"Attachment {handle.filename} of {handle.size} bytes is larger than the"
+                " attachment cache, stream it instead."
+            )
+
+        task = self._downloads.get(name)
+        if task is None:
+            task = self._downloads[name] = asyncio.create_task(self._download(handle.url, name))
+            task.add_done_callback(lambda _: self._downloads.pop(name, None))
+        # A cancelled waiter doesn't cancel the download shared with other waiters.
+        return await asyncio.shield(task)
+
+    async def _download(self, url: str, name: str) -> str:
+        loop = asyncio.get_running_loop()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".attachment-")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in self.stream(url):
+                    await loop.run_in_executor(None, f.write, chunk)
+                    size += len(chunk)
+            path = os.path.join(self.directory, name)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self._files[name] = size
+        self.size += size
+        self._evict()
+        log.debug(f"Cached attachment {name} of {size} bytes.")
+        return path
+
+    def _evict(self) -> None:
+        # The most recent file is kept even if it doesn't fit.
+        while self.size > self.max_size and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self.size -= size
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    async def close(self) -> None:
+        for task in list(self._downloads.values()):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
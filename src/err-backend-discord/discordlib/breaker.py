@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from typing import Dict
+
+log = logging.getLogger(__name__)
+
+
+class DestinationUnavailable(RuntimeError):
+    """
+    A destination failed repeatedly, the operation wasn't attempted.
+    """
+
+
+class _Circuit:
+    __slots__ = ("failures", "retry_at")
+
+    def __init__(self):
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+class CircuitBreaker:
+    """
+    Short-circuit operations on destinations, channels or users, that failed repeatedly.
+
+    After `threshold` consecutive failures a destination is considered unavailable for
+    `delay` seconds, doubled on every further failure up to `max_delay`.  Once the delay
+    has elapsed a single operation is let through: its success closes the circuit, its
+    failure extends the delay.  Circuits are also closed by the backend when a channel,
+    guild or member event shows the destination may be back.
+    """
+
+    def __init__(self, threshold: int = 3, delay: float = 5, max_delay: float = 300):
+        """
+        :param threshold: consecutive failures after which a destination is unavailable.
+        :param delay: seconds a destination is first unavailable for.
+        :param max_delay: maximum seconds a destination is unavailable for.
+        """
+        self.threshold = threshold
+        self.delay = delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._circuits: Dict[int, _Circuit] = {}
+
+    def __len__(self):
+        return len(self._circuits)
+
+    def is_open(self, destination: int) -> bool:
+        """
+        Return True if operations on the destination should be short-circuited.  When
+        the delay has elapsed the caller is let through to retry the destination.
+        """
+        circuit = self._circuits.get(destination)
+        if circuit is None or circuit.failures < self.threshold:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now < circuit.retry_at:
+                return True
+            # Let a single operation through until it succeeds or fails.
+            circuit.retry_at = now + self._backoff(circuit.failures)
+            return False
+
+    def check(self, destination: int) -> None:
+        """
+        Raise DestinationUnavailable if operations on the destination are short-circuited.
+        """
+        if self.is_open(destination):
+            raise DestinationUnavailable(
+                f"Destination {destination} failed repeatedly, it is skipped until it recovers."
+            )
+
+    def _backoff(self, failures: int) -> float:
+        # The exponent is capped, destinations failing for good keep failing.
+        return min(self.max_delay, self.delay * 2 ** min(failures - self.threshold, 32))
+
+    def failure(self, destination: int) -> None:
+        """
+        Record a failed operation on a destination.
+        """
+        with self._lock:
+            circuit = self._circuits.get(destination)
+            if circuit is None:
+                circuit = self._circuits[destination] = _Circuit()
+            circuit.failures += 1
+            if circuit.failures < self.threshold:
+                return
+            delay = self._backoff(circuit.failures)
+            circuit.retry_at = time.monotonic() + delay
+        if circuit.failures == self.threshold:
+            log.warning(f"Destination {destination} is failing, skipping it for {delay}s.")
+
+    def success(self, destination: int) -> None:
+        """
+        Record a successful operation on a destination, closing its circuit.
+        """
+        if destination in self._circuits:
+            self.reset(destination)
+
+    def reset(self, destination: int) -> None:
+        with self._lock:
+            if self._circuits.pop(destination, None) is not None:
+                log.info(f"Destination {destination} recovered.")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._circuits.clear()
@@ -0,0 +1,137 @@
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Awaitable, Coroutine, Optional
+
+log = logging.getLogger(__name__)
+
+# Sentinel to tell a caller didn't provide a timeout, None means wait indefinitely.
+DEFAULT = object()
+
+
+class LoopBridge:
+    """
+    Hand coroutines from errbot's threads over to the discord client event loop.
+
+    Coroutines submitted while a handoff is pending are scheduled together by a single
+    wakeup of the event loop.  The same timeout and cancellation policy applies to
+    coroutines run from threads with `run` and awaited on the loop with `wait`: when the
+    timeout expires the coroutine is cancelled and TimeoutError is raised.
+    """
+
+    def __init__(self, client, timeout: Optional[float] = 5.0):
+        """
+        :param client: discord client whose event loop runs the coroutines.
+        :param timeout: default number of seconds to wait for a coroutine, None to
+                        wait indefinitely.
+        """
+        self.client = client
+        self.timeout = timeout
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self.client.loop
+
+    def _timeout(self, timeout) -> Optional[float]:
+        return self.timeout if timeout is DEFAULT else timeout
+
+    def in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine on the event loop from any thread.
+
+        :return: a concurrent future of the coroutine result.
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._pending.append((coro, future))
+            if self._scheduled:
+                return future
+            self._scheduled = True
+        self.loop.call_soon_threadsafe(self._drain)
+        return future
+
+    def _drain(self) -> None:
+        with self._lock:
+            items = list(self._pending)
+            self._pending.clear()
+            self._scheduled = False
+
+        for coro, future in items:
+            if not future.set_running_or_notify_cancel():
+                coro.close()
+                continue
+            task = self.loop.create_task(coro)
+            future.task = task
+            task.add_done_callback(lambda t, f=future: self._copy_result(t, f))
+
+    @staticmethod
+    def _copy_result(task: asyncio.Task, future: concurrent.futures.Future) -> None:
+        if task.cancelled():
+            future.set_exception(concurrent.futures.CancelledError())
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def cancel(self, future: concurrent.futures.Future) -> None:
+        """
+        Cancel a submitted coroutine, whether it has started running or not.
+        """
+        if future.cancel():
+            return
+        task = getattr(future, "task", None)
+        if task is not None:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    def run(self, coro: Coroutine, timeout=DEFAULT) -> Any:
+        """
+        Run a coroutine on the event loop and wait for its result from another thread.
+
+        :param timeout: seconds to wait, defaults to the bridge timeout.
+        """
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError(
+                "Waiting for a coroutine from the discord event loop would deadlock,"
+                " use the async API instead."
+            )
+
+        future = self.submit(coro)
+        try:
+            return future.result(self._timeout(timeout))
+        except concurrent.futures.TimeoutError:
+            self.cancel(future)
+            raise TimeoutError(f"Operation timed out after {self._timeout(timeout)}s.")
+
+    def run_soon(self, coro: Coroutine) -> concurrent.futures.Future:
+        """
+        Run a coroutine on the event loop without waiting for it, failures are logged.
+        """
+        future = self.submit(coro)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: concurrent.futures.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            log.error(f"Discord operation failed: {future.exception()}")
+
+    async def wait(self, aw: Awaitable, timeout=DEFAULT) -> Any:
+        """
+        Await on the event loop with the bridge's timeout and cancellation policy.
+        """
+        try:
+            return await asyncio.wait_for(aw, self._timeout(timeout))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Operation timed out after {self._timeout(timeout)}s.")
@@ -0,0 +1,195 @@
+import asyncio
+import functools
+import logging
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+try:
+    import discord
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+COLOURS = {
+    "red": 0xFF0000,
+    "green": 0x008000,
+    "yellow": 0xFFA500,
+    "blue": 0x0000FF,
+    "white": 0xFFFFFF,
+    "cyan": 0x00FFFF,
+}
+
+# Discord limits per message.
+MAX_EMBEDS = 10
+MAX_EMBEDS_SIZE = 6000
+
+
+@functools.lru_cache(maxsize=256)
+def parse_colour(colour: str) -> Optional[int]:
+    """
+    Convert a card colour name or hex string (#RRGGBB) to an integer.
+    """
+    if not colour:
+        return None
+    if colour in COLOURS:
+        return COLOURS[colour]
+    return int(colour.replace("#", "0x"), 16)
+
+
+@functools.lru_cache(maxsize=256)
+def _embed_template(title, colour, image, thumbnail, fields) -> dict:
+    em = discord.Embed(title=title, color=parse_colour(colour))
+
+    if image:
+        em.set_image(url=image)
+
+    if thumbnail:
+        em.set_thumbnail(url=thumbnail)
+
+    for key, value in fields:
+        em.add_field(name=key, value=value, inline=True)
+
+    return em.to_dict()
+
+
+def _copy_nested(value):
+    if isinstance(value, list):
+        return [dict(item) for item in value]
+    return dict(value)
+
+
+def build_embed(card) -> discord.Embed:
+    """
+    Build the discord embed of an errbot card.
+
+    Everything but the card body is taken from a cached template so cards sharing the
+    same title, colour, images and fields don't rebuild them.
+    """
+    fields = tuple((key, value) for key, value in card.fields) if card.fields else ()
+    template = _embed_template(card.title, card.color, card.image, card.thumbnail, fields)
+    # The embed keeps the nested dicts, copy them so it can't alter the cached template.
+    data = {
+        key: _copy_nested(value) if isinstance(value, (dict, list)) else value
+        for key, value in template.items()
+    }
+    if card.body:
+        data["description"] = card.body
+    return discord.Embed.from_dict(data)
+
+
+class _Batch:
+    __slots__ = ("recipient", "embeds", "size", "futures", "handle")
+
+    def __init__(self, recipient):
+        self.recipient = recipient
+        self.embeds: List[discord.Embed] = []
+        self.size = 0
+        self.futures: List[asyncio.Future] = []
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class CardBatcher:
+    """
+    Pack consecutive embeds sent to the same recipient into a single message.
+
+    The first embed queued for a recipient opens a batch which is sent when the window
+    expires, when it reaches discord's per message embed limits or when it is flushed
+    explicitly.  All methods must be called from the discord client event loop.
+    """
+
+    def __init__(
+        self,
+        send: Callable[..., Awaitable[Optional[discord.Message]]],
+        window: float = 0.25,
+        max_embeds: int = MAX_EMBEDS,
+    ):
+        """
+        :param send: coroutine function called as send(recipient, embeds=[...]).
+        :param window: seconds to wait for more embeds before sending a batch.
+        :param max_embeds: maximum number of embeds per message.
+        """
+        self._send = send
+        self.window = window
+        self.max_embeds = max_embeds
+        self._pending: Dict[int, _Batch] = {}
+
+    @staticmethod
+    def _key(recipient) -> int:
+        # Room occupants are sent to through their room.
+        return getattr(recipient, "room", recipient).id
+
+    def add(self, recipient, embed: discord.Embed) -> asyncio.Future:
+        """
+        Queue an embed for a recipient.
+
+        :return: a future resolved with the message that contained the embed.
+        """
+        loop = asyncio.get_running_loop()
+        key = self._key(recipient)
+        batch = self._pending.get(key)
+        if batch is not None and batch.size + len(embed) > MAX_EMBEDS_SIZE:
+            self.flush(recipient)
+            batch = None
+
+        if batch is None:
+            batch = _Batch(recipient)
+            batch.handle = loop.call_later(self.window, self._flush_key, key)
+            self._pending[key] = batch
+
+        future = loop.create_future()
+        # Failures are logged when the batch is sent, don't warn about unretrieved exceptions.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        batch.embeds.append(embed)
+        batch.size += len(embed)
+        batch.futures.append(future)
+
+        if len(batch.embeds) >= self.max_embeds:
+            self._flush_key(key)
+        return future
+
+    def flush(self, recipient) -> Optional[asyncio.Task]:
+        """
+        Send the pending embeds of a recipient now.
+
+        :return: the task sending them, None if no embeds were pending.
+        """
+        return self._flush_key(self._key(recipient))
+
+    def flush_all(self) -> List[asyncio.Task]:
+        """
+        Send the pending embeds of every recipient now, e.g. before disconnecting.
+
+        :return: the tasks sending them.
+        """
+        return [self._flush_key(key) for key in list(self._pending)]
+
+    def clear(self) -> None:
+        """
+        Drop pending batches without sending them.
+        """
+        for batch in self._pending.values():
+            batch.handle.cancel()
+        self._pending.clear()
+
+    def _flush_key(self, key) -> Optional[asyncio.Task]:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return None
+        batch.handle.cancel()
+        return asyncio.get_running_loop().create_task(self._send_batch(batch))
+
+    async def _send_batch(self, batch: _Batch) -> None:
+        try:
+            message = await self._send(batch.recipient, embeds=batch.embeds)
+        except Exception as e:
+            log.error(f"Failed to send {len(batch.embeds)} cards to {batch.recipient}: {e}")
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_result(message)
@@ -0,0 +1,90 @@
+import collections
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Deque, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class MessageDeduplicator:
+    """
+    Remember the ids of the messages processed within a time window, so messages
+    delivered again by the gateway, e.g. when a session is resumed, are processed once.
+
+    Only remembered ids are reported as seen: messages created long ago, e.g. replayed
+    when a session is resumed after an outage, are processed if they weren't before.
+    Ids are forgotten `window` seconds after they were remembered, or oldest first when
+    `maxsize` ids are remembered, which keeps memory constant under sustained load.
+    """
+
+    def __init__(self, window: float = 300, maxsize: int = 20000):
+        """
+        :param window: seconds a processed message id is remembered for.
+        :param maxsize: maximum number of remembered ids.
+        """
+        self.window = window
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._ids: Set[int] = set()
+        # (time remembered, id) in the order the ids were remembered.
+        self._order: Deque[Tuple[float, int]] = collections.deque()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _expire(self, now: float) -> None:
+        horizon = now - self.window
+        while self._order and self._order[0][0] < horizon:
+            self._ids.discard(self._order.popleft()[1])
+
+    def seen(self, message_id: int, now: float = None) -> bool:
+        """
+        Return True if the message was already seen, otherwise remember it.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if message_id in self._ids:
+                return True
+            self._ids.add(message_id)
+            self._order.append((now, message_id))
+            if len(self._order) > self.maxsize:
+                self._ids.discard(self._order.popleft()[1])
+        return False
+
+    def load(self, path: str) -> None:
+        """
+        Remember the ids saved to a file, as if they were processed when loaded.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                ids = [int(message_id) for message_id in json.load(f)]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, TypeError) as e:
+            log.warning(f"Failed to load processed message ids from {path}: {e}")
+            return
+        now = time.time()
+        for message_id in sorted(ids):
+            self.seen(message_id, now)
+        log.debug(f"Loaded {len(self)} processed message ids from {path}.")
+
+    def save(self, path: str) -> None:
+        """
+        Write the remembered ids atomically.
+        """
+        with self._lock:
+            ids = [str(message_id) for _, message_id in self._order]
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".messages-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(ids, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
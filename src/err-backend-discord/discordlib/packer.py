@@ -0,0 +1,97 @@
+from typing import Iterator, List, Optional
+
+FENCE = "```"
+# Room kept at the end of a chunk to close an open code block.
+CLOSING = "\n" + FENCE
+MIN_LIMIT = 16
+
+
+def _fence_after(line: str, fence: Optional[str]) -> Optional[str]:
+    """
+    Return the code block opening line in effect after `line`, None outside code blocks.
+    """
+    stripped = line.strip()
+    if stripped.startswith(FENCE) and stripped.count(FENCE) == 1:
+        return stripped if fence is None else None
+    return fence
+
+
+def pack_message(body: str, limit: int = 2000) -> Iterator[str]:
+    """
+    Split a markdown message body into as few chunks of at most `limit` characters as
+    possible.
+
+    Chunks are filled greedily with whole lines.  A code block spanning two chunks is
+    closed at the end of the first chunk and re-opened, with its language, at the start
+    of the next one.  Only lines longer than a chunk are cut.  The body is scanned once,
+    so packing is linear in its length.
+
+    :param body: message text.
+    :param limit: maximum size of a chunk.
+    :return: iterator of chunks.
+    """
+    if limit < MIN_LIMIT:
+        raise ValueError(f"Chunk size limit must be at least {MIN_LIMIT}, got {limit}.")
+
+    if len(body) <= limit:
+        if body:
+            yield body
+        return
+
+    parts: List[str] = []
+    size = 0
+    # Size of the re-opened code block at the start of the current chunk.
+    prefix = 0
+    fence = None
+
+    def reserve(block):
+        return 0 if block is None else len(CLOSING)
+
+    def flush() -> str:
+        nonlocal parts, size, prefix
+        chunk = "".join(parts).rstrip("\n")
+        if fence is not None:
+            chunk += CLOSING
+            # Fall back to a plain fence if the language would leave little room for content.
+            opener = (fence if len(fence) < limit // 4 else FENCE) + "\n"
+            parts, size, prefix = [opener], len(opener), len(opener)
+        else:
+            parts, size, prefix = [], 0, 0
+        return chunk
+
+    for line in body.splitlines(keepends=True):
+        after = _fence_after(line, fence)
+
+        if size + len(line) + reserve(after) > limit and size > prefix:
+            chunk = flush()
+            if chunk.strip():
+                yield chunk
+
+        if size + len(line) + reserve(after) <= limit:
+            parts.append(line)
+            size += len(line)
+            fence = after
+            continue
+
+        # The line doesn't fit in a chunk on its own, cut it.  The rest of the line is
+        # tracked by an offset so a long line isn't copied on every cut.
+        start = 0
+        while size + len(line) - start + reserve(fence) > limit:
+            space = limit - size - reserve(fence)
+            parts.append(line[start : start + space])
+            size += space
+            start += space
+            chunk = flush()
+            if chunk.strip():
+                yield chunk
+        parts.append(line[start:])
+        size += len(line) - start
+        fence = after
+
+    if size > prefix:
+        chunk = "".join(parts).rstrip("\n")
+        if fence is not None:
+            # Unterminated code block, close it to keep the chunk well formed.
+            chunk += CLOSING
+        if chunk.strip():
+            yield chunk
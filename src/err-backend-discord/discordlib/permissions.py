@@ -0,0 +1,138 @@
+import logging
+import sys
+import time
+from typing import Dict, NamedTuple, Optional
+
+log = logging.getLogger(__name__)
+
+try:
+    import discord
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+# Discord error code of messages sent to users who don't accept DMs from the bot.
+CANNOT_SEND_TO_USER = 50007
+
+
+class SendForbidden(RuntimeError):
+    """
+    A message can't be sent to its destination, the send wasn't attempted.
+    """
+
+
+class _ChannelEntry(NamedTuple):
+    guild_id: Optional[int]
+    permissions: discord.Permissions
+    # Monotonic time the entry expires at, None for entries invalidated by events only.
+    expires: Optional[float]
+
+
+class PermissionCache:
+    """
+    Check sends against the bot's permissions before they reach the API.
+
+    The permissions of the bot in a channel are computed from its roles and the
+    channel's overwrites on the first send, then cached until a channel, role or bot
+    member event invalidates the guild.  Destinations the API refused to deliver to are
+    cached as unsendable for `negative_ttl` seconds, users with closed DMs included, so
+    repeated sends to them fail locally instead of costing a round trip each.
+    """
+
+    def __init__(self, negative_ttl: float = 600):
+        """
+        :param negative_ttl: seconds a destination refused by the API is considered
+                             unsendable, unless an event invalidates it first.
+        """
+        self.negative_ttl = negative_ttl
+        self._channels: Dict[int, _ChannelEntry] = {}
+        # user id -> monotonic time the closed DM entry expires at.
+        self._closed_dms: Dict[int, float] = {}
+
+    def __len__(self):
+        return len(self._channels) + len(self._closed_dms)
+
+    def _permissions(self, channel) -> Optional[discord.Permissions]:
+        entry = self._channels.get(channel.id)
+        if entry is not None:
+            if entry.expires is None or entry.expires > time.monotonic():
+                return entry.permissions
+            del self._channels[channel.id]
+
+        me = channel.guild.me
+        if me is None:
+            return None
+        permissions = channel.permissions_for(me)
+        # A timeout ends without an event, the permissions are computed on every send.
+        if not me.is_timed_out():
+            self._channels[channel.id] = _ChannelEntry(channel.guild.id, permissions, None)
+        return permissions
+
+    def check_channel(self, channel, embeds: bool = False, files: bool = False) -> None:
+        """
+        Raise SendForbidden if the bot isn't allowed to send the message to a channel.
+        Partial channels and private channels aren't checked.
+        """
+        if not isinstance(channel, (discord.abc.GuildChannel, discord.Thread)):
+            return
+        permissions = self._permissions(channel)
+        if permissions is None:
+            return
+
+        if isinstance(channel, discord.Thread):
+            missing = not permissions.send_messages_in_threads
+        else:
+            missing = not permissions.send_messages
+        if missing or not permissions.read_messages:
+            raise SendForbidden(f"Missing permission to send messages to channel {channel.id}.")
+        if embeds and not permissions.embed_links:
+            raise SendForbidden(f"Missing permission to send embeds to channel {channel.id}.")
+        if files and not permissions.attach_files:
+            raise SendForbidden(f"Missing permission to attach files to channel {channel.id}.")
+
+    def check_user(self, user_id: int) -> None:
+        """
+        Raise SendForbidden if the user recently refused a DM from the bot.
+        """
+        expires = self._closed_dms.get(user_id)
+        if expires is None:
+            return
+        if expires > time.monotonic():
+            raise SendForbidden(f"User {user_id} doesn't accept direct messages.")
+        del self._closed_dms[user_id]
+
+    def channel_refused(self, channel, error: discord.Forbidden) -> None:
+        """
+        Record a channel the API refused a message to.
+        """
+        guild = getattr(channel, "guild", None)
+        self._channels[channel.id] = _ChannelEntry(
+            None if guild is None else guild.id,
+            discord.Permissions.none(),
+            time.monotonic() + self.negative_ttl,
+        )
+        log.debug(f"Channel {channel.id} refused a message ({error.code}), caching it.")
+
+    def user_refused(self, user_id: int, error: discord.Forbidden) -> None:
+        """
+        Record a user the API refused a DM to.
+        """
+        if error.code != CANNOT_SEND_TO_USER:
+            return
+        self._closed_dms[user_id] = time.monotonic() + self.negative_ttl
+        log.debug(f"User {user_id} doesn't accept direct messages, caching it.")
+
+    def forget_guild(self, guild_id: int) -> None:
+        """
+        Invalidate the permissions of the channels of a guild.
+        """
+        self._channels = {
+            channel_id: entry
+            for channel_id, entry in self._channels.items()
+            if entry.guild_id != guild_id
+        }
+
+    def clear(self) -> None:
+        self._channels.clear()
+        self._closed_dms.clear()
@@ -1,15 +1,19 @@
 import logging
 import re
 import sys
+import weakref
 from abc import ABC, abstractmethod
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 
 from errbot.backends.base import Person
 
+from discordlib.acl import AclIdentity
+from discordlib.bridge import DEFAULT, LoopBridge
+
 log = logging.getLogger(__name__)
 
-# Discord uses 18 or more digits for user, channel and server (guild) ids.
-RE_DISCORD_ID = re.compile(r"^[0-9]{18}")
+# Discord uses 17 or more digits for user, channel and server (guild) ids.
+RE_DISCORD_ID = re.compile(r"^[0-9]{17,}")
 
 try:
     import discord
@@ -21,14 +25,78 @@ except ImportError:
 
 class DiscordSender(ABC, discord.abc.Snowflake):
     """
-    DiscordSender's client property is used to share a single discord instance
-    with all classes.  It is populated when the backend is initialised.
+    Identifiers are bound to the discord client of the bot they belong to, so several
+    bots can run in the same process.  DiscordSender's client property is the default
+    client for identifiers built without one.  It is populated when the backend is
+    initialised, along with the identity snapshot used to resolve identities missing
+    from the client caches.
+
+    send is a coroutine, plugins running on the discord event loop can await it directly.
     """
 
     client = None
+    identities = None
+    # discord client -> identity snapshot of the bot using it.
+    _client_identities = weakref.WeakKeyDictionary()
+    # discord client -> permission cache checking the sends of the bot using it.
+    _client_permissions = weakref.WeakKeyDictionary()
+    # discord client -> circuit breaker of the destinations of the bot using it.
+    _client_breakers = weakref.WeakKeyDictionary()
+    # discord client -> loop bridge running the blocking operations of the bot using it.
+    _client_bridges = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def register_client(
+        client: discord.Client, identities=None, permissions=None, breaker=None, bridge=None
+    ) -> None:
+        """
+        Make a bot's identity snapshot, permission cache, circuit breaker and loop bridge
+        available to the identifiers bound to its client.
+        """
+        DiscordSender._client_identities[client] = identities
+        DiscordSender._client_permissions[client] = permissions
+        DiscordSender._client_breakers[client] = breaker
+        DiscordSender._client_bridges[client] = bridge
+
+    def _bind(self, client: Optional[discord.Client]) -> None:
+        """
+        Bind the identifier to a discord client, the class default client if None.
+        """
+        self._client = type(self).client if client is None else client
+        try:
+            self._identities = DiscordSender._client_identities.get(
+                self._client, DiscordSender.identities
+            )
+            self._permissions = DiscordSender._client_permissions.get(self._client)
+            self._breaker = DiscordSender._client_breakers.get(self._client)
+            self._bridge = DiscordSender._client_bridges.get(self._client)
+        except TypeError:
+            # The default client hasn't been set.
+            self._identities = DiscordSender.identities
+            self._permissions = None
+            self._breaker = None
+            self._bridge = None
+
+    def _run(self, coro, timeout=DEFAULT):
+        """
+        Run a coroutine on the client event loop and wait for its result.
+
+        :param timeout: seconds to wait, defaults to the bot's `send_timeout`.
+        """
+        bridge = self._bridge
+        if bridge is None:
+            # Client without a bot, e.g. set by a plugin: the default timeout applies.
+            bridge = LoopBridge(self._client)
+        return bridge.run(coro, timeout=timeout)
 
     @abstractmethod
-    async def send(self, content: str = None, embed: discord.Embed = None):
+    async def send(
+        self,
+        content: str = None,
+        embed: discord.Embed = None,
+        embeds: List[discord.Embed] = None,
+        file: discord.File = None,
+    ):
         raise NotImplementedError
 
     @abstractmethod
@@ -37,21 +105,41 @@ class DiscordSender(ABC, discord.abc.Snowflake):
 
 
 class DiscordPerson(Person, DiscordSender):
+    # name#discriminator, computed once the discord user is known.
+    _fullname = None
+
     @classmethod
-    def resolve_username(cls, username: str, discriminator: str) -> str:
-        for m in DiscordPerson.client.get_all_members():
+    def resolve_username(
+        cls, username: str, discriminator: str, client: discord.Client = None
+    ) -> Optional[discord.Member]:
+        client = cls.client if client is None else client
+        for m in client.get_all_members():
             if m.name == username:
                 # Discord dropped discriminators for user accounts but kept them for bot accounts.
                 if m.discriminator in ["0", discriminator]:
                     return m
         return None
 
-    def __init__(self, user_id: str = None, username: str = None, discriminator: str = "0"):
+    def __init__(
+        self,
+        user_id: str = None,
+        username: str = None,
+        discriminator: str = "0",
+        client: discord.Client = None,
+        user: discord.abc.Snowflake = None,
+    ):
         """
         @user_id: _must_ be a string representation of a Discord Snowflake (an integer).
         @username: Discord username.
         @discriminator: Discord discriminator to uniquely identify the username. (default to 0 since discord dropped them for username)
+        @client: discord client of the bot the person is seen by, defaults to the class client.
+        @user: user, or bare snowflake, received in a gateway event.  The person is built from it without looking it up in the client caches.
         """
+        self._bind(client)
+        if user is not None:
+            self._user_id = user.id
+            self._discord_user = user if isinstance(user, discord.abc.User) else None
+            return
         if user_id:
             if not re.match(RE_DISCORD_ID, str(user_id)):
                 raise ValueError(f"Invalid Discord user id {type(user_id)} {user_id}.")
@@ -59,7 +147,12 @@ class DiscordPerson(Person, DiscordSender):
             self._user_id = int(user_id)
         else:
             if username and discriminator:
-                member = DiscordPerson.resolve_username(username, discriminator)
+                member = None
+                if self._identities is not None:
+                    user_id = self._identities.user_id(self._client, username, discriminator)
+                    member = None if user_id is None else discord.Object(user_id)
+                if member is None:
+                    member = DiscordPerson.resolve_username(username, discriminator, self._client)
                 if member is None:
                     raise LookupError(
                         "The user {}#{} can't be found.  If you're certain the username "
@@ -74,12 +167,66 @@ class DiscordPerson(Person, DiscordSender):
             else:
                 raise ValueError("Username/discrimator pair or user id not provided.")
 
-        self.discord_user = DiscordPerson.client.get_user(self._user_id)
-        if self.discord_user is None:
+        self._discord_user = self._client.get_user(self._user_id)
+        if self._discord_user is None and self._snapshot_name() is None:
             raise ValueError(f"Failed to get the user {self._user_id}")
 
+    def _snapshot_name(self) -> Optional[Tuple[str, str]]:
+        if self._identities is None:
+            return None
+        return self._identities.user_name(self._user_id)
+
+    def _names(self) -> Tuple[str, str]:
+        user = self.discord_user
+        if user is not None:
+            return user.name, user.discriminator
+        return self._snapshot_name() or (str(self._user_id), "0")
+
+    @property
+    def discord_user(self) -> Optional[discord.User]:
+        """
+        The discord user, None if it is only known from the identity snapshot so far.
+        """
+        if self._discord_user is None:
+            self._discord_user = self._client.get_user(self._user_id)
+        return self._discord_user
+
+    def _known_dm_channel(self) -> Optional[discord.PartialMessageable]:
+        """
+        The DM channel known from the snapshot, it doesn't need to be opened again.
+        """
+        if self._identities is None:
+            return None
+        channel_id = self._identities.dm_channel_id(self._user_id)
+        if channel_id is None:
+            return None
+        return self._client.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+
     def get_discord_object(self) -> discord.abc.Messageable:
-        return self.discord_user
+        user = self.discord_user
+        if user is not None and user.dm_channel is not None:
+            return user
+        return self._known_dm_channel() or user
+
+    async def dm_channel(self, create: bool = True) -> Optional[discord.abc.Messageable]:
+        """
+        The DM channel with the person.  If it isn't known it is opened with a single
+        request, without fetching the user, and recorded in the identity snapshot.
+
+        :param create: open the DM channel if it isn't known, otherwise return None.
+        """
+        user = self.discord_user
+        if user is not None and user.dm_channel is not None:
+            return user.dm_channel
+        channel = self._known_dm_channel()
+        if channel is not None or not create:
+            return channel
+
+        data = await self._client.http.start_private_message(self._user_id)
+        channel = self._client._connection.add_dm_channel(data)
+        if self._identities is not None:
+            self._identities.add_dm_channel(self._user_id, channel.id)
+        return channel
 
     @property
     def created_at(self):
@@ -100,7 +247,7 @@ class DiscordPerson(Person, DiscordSender):
     @property
     def username(self) -> str:
         """Return the user name"""
-        return self.discord_user.name
+        return self._names()[0]
 
     nick = username
 
@@ -110,17 +257,39 @@ class DiscordPerson(Person, DiscordSender):
 
     @property
     def fullname(self) -> str:
-        return f"{self.discord_user.name}#{self.discord_user.discriminator}"
+        if self._fullname is not None:
+            return self._fullname
+        fullname = "{}#{}".format(*self._names())
+        if self.discord_user is not None:
+            self._fullname = fullname
+        return fullname
 
     @property
     def aclattr(self) -> str:
         return self.fullname
 
+    def acl_identity(self, guild_id: int = None) -> AclIdentity:
+        """
+        The attributes ACLs are matched against: id, name and role ids of the person in
+        a guild, or in all the guilds shared with the bot if None.
+        """
+        user = self.discord_user
+        if isinstance(user, discord.Member) and user.guild.id == guild_id:
+            members = [user]
+        else:
+            guilds = self._client.guilds if guild_id is None else [self._client.get_guild(guild_id)]
+            members = [guild.get_member(self._user_id) for guild in guilds if guild is not None]
+        role_ids = frozenset(
+            role.id for member in members if member is not None for role in member.roles
+        )
+        return AclIdentity(self._user_id, self.aclattr, role_ids)
+
     async def send(
         self,
         content: str = None,
         tts: bool = False,
         embed: discord.Embed = None,
+        embeds: List[discord.Embed] = None,
         file: discord.File = None,
         files: List[discord.File] = None,
         delete_after: float = None,
@@ -129,18 +298,34 @@ class DiscordPerson(Person, DiscordSender):
         reference: Union[discord.Message, discord.MessageReference] = None,
         mention_author: Optional[bool] = None,
     ):
-        await self.discord_user.send(
-            content=content,
-            tts=tts,
-            embed=embed,
-            file=file,
-            files=files,
-            delete_after=delete_after,
-            nonce=nonce,
-            allowed_mentions=allowed_mentions,
-            reference=reference,
-            mention_author=mention_author,
-        )
+        if self._breaker is not None:
+            self._breaker.check(self._user_id)
+        if self._permissions is not None:
+            self._permissions.check_user(self._user_id)
+        try:
+            messageable = await self.dm_channel()
+            message = await messageable.send(
+                content=content,
+                tts=tts,
+                embed=embed,
+                embeds=embeds,
+                file=file,
+                files=files,
+                delete_after=delete_after,
+                nonce=nonce,
+                allowed_mentions=allowed_mentions,
+                reference=reference,
+                mention_author=mention_author,
+            )
+        except (discord.Forbidden, discord.NotFound) as e:
+            if self._breaker is not None:
+                self._breaker.failure(self._user_id)
+            if self._permissions is not None and isinstance(e, discord.Forbidden):
+                self._permissions.user_refused(self._user_id, e)
+            raise
+        if self._breaker is not None:
+            self._breaker.success(self._user_id)
+        return message
 
     def __eq__(self, other):
         return isinstance(other, DiscordPerson) and other.aclattr == self.aclattr
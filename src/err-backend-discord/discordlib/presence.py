@@ -0,0 +1,116 @@
+import asyncio
+import collections
+import logging
+import sys
+from typing import Optional, Tuple
+
+from errbot.backends.base import AWAY, DND, OFFLINE, ONLINE
+
+log = logging.getLogger(__name__)
+
+try:
+    import discord
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+STATUSES = {
+    ONLINE: discord.Status.online,
+    AWAY: discord.Status.idle,
+    DND: discord.Status.dnd,
+    OFFLINE: discord.Status.offline,
+}
+
+
+class PresenceScheduler:
+    """
+    Coalesce presence updates and send them within the gateway rate limit.
+
+    Only the latest requested status and activity is kept.  It is sent immediately if
+    the rate limit allows it, otherwise when the oldest update leaves the rate limit
+    window.  Requests that don't change the current presence are dropped.  All methods
+    must be called from the discord client event loop.
+    """
+
+    def __init__(self, client: discord.Client, rate: int = 5, per: float = 60.0):
+        """
+        :param client: discord client used to change the presence.
+        :param rate: maximum number of presence updates sent in `per` seconds.
+        :param per: length of the rate limit window in seconds.
+        """
+        if rate < 1:
+            raise ValueError(f"The presence update rate must be at least 1, got {rate}.")
+        self.client = client
+        self.rate = rate
+        self.per = per
+        self._sent = collections.deque(maxlen=rate)
+        self._desired: Optional[Tuple[discord.Status, Optional[discord.BaseActivity]]] = None
+        self._applied = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(presence) -> tuple:
+        status, activity = presence
+        return status, None if activity is None else activity.to_dict()
+
+    def request(self, status: discord.Status, activity: discord.BaseActivity = None) -> None:
+        """
+        Set the desired presence, it replaces any update that hasn't been sent yet.
+        """
+        self._desired = (status, activity)
+        self._schedule()
+
+    def delay(self) -> float:
+        """
+        Seconds until another presence update can be sent.
+        """
+        if len(self._sent) < self.rate:
+            return 0.0
+        loop = asyncio.get_running_loop()
+        return max(0.0, self._sent[0] + self.per - loop.time())
+
+    def _schedule(self) -> None:
+        if self._handle is not None or self._task is not None:
+            # A flush is already pending, it will pick up the latest request.
+            return
+        loop = asyncio.get_running_loop()
+        self._handle = loop.call_later(self.delay(), self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._handle = None
+        self._task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self) -> None:
+        try:
+            desired = self._desired
+            if desired is None or (
+                self._applied is not None and self._key(desired) == self._key(self._applied)
+            ):
+                return
+
+            status, activity = desired
+            log.debug(f"Changing presence to {status} with activity {activity}.")
+            self._sent.append(asyncio.get_running_loop().time())
+            await self.client.change_presence(status=status, activity=activity)
+            self._applied = desired
+            # Identify with the same presence if the gateway connection is re-established.
+            self.client.status = status
+            self.client.activity = activity
+        except Exception as e:
+            log.error(f"Failed to change presence: {e}")
+        finally:
+            self._task = None
+
+        if self._desired is not desired:
+            self._schedule()
+
+    def cancel(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._applied = None
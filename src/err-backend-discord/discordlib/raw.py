@@ -0,0 +1,38 @@
+import logging
+import sys
+from typing import Dict
+
+log = logging.getLogger(__name__)
+
+try:
+    import discord
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+# Gateway events discord.py only dispatches for cached members -> raw event name.
+RAW_EVENTS = {
+    "GUILD_MEMBER_UPDATE": "raw_member_update",
+    "PRESENCE_UPDATE": "raw_presence_update",
+}
+
+
+def dispatch_raw_events(client: discord.Client, events: Dict[str, str] = None) -> None:
+    """
+    Dispatch the payload of gateway events as raw events, e.g. `on_raw_member_update`,
+    after discord.py parsed them.  discord.py drops member and presence updates of
+    members missing from its cache, the raw events are dispatched for every member so
+    the member cache can be disabled.
+
+    :param client: discord client whose gateway events are dispatched.
+    :param events: gateway event name -> raw event name, defaults to RAW_EVENTS.
+    """
+    parsers = client._connection.parsers
+    for event, name in (events or RAW_EVENTS).items():
+
+        def parse(data, parse=parsers[event], name=name):
+            parse(data)
+            client.dispatch(name, data)
+
+        parsers[event] = parse
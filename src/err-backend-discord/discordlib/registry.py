@@ -0,0 +1,105 @@
+import logging
+import sys
+from typing import Dict, Optional, Tuple
+
+from discordlib.room import DiscordRoom
+
+log = logging.getLogger(__name__)
+
+try:
+    import discord
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+
+class RoomRegistry:
+    """
+    Incrementally maintained collection of the rooms visible to the bot.
+
+    The registry is populated once when the client becomes ready and is then kept
+    current by the guild channel create, update and delete events.  Filtered views
+    are computed on first request and cached until the next change, so repeated calls
+    to `rooms()` don't rescan every channel of every guild.
+    """
+
+    def __init__(self, client: discord.Client = None):
+        """
+        :param client: discord client of the bot the rooms are bound to, defaults to the
+                       class client of DiscordRoom.
+        """
+        self.client = client
+        # channel_id -> (guild_id, channel_type, room)
+        self._rooms: Dict[int, Tuple[int, discord.ChannelType, DiscordRoom]] = {}
+        self._views: Dict[Tuple[Optional[int], Optional[discord.ChannelType]], tuple] = {}
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def __contains__(self, channel_id):
+        return int(channel_id) in self._rooms
+
+    def clear(self) -> None:
+        self._rooms.clear()
+        self._views.clear()
+
+    def rebuild(self, channels) -> None:
+        """
+        Replace the registry content with the given channels.
+        """
+        self.clear()
+        for channel in channels:
+            self._add(channel)
+        log.debug(f"Room registry rebuilt with {len(self._rooms)} channels.")
+
+    def add(self, channel) -> None:
+        """
+        Add or replace the room for a guild channel.
+        """
+        self._add(channel)
+        self._views.clear()
+
+    update = add
+
+    def remove(self, channel_id) -> None:
+        if self._rooms.pop(int(channel_id), None) is not None:
+            self._views.clear()
+
+    def remove_guild(self, guild_id) -> None:
+        guild_id = int(guild_id)
+        stale = [cid for cid, (gid, _, _) in self._rooms.items() if gid == guild_id]
+        for channel_id in stale:
+            del self._rooms[channel_id]
+        if stale:
+            self._views.clear()
+
+    def get(self, channel_id) -> Optional[DiscordRoom]:
+        entry = self._rooms.get(int(channel_id))
+        return None if entry is None else entry[2]
+
+    def rooms(self, guild_id=None, channel_type: discord.ChannelType = None) -> tuple:
+        """
+        Return the rooms matching the guild and channel type filters.
+
+        The returned tuple is shared between callers until the registry changes.
+
+        :param guild_id: Only return rooms of this guild.
+        :param channel_type: Only return rooms of this discord.ChannelType.
+        :return: tuple of DiscordRoom
+        """
+        key = (None if guild_id is None else int(guild_id), channel_type)
+        view = self._views.get(key)
+        if view is None:
+            view = tuple(
+                room
+                for gid, ctype, room in self._rooms.values()
+                if (key[0] is None or gid == key[0])
+                and (channel_type is None or ctype == channel_type)
+            )
+            self._views[key] = view
+        return view
+
+    def _add(self, channel) -> None:
+        room = DiscordRoom.from_channel(channel, self.client)
+        self._rooms[channel.id] = (channel.guild.id, channel.type, room)
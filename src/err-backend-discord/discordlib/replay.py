@@ -0,0 +1,143 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Iterable, Iterator, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+try:
+    import discord
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+# Gateway opcode of the events dispatched to the client.
+DISPATCH = 0
+
+
+def read_events(path: str) -> Iterator[Tuple[float, str, dict]]:
+    """
+    Read the (timestamp, event name, data) of the events of a recording.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                timestamp, event, data = json.loads(line)
+            except ValueError:
+                # A bot stopped while writing leaves a truncated last line.
+                log.warning(f"Skipping malformed line {number} of {path}.")
+                continue
+            yield timestamp, event, data
+
+
+class GatewayRecorder:
+    """
+    Append the dispatch events received from the gateway to a file.
+
+    Every event is written as one compact JSON line `[timestamp, event name, data]`.
+    Heartbeats and other control messages are not recorded.  The client must be
+    created with `enable_debug_events=True` for discord.py to hand over the raw gateway
+    messages to `on_socket_raw_receive`.
+    """
+
+    def __init__(self, path: str, events: Optional[Iterable[str]] = None):
+        """
+        :param path: file the events are appended to.
+        :param events: names of the events to record, all of them when None.
+        """
+        self.path = path
+        self.events = None if events is None else frozenset(events)
+        self.recorded = 0
+        self._file = None
+
+    async def on_socket_raw_receive(self, msg: str) -> None:
+        self.record(msg)
+
+    def record(self, msg: str) -> None:
+        try:
+            payload = json.loads(msg)
+        except ValueError:
+            return
+        if payload.get("op") != DISPATCH:
+            return
+        event = payload.get("t")
+        if self.events is not None and event not in self.events:
+            return
+
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(
+            json.dumps([round(time.time(), 3), event, payload.get("d")], separators=(",", ":"))
+        )
+        self._file.write("\n")
+        self.recorded += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class GatewayReplayer:
+    """
+    Feed recorded gateway events to a client as if they were received from the gateway.
+
+    Events go through the client connection state parsers, so the client caches are
+    updated and the registered event handlers are called exactly as for live events.
+    The client must have been set up, for example by entering `async with client:`,
+    but it doesn't need to be connected.
+    """
+
+    def __init__(self, client: discord.Client, speed: float = 1.0, max_delay: float = 5.0):
+        """
+        :param client: discord client receiving the events.
+        :param speed: replay speed factor, 1 for the original pace, 0 for as fast as
+                      possible.
+        :param max_delay: longest wait between two events in seconds, it shortens the
+                          gaps between recording sessions.
+        """
+        if speed < 0:
+            raise ValueError(f"Replay speed must not be negative, got {speed}.")
+        self.client = client
+        self.speed = speed
+        self.max_delay = max_delay
+
+    async def replay(self, events: Iterable[Tuple[float, str, dict]]) -> int:
+        """
+        Replay the events.
+
+        :param events: (timestamp, event name, data) tuples, see `read_events`.
+        :return: number of events replayed.
+        """
+        parsers = self.client._connection.parsers
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        offset = 0.0
+        previous = None
+        count = 0
+
+        for timestamp, event, data in events:
+            parser = parsers.get(event)
+            if parser is None:
+                log.debug(f"Skipping unknown gateway event {event}.")
+                continue
+
+            if self.speed and previous is not None:
+                offset += min(max(0.0, timestamp - previous) / self.speed, self.max_delay)
+            previous = timestamp
+            # Sleep even without delay so the handlers scheduled by the events get to run.
+            await asyncio.sleep(max(0.0, start + offset - loop.time()))
+
+            try:
+                parser(data)
+            except Exception:
+                log.exception(f"Failed to replay gateway event {event}.")
+                continue
+            count += 1
+
+        return count
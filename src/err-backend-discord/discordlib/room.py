@@ -1,9 +1,13 @@
+import asyncio
 import logging
+import re
 import sys
-from typing import List, Optional, Union
+from typing import List, NamedTuple, Optional, Union
 
 from errbot.backends.base import Room, RoomError, RoomOccupant
 
+from discordlib.bridge import DEFAULT
+from discordlib.permissions import SendForbidden
 from discordlib.person import DiscordPerson, DiscordSender
 
 log = logging.getLogger(__name__)
@@ -15,6 +19,25 @@ except ImportError:
     log.fatal("The required discord module could not be found.")
     sys.exit(1)
 
+RE_WHITESPACE = re.compile(r"\s+")
+
+
+def text_channel_name(name: str) -> str:
+    """
+    Name discord gives a text channel created as `name`: lowercase, with whitespace
+    replaced by hyphens.
+    """
+    return RE_WHITESPACE.sub("-", name.strip()).lower()
+
+
+class InviteResult(NamedTuple):
+    """
+    Outcome of inviting a single person to a room.
+    """
+
+    person: DiscordPerson
+    error: Optional[BaseException]
+
 
 class DiscordRoom(Room, DiscordSender):
     """
@@ -25,15 +48,38 @@ class DiscordRoom(Room, DiscordSender):
     """
 
     @classmethod
-    def from_id(cls, channel_id):
-        channel = DiscordRoom.client.get_channel(channel_id)
+    def from_id(cls, channel_id, client: discord.Client = None):
+        client = cls.client if client is None else client
+        channel = client.get_channel(channel_id)
 
         if channel is None:
+            breaker = DiscordSender._client_breakers.get(client)
+            if breaker is not None:
+                if breaker.is_open(channel_id):
+                    # The failure was logged when the circuit opened.
+                    raise ValueError(f"Channel id:{channel_id} is unavailable.")
+                breaker.failure(channel_id)
             raise ValueError(f"Channel id:{channel_id} doesn't exist!")
 
-        return cls(channel.name, channel.guild.id, channel.id)
+        return cls(channel.name, channel.guild.id, channel.id, client=client)
 
-    def __init__(self, channel_name: str = None, guild_id: str = None, channel_id: str = None):
+    @classmethod
+    def from_channel(cls, channel: discord.abc.GuildChannel, client: discord.Client = None):
+        """
+        Build the room of a channel the API just returned, it may not be in the client
+        cache until its gateway event is received.
+        """
+        room = cls(channel.name, channel.guild.id, channel.id, client=client)
+        room.discord_channel = channel
+        return room
+
+    def __init__(
+        self,
+        channel_name: str = None,
+        guild_id: str = None,
+        channel_id: str = None,
+        client: discord.Client = None,
+    ):
         """
         Allows to specify an existing room (via name + guild or via id) or allows the
         creation of a future room by specifying a name and guild to create the channel in.
@@ -41,24 +87,42 @@ class DiscordRoom(Room, DiscordSender):
         :param channel_name:
         :param guild_id:
         :param channel_id:
+        :param client: discord client of the bot the room is seen by, defaults to the
+                       class client.
         """
+        self._bind(client)
         self.discord_channel = None
+        self._channel_id = None
+        self._channel_name = channel_name
+        self._guild_id = int(guild_id) if guild_id else None
         if channel_id:
             self._channel_id = int(channel_id)
-            self.discord_channel = DiscordRoom.client.get_channel(self._channel_id)
+            self.discord_channel = self._client.get_channel(self._channel_id)
+            if self.discord_channel is not None and self._guild_id is None:
+                guild = getattr(self.discord_channel, "guild", None)
+                self._guild_id = None if guild is None else guild.id
         elif guild_id and channel_name:
-            guild = DiscordRoom.client.get_guild(int(guild_id))
+            guild = self._client.get_guild(self._guild_id)
             if guild:
                 channel = [channel for channel in guild.channels if channel_name == channel.name]
                 if len(channel) == 0:
-                    ValueError(f"Failed to find channel {channel_name} in guild {guild.name}")
+                    # The room doesn't exist yet, it can be created later on.
+                    log.debug(f"Failed to find channel {channel_name} in guild {guild.name}")
+                    return
                 if len(channel) > 1:
-                    ValueError(
+                    log.warning(
                         f"More than one channel matched {channel_name} in guild {guild.name}"
                     )
                 self.discord_channel = channel[0]
+                self._channel_id = self.discord_channel.id
             else:
-                raise ValueError(f"Failed to get guild id {guild_id}")
+                # The guild may not have been received from the gateway yet.
+                if self._identities is not None:
+                    self._channel_id = self._identities.channel_id(
+                        self._client, channel_name, self._guild_id
+                    )
+                if self._channel_id is None:
+                    raise ValueError(f"Failed to get guild id {guild_id}")
         else:
             raise ValueError("A channel id or channel name + guild id is required for a Room.")
 
@@ -74,7 +138,7 @@ class DiscordRoom(Room, DiscordSender):
         """
         matching = [
             channel
-            for channel in DiscordRoom.client.get_all_channels()
+            for channel in self._client.get_all_channels()
             if self._channel_name == channel.name
             and channel.guild.id == self._guild_id
             and isinstance(channel, discord.TextChannel)
@@ -95,7 +159,15 @@ class DiscordRoom(Room, DiscordSender):
     def created_at(self):
         return discord.utils.snowflake_time(self.id)
 
-    def invite(self, *args) -> None:
+    def invite(self, *args, timeout=DEFAULT) -> List[InviteResult]:
+        """
+        Give people access to the channel, their permission overwrites are applied
+        concurrently.  A failure to invite one person doesn't affect the others.
+
+        :param timeout: seconds to wait for all the invitations, defaults to the
+                        `send_timeout` setting.
+        :return: an InviteResult per person, in the order of the arguments.
+        """
         if not self.exists:
             raise RuntimeError("Can't invite to a non-existent channel")
 
@@ -103,10 +175,38 @@ class DiscordRoom(Room, DiscordSender):
             if not isinstance(identifier, DiscordPerson):
                 raise RuntimeError("Can't invite non Discord Users")
 
-            asyncio.run_coroutine_threadsafe(
-                self.discord_channel.set_permissions(identifier.discord_user(), read_messages=True),
-                loop=DiscordRoom.client.loop,
-            )
+        return self._run(self.invite_async(*args), timeout)
+
+    async def invite_async(self, *people: DiscordPerson) -> List[InviteResult]:
+        """
+        Awaitable counterpart of invite for plugins running on the discord event loop.
+        """
+        channel = self.discord_channel or self._client.get_channel(self._channel_id)
+        if channel is None:
+            raise RuntimeError("Can't invite to a non-existent channel")
+
+        async def invite_one(person):
+            try:
+                await self._allow(channel, person)
+            except Exception as e:
+                log.warning(f"Failed to invite {person} to {self}: {e}")
+                return InviteResult(person, e)
+            return InviteResult(person, None)
+
+        return await asyncio.gather(*(invite_one(person) for person in people))
+
+    async def _allow(self, channel, person: DiscordPerson) -> None:
+        overwrite = channel.overwrites_for(discord.Object(person.id))
+        overwrite.update(read_messages=True)
+        user = person.discord_user
+        if user is not None:
+            await channel.set_permissions(user, overwrite=overwrite)
+            return
+        # discord.py only accepts cached users, e.g. not without the member cache.
+        allow, deny = overwrite.pair()
+        await self._client.http.edit_channel_permissions(
+            channel.id, person.id, str(allow.value), str(deny.value), discord.abc._Overwrites.MEMBER
+        )
 
     @property
     def joined(self) -> bool:
@@ -122,32 +222,39 @@ class DiscordRoom(Room, DiscordSender):
         log.error("Not implemented")
 
     async def create_room(self):
-        guild = DiscordRoom.client.get_guild(self._guild_id)
+        guild = self._client.get_guild(self._guild_id)
 
         channel = await guild.create_text_channel(self._channel_name)
 
         log.info(f"Created channel {self._channel_name} in guild {guild.name}")
 
         self._channel_id = channel.id
+        self.discord_channel = channel
 
-    def create(self) -> None:
+    def create(self, timeout=DEFAULT) -> None:
+        """
+        :param timeout: seconds to wait for the channel, defaults to the `send_timeout`
+                        setting.
+        """
         if self.exists:
             log.warning(f"Tried to create {self._channel_name} which already exists.")
             raise RoomError("Room exists")
 
-        asyncio.run_coroutine_threadsafe(self.create_room(), loop=DiscordRoom.client.loop).result(
-            timeout=5
-        )
+        self._run(self.create_room(), timeout)
+
+    async def destroy_room(self):
+        await self.discord_channel.delete(reason="Bot deletion command")
 
-    def destroy(self) -> None:
+    def destroy(self, timeout=DEFAULT) -> None:
+        """
+        :param timeout: seconds to wait for the deletion, defaults to the `send_timeout`
+                        setting.
+        """
         if not self.exists:
             log.warning(f"Tried to destroy {self._channel_name} which doesn't exist.")
             raise RoomError("Room doesn't exist")
 
-        asyncio.run_coroutine_threadsafe(
-            self.discord_channel.delete(reason="Bot deletion command"),
-            loop=DiscordRoom.client.loop,
-        ).result(timeout=5)
+        self._run(self.destroy_room(), timeout)
 
     def join(self, username: str = None, password: str = None) -> None:
         """
@@ -179,7 +286,7 @@ class DiscordRoom(Room, DiscordSender):
 
         occupants = []
         for member in self.discord_channel.members:
-            occupants.append(DiscordRoomOccupant(member.id, self._channel_id))
+            occupants.append(DiscordRoomOccupant(member.id, self._channel_id, self._client))
 
         return occupants
 
@@ -187,7 +294,7 @@ class DiscordRoom(Room, DiscordSender):
     def exists(self) -> bool:
         return None not in [
             self._channel_id,
-            DiscordRoom.client.get_channel(self._channel_id),
+            self._client.get_channel(self._channel_id),
         ]
 
     @property
@@ -205,11 +312,10 @@ class DiscordRoom(Room, DiscordSender):
 
         :return: channels' name
         """
-        if self._channel_id is None:
-            return self._channel_name
-        else:
-            self._channel_name = DiscordRoom.client.get_channel(self._channel_id).name
-            return self._channel_name
+        channel = None if self._channel_id is None else self._client.get_channel(self._channel_id)
+        if channel is not None:
+            self._channel_name = channel.name
+        return self._channel_name
 
     @property
     def id(self):
@@ -219,15 +325,56 @@ class DiscordRoom(Room, DiscordSender):
         """
         return self._channel_id
 
-    async def send(self, content: str = None, embed: discord.Embed = None):
+    async def send(
+        self,
+        content: str = None,
+        embed: discord.Embed = None,
+        embeds: List[discord.Embed] = None,
+        file: discord.File = None,
+    ):
+        if self._breaker is None:
+            return await self._send(content=content, embed=embed, embeds=embeds, file=file)
+
+        self._breaker.check(self._channel_id)
+        try:
+            message = await self._send(content=content, embed=embed, embeds=embeds, file=file)
+        except (discord.Forbidden, discord.NotFound, RuntimeError) as e:
+            if not isinstance(e, SendForbidden):
+                self._breaker.failure(self._channel_id)
+            raise
+        self._breaker.success(self._channel_id)
+        return message
+
+    async def _send(
+        self,
+        content: str = None,
+        embed: discord.Embed = None,
+        embeds: List[discord.Embed] = None,
+        file: discord.File = None,
+    ):
+        channel = self.discord_channel or self._client.get_channel(self._channel_id)
         if not self.exists:
-            raise RuntimeError("Can't send a message on a non-existent channel")
-        if not isinstance(self.discord_channel, discord.abc.Messageable):
+            if self._channel_id is None or self._client.is_ready():
+                raise RuntimeError("Can't send a message on a non-existent channel")
+            # The channel is known from the identity snapshot but not received yet.
+            channel = self._client.get_partial_messageable(
+                self._channel_id, guild_id=self._guild_id
+            )
+        if not isinstance(channel, discord.abc.Messageable):
             raise RuntimeError(
                 f"Channel {self.name}[id:{self._channel_id}] doesn't support sending text messages"
             )
 
-        await self.discord_channel.send(content=content, embed=embed)
+        if self._permissions is not None:
+            self._permissions.check_channel(
+                channel, embeds=bool(embed or embeds), files=file is not None
+            )
+        try:
+            return await channel.send(content=content, embed=embed, embeds=embeds, file=file)
+        except discord.Forbidden as e:
+            if self._permissions is not None:
+                self._permissions.channel_refused(channel, e)
+            raise
 
     def __str__(self):
         return f"<#{self.id}>"
@@ -240,17 +387,29 @@ class DiscordRoom(Room, DiscordSender):
 
 
 class DiscordRoomOccupant(DiscordPerson, RoomOccupant):
-    def __init__(self, user_id: str, channel_id: str):
-        super().__init__(user_id)
+    def __init__(
+        self,
+        user_id: str,
+        channel_id: str,
+        client: discord.Client = None,
+        user: discord.abc.Snowflake = None,
+    ):
+        super().__init__(user_id, client=client, user=user)
 
-        self._channel = DiscordRoom.from_id(channel_id)
+        self._channel = DiscordRoom.from_id(channel_id, self._client)
 
     @property
     def room(self) -> DiscordRoom:
         return self._channel
 
-    async def send(self, content: str = None, embed: discord.Embed = None):
-        await self.room.send(content=content, embed=embed)
+    async def send(
+        self,
+        content: str = None,
+        embed: discord.Embed = None,
+        embeds: List[discord.Embed] = None,
+        file: discord.File = None,
+    ):
+        return await self.room.send(content=content, embed=embed, embeds=embeds, file=file)
 
     def __eq__(self, other):
         return (
@@ -273,7 +432,7 @@ class DiscordCategory(DiscordRoom):
         """
         matching = [
             channel
-            for channel in DiscordCategory.client.get_all_channels()
+            for channel in self._client.get_all_channels()
             if self._channel_name == channel.name
             and channel.guild.id == self._guild_id
             and isinstance(channel, discord.CategoryChannel)
@@ -290,26 +449,39 @@ class DiscordCategory(DiscordRoom):
 
         return matching[0].id
 
-    def create_subchannel(self, name: str) -> DiscordRoom:
+    def create_subchannel(self, name: str, timeout=DEFAULT) -> DiscordRoom:
+        """
+        :param timeout: seconds to wait for the channel, defaults to the `send_timeout`
+                        setting.
+        """
+        if not isinstance(self.get_discord_object(), discord.CategoryChannel):
+            raise RuntimeError("Category is not a discord category object")
+
+        return self._run(self.create_subchannel_async(name), timeout)
+
+    async def create_subchannel_async(self, name: str) -> DiscordRoom:
+        """
+        Awaitable counterpart of create_subchannel for plugins running on the discord
+        event loop.
+        """
         category = self.get_discord_object()
 
         if not isinstance(category, discord.CategoryChannel):
             raise RuntimeError("Category is not a discord category object")
 
-        text_channel = asyncio.run_coroutine_threadsafe(
-            category.create_text_channel(name), loop=DiscordCategory.client.loop
-        ).result(timeout=5)
+        text_channel = await category.create_text_channel(name)
 
-        return DiscordRoom.from_id(text_channel.id)
+        return DiscordRoom.from_channel(text_channel, self._client)
 
     async def create_room(self):
-        guild = DiscordCategory.client.get_guild(self._guild_id)
+        guild = self._client.get_guild(self._guild_id)
 
         channel = await guild.create_category(self._channel_name)
 
         log.info(f"Created category {self._channel_name} in guild {guild.name}")
 
         self._channel_id = channel.id
+        self.discord_channel = channel
 
     def join(self, username: str = None, password: str = None) -> None:
         raise RuntimeError("Can't join categories")
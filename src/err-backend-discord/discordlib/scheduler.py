@@ -0,0 +1,240 @@
+import collections
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class GuildStats(NamedTuple):
+    """
+    Command dispatch statistics of a guild.
+    """
+
+    queued: int
+    running: int
+    executed: int
+    mean_wait: float
+    max_wait: float
+
+
+class ScheduledResult:
+    """
+    Result of a scheduled call, a subset of multiprocessing's AsyncResult.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._error: Optional[BaseException] = None
+
+    def ready(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float = None) -> None:
+        self._event.wait(timeout)
+
+    def successful(self) -> bool:
+        if not self.ready():
+            raise ValueError("The call hasn't completed yet.")
+        return self._error is None
+
+    def get(self, timeout: float = None) -> Any:
+        if not self._event.wait(timeout):
+            raise TimeoutError("The call hasn't completed yet.")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def _set(self, value=None, error: BaseException = None) -> None:
+        self._value, self._error = value, error
+        self._event.set()
+
+
+class _Task(NamedTuple):
+    func: Callable
+    args: tuple
+    kwds: dict
+    user: Hashable
+    enqueued: float
+    result: ScheduledResult
+
+
+class FairScheduler:
+    """
+    Dispatch calls to a thread pool fairly across guilds.
+
+    Calls wait in one queue per guild.  Guilds take turns in weighted round robin, a
+    guild with weight 3 gets up to 3 calls dispatched per turn.  A guild or user that
+    reached its concurrency cap is skipped until one of its calls completes.  At most
+    `workers` calls are handed to the pool at once, so the order in which calls start is
+    decided here rather than by the pool's own FIFO queue.
+
+    It mimics the part of the multiprocessing.pool.ThreadPool interface used by errbot
+    to run commands: `apply_async`, `close` and `join`.
+    """
+
+    def __init__(
+        self,
+        pool,
+        workers: int,
+        key: Callable[[tuple, dict], Tuple[Hashable, Hashable]],
+        guild_limit: int = 0,
+        user_limit: int = 0,
+        weights: Dict[Hashable, int] = None,
+    ):
+        """
+        :param pool: thread pool running the calls.
+        :param workers: number of threads of the pool.
+        :param key: function returning the (guild, user) of a call from its arguments.
+        :param guild_limit: maximum concurrent calls per guild, 0 for no limit.
+        :param user_limit: maximum concurrent calls per user, 0 for no limit.
+        :param weights: number of calls dispatched per turn for guilds, default 1.
+        """
+        self.pool = pool
+        self.workers = workers
+        self.key = key
+        self.guild_limit = guild_limit
+        self.user_limit = user_limit
+        self.weights = weights or {}
+        self._lock = threading.Condition()
+        self._queues: Dict[Hashable, collections.deque] = {}
+        # Guilds with queued calls, the guild at the front has the turn.
+        self._turns: collections.deque = collections.deque()
+        self._credits: Dict[Hashable, int] = {}
+        self._running_guilds: collections.Counter = collections.Counter()
+        self._running_users: collections.Counter = collections.Counter()
+        self._running = 0
+        self._executed: collections.Counter = collections.Counter()
+        self._wait_total: collections.Counter = collections.Counter()
+        self._wait_max: Dict[Hashable, float] = {}
+        self._closed = False
+
+    def apply_async(self, func: Callable, args: tuple = (), kwds: dict = None) -> ScheduledResult:
+        kwds = kwds or {}
+        guild, user = self.key(args, kwds)
+        task = _Task(func, tuple(args), kwds, user, time.monotonic(), ScheduledResult())
+        with self._lock:
+            if self._closed:
+                raise ValueError("Scheduler is closed.")
+            queue = self._queues.get(guild)
+            if queue is None:
+                queue = self._queues[guild] = collections.deque()
+            if not queue:
+                self._turns.append(guild)
+            queue.append(task)
+            self._dispatch()
+        return task.result
+
+    def _weight(self, guild) -> int:
+        return max(1, self.weights.get(guild, 1))
+
+    def _eligible(self, guild) -> Optional[_Task]:
+        """
+        Pop the oldest call of the guild that isn't over a concurrency cap.
+        """
+        if self.guild_limit and self._running_guilds[guild] >= self.guild_limit:
+            return None
+        queue = self._queues[guild]
+        if not self.user_limit:
+            return queue.popleft()
+        for index, task in enumerate(queue):
+            if self._running_users[task.user] < self.user_limit:
+                del queue[index]
+                return task
+        return None
+
+    def _dispatch(self) -> None:
+        """
+        Hand calls to the pool while it has idle workers.  Called with the lock held.
+        """
+        while self._running < self.workers and self._turns:
+            for _ in range(len(self._turns)):
+                guild = self._turns[0]
+                task = self._eligible(guild)
+                if task is not None:
+                    break
+                self._turns.rotate(-1)
+            else:
+                # Every guild with queued calls is capped.
+                return
+
+            credits = self._credits.get(guild, self._weight(guild)) - 1
+            if not self._queues[guild]:
+                self._turns.popleft()
+                self._credits.pop(guild, None)
+            elif credits <= 0:
+                self._turns.rotate(-1)
+                self._credits.pop(guild, None)
+            else:
+                self._credits[guild] = credits
+
+            self._running += 1
+            self._running_guilds[guild] += 1
+            self._running_users[task.user] += 1
+            self.pool.apply_async(self._run, (guild, task))
+
+    def _run(self, guild, task: _Task) -> None:
+        wait = time.monotonic() - task.enqueued
+        try:
+            task.result._set(value=task.func(*task.args, **task.kwds))
+        except BaseException as e:
+            log.exception("Scheduled call failed.")
+            task.result._set(error=e)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._running_guilds[guild] -= 1
+                self._running_users[task.user] -= 1
+                self._executed[guild] += 1
+                self._wait_total[guild] += wait
+                self._wait_max[guild] = max(self._wait_max.get(guild, 0.0), wait)
+                self._dispatch()
+                self._lock.notify_all()
+
+    def stats(self) -> Dict[Hashable, GuildStats]:
+        """
+        Queue depth, running calls and wait times in seconds per guild.
+        """
+        with self._lock:
+            guilds = set(self._queues) | set(self._executed)
+            return {
+                guild: GuildStats(
+                    queued=len(self._queues.get(guild, ())),
+                    running=self._running_guilds[guild],
+                    executed=self._executed[guild],
+                    mean_wait=(
+                        self._wait_total[guild] / self._executed[guild]
+                        if self._executed[guild]
+                        else 0.0
+                    ),
+                    max_wait=self._wait_max.get(guild, 0.0),
+                )
+                for guild in guilds
+            }
+
+    def close(self) -> None:
+        """
+        Stop accepting calls, the queued ones still run.
+        """
+        with self._lock:
+            self._closed = True
+
+    def join(self) -> None:
+        """
+        Wait for the queued and running calls to complete, then shut the pool down.
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: not self._turns and self._running == 0)
+        self.pool.close()
+        self.pool.join()
+
+    def replace_pool(self, pool) -> None:
+        """
+        Dispatch to a new pool and accept calls again, the statistics are kept.
+        """
+        with self._lock:
+            self.pool = pool
+            self._closed = False
+            self._dispatch()
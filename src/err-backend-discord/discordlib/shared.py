@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Coroutine, Iterable, List
+
+log = logging.getLogger(__name__)
+
+
+class SharedEventLoop:
+    """
+    An event loop running in a background thread, shared by the discord clients of all
+    the bots of the process that enable `shared_event_loop`.
+
+    Every bot keeps serving from its own errbot thread, which waits for its client to
+    stop.  Clients, their handlers and the default executor used by the backend are
+    shared instead of running one event loop per bot.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="discord-event-loop", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @classmethod
+    def get(cls) -> "SharedEventLoop":
+        """
+        Return the process wide shared event loop, it is started on first use.
+        """
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def run(self, coro: Coroutine) -> Any:
+        """
+        Run a coroutine on the shared event loop and wait for its result.  The coroutine
+        is cancelled if the waiting thread is interrupted.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            raise
+
+
+def serve_bots(configs: Iterable[object], backend: str = "Discord") -> None:
+    """
+    Serve several bots, each with its own errbot configuration module and token, from a
+    single process.  Their discord clients share one event loop.
+
+    :param configs: errbot configuration modules, one per bot.
+    :param backend: name of the errbot backend to load.
+    """
+    # errbot is only needed to launch bots, not to import the backend library.
+    from errbot.bootstrap import setup_bot
+
+    bots = []
+    for config in configs:
+        config.BOT_IDENTITY = dict(config.BOT_IDENTITY, shared_event_loop=True)
+        bots.append(setup_bot(backend, log, config))
+
+    threads: List[threading.Thread] = []
+    for number, bot in enumerate(bots):
+        thread = threading.Thread(target=bot.serve_forever, name=f"errbot-{number}", daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        log.info("Interrupt received, stopping all bots.")
+        for bot in bots:
+            bot.stop()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,187 @@
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+from typing import Dict, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+try:
+    import discord
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+VERSION = 1
+
+
+class IdentitySnapshot:
+    """
+    Persisted mappings of usernames, channel names and DM channels to discord ids.
+
+    The snapshot is loaded at startup so identifiers can be resolved before the gateway
+    has filled the client caches.  Entries are validated lazily: a mapping contradicted
+    by the live cache is ignored, and the whole snapshot is rebuilt from the caches by
+    `refresh` once the client is ready.  `refresh` replaces the mappings, and
+    `add_dm_channel` adds DM channels in place as they are opened, both from the event
+    loop.  The mappings can be read from any thread, and are copied to be written to
+    disk outside the event loop.
+
+    Users and DM channels accumulate without the members intent, the ones seen least
+    recently are dropped beyond `maxsize` entries each.
+    """
+
+    def __init__(self, path: str, maxsize: int = 100000):
+        """
+        :param path: file the snapshot is persisted to.
+        :param maxsize: maximum number of users, and of DM channels, kept.
+        """
+        self.path = path
+        self.maxsize = maxsize
+        # user id -> (name, discriminator)
+        self.users: Dict[int, Tuple[str, str]] = {}
+        # channel id -> (name, guild id)
+        self.channels: Dict[int, Tuple[str, int]] = {}
+        # user id -> DM channel id
+        self.dm_channels: Dict[int, int] = {}
+        self._user_index: Dict[str, int] = {}
+        self._channel_index: Dict[Tuple[str, int], int] = {}
+        # DM channels were added since the last refresh.
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.users) + len(self.channels) + len(self.dm_channels)
+
+    def _bound(self, mapping: dict) -> dict:
+        """
+        Drop the oldest entries of a mapping, ordered from least to most recently seen,
+        beyond `maxsize`.
+        """
+        excess = len(mapping) - self.maxsize
+        if excess > 0:
+            mapping = dict(itertools.islice(mapping.items(), excess, None))
+        return mapping
+
+    def _set(self, users, channels, dm_channels) -> bool:
+        """
+        Replace the mappings, return True if they changed.
+        """
+        users, dm_channels = self._bound(users), self._bound(dm_channels)
+        changed = (users, channels, dm_channels) != (self.users, self.channels, self.dm_channels)
+        if changed:
+            self._user_index = {
+                f"{name}#{discriminator}": uid for uid, (name, discriminator) in users.items()
+            }
+            self._channel_index = {
+                (name, guild_id): cid for cid, (name, guild_id) in channels.items()
+            }
+        # Replaced even if unchanged to keep the order of the entries last seen.
+        self.users, self.channels, self.dm_channels = users, channels, dm_channels
+        return changed
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != VERSION:
+                log.info(f"Ignoring identity snapshot {self.path} with an unknown version.")
+                return
+            self._set(
+                {int(uid): tuple(user) for uid, user in data["users"].items()},
+                {int(cid): (name, int(gid)) for cid, (name, gid) in data["channels"].items()},
+                {int(uid): int(cid) for uid, cid in data["dm_channels"].items()},
+            )
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning(f"Failed to load identity snapshot {self.path}: {e}")
+            return
+        log.debug(f"Loaded {len(self)} identities from {self.path}.")
+
+    def save(self) -> None:
+        """
+        Write the snapshot atomically, a crash never leaves a partial file behind.
+        """
+        data = {
+            "version": VERSION,
+            "users": {str(uid): list(user) for uid, user in self.users.items()},
+            "channels": {str(cid): [name, str(gid)] for cid, (name, gid) in self.channels.items()},
+            "dm_channels": {str(uid): str(cid) for uid, cid in dict(self.dm_channels).items()},
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".identities-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def refresh(self, client: discord.Client) -> bool:
+        """
+        Rebuild the mappings from the caches of a ready client.  Must be called from the
+        event loop.
+
+        Channels are always cached.  Users are only all cached with the members intent,
+        without it the users not seen since the start are kept.  DM channels are
+        accumulated because discord.py only caches the most recent ones.  Accumulated
+        entries are bounded by `maxsize`, the least recently seen are dropped first.
+
+        :return: True if the mappings changed.
+        """
+        users = {} if client.intents.members else dict(self.users)
+        for user in client.users:
+            # Moved to the end, the most recently seen entries are kept.
+            users.pop(user.id, None)
+            users[user.id] = (user.name, user.discriminator)
+        channels = {
+            channel.id: (channel.name, channel.guild.id) for channel in client.get_all_channels()
+        }
+        dm_channels = dict(self.dm_channels)
+        for channel in client.private_channels:
+            recipient = getattr(channel, "recipient", None)
+            if recipient is not None:
+                dm_channels.pop(recipient.id, None)
+                dm_channels[recipient.id] = channel.id
+        dirty, self._dirty = self._dirty, False
+        return self._set(users, channels, dm_channels) or dirty
+
+    def add_dm_channel(self, user_id: int, channel_id: int) -> None:
+        """
+        Record a DM channel opened with a user.  Must be called from the event loop.
+        """
+        if self.dm_channels.get(user_id) != channel_id:
+            self.dm_channels[user_id] = channel_id
+            self._dirty = True
+
+    def user_id(self, client: discord.Client, name: str, discriminator: str = "0") -> Optional[int]:
+        user_id = self._user_index.get(f"{name}#{discriminator}")
+        if user_id is None and discriminator != "0":
+            user_id = self._user_index.get(f"{name}#0")
+        if user_id is None:
+            return None
+        user = client.get_user(user_id)
+        if user is not None and user.name != name:
+            log.debug(f"Identity snapshot entry for user {name} is stale.")
+            return None
+        return user_id
+
+    def user_name(self, user_id: int) -> Optional[Tuple[str, str]]:
+        return self.users.get(user_id)
+
+    def channel_id(self, client: discord.Client, name: str, guild_id: int) -> Optional[int]:
+        channel_id = self._channel_index.get((name, guild_id))
+        if channel_id is None:
+            return None
+        channel = client.get_channel(channel_id)
+        if channel is not None and channel.name != name:
+            log.debug(f"Identity snapshot entry for channel {name} is stale.")
+            return None
+        return channel_id
+
+    def dm_channel_id(self, user_id: int) -> Optional[int]:
+        return self.dm_channels.get(user_id)
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import sys
+from typing import Dict, Optional, Union
+
+log = logging.getLogger(__name__)
+
+try:
+    import aiohttp
+    import discord
+except ImportError:
+    log.exception("Could not start err-backend-discord")
+    log.fatal("The required discord module could not be found.")
+    sys.exit(1)
+
+
+class WebhookSender:
+    """
+    Send messages to designated rooms through channel webhooks.
+
+    Webhooks are rate limited independently from the bot user, which makes them suitable
+    for high volume announcement channels.  Webhooks are either given explicitly by url
+    or looked up/created on the channel the first time a message is sent to it.  All
+    webhook requests share a single pooled HTTP session.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        rooms: Union[list, dict],
+        name: str = "errbot",
+        pool_size: int = 100,
+    ):
+        """
+        :param client: discord client used to look up channels and webhooks.
+        :param rooms: list of channel ids or a dict of channel id -> webhook url.
+        :param name: name of the webhooks created by the bot.
+        :param pool_size: maximum number of pooled HTTP connections.
+        """
+        self.client = client
+        self.name = name
+        self.pool_size = pool_size
+        if isinstance(rooms, dict):
+            self._urls = {int(channel_id): url for channel_id, url in rooms.items()}
+        else:
+            self._urls = {int(channel_id): None for channel_id in rooms}
+        self._webhooks: Dict[int, discord.Webhook] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def handles(self, channel_id) -> bool:
+        return channel_id is not None and int(channel_id) in self._urls
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size)
+            )
+        return self._session
+
+    async def webhook(self, channel_id: int) -> discord.Webhook:
+        """
+        Return the webhook of a channel, creating it if required.  Webhooks are reused
+        for the lifetime of the sender.
+        """
+        channel_id = int(channel_id)
+        webhook = self._webhooks.get(channel_id)
+        if webhook is not None:
+            return webhook
+
+        lock = self._locks.setdefault(channel_id, asyncio.Lock())
+        async with lock:
+            webhook = self._webhooks.get(channel_id)
+            if webhook is None:
+                url = self._urls[channel_id]
+                if url is None:
+                    webhook = await self._channel_webhook(channel_id)
+                    webhook = discord.Webhook.partial(
+                        webhook.id, webhook.token, session=self.session
+                    )
+                else:
+                    webhook = discord.Webhook.from_url(url, session=self.session)
+                self._webhooks[channel_id] = webhook
+        return webhook
+
+    async def _channel_webhook(self, channel_id: int) -> discord.Webhook:
+        channel = self.client.get_channel(channel_id)
+        if channel is None:
+            raise ValueError(f"Channel id:{channel_id} doesn't exist!")
+
+        for webhook in await channel.webhooks():
+            if webhook.name == self.name and webhook.token is not None:
+                return webhook
+
+        log.info(f"Creating webhook {self.name} for channel {channel.name}")
+        return await channel.create_webhook(name=self.name)
+
+    async def send(self, channel_id, **kwargs) -> discord.WebhookMessage:
+        """
+        Send a message to the channel through its webhook.  The message is shown with
+        the bot's name and avatar.
+
+        :return: the message sent, as for messages sent by the bot user.
+        """
+        webhook = await self.webhook(channel_id)
+
+        user = self.client.user
+        if user is not None:
+            kwargs.setdefault("username", user.name)
+            kwargs.setdefault("avatar_url", user.display_avatar.url)
+
+        try:
+            return await webhook.send(
+                wait=True, **{k: v for k, v in kwargs.items() if v is not None}
+            )
+        except discord.NotFound:
+            # The webhook was deleted, a new one is looked up on the next send.
+            self.forget(channel_id)
+            raise
+
+    def forget(self, channel_id) -> None:
+        """
+        Drop the cached webhook of a channel, e.g. after it was deleted.
+        """
+        self._webhooks.pop(int(channel_id), None)
+
+    async def close(self) -> None:
+        self._webhooks.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -1,12 +1,50 @@
 import asyncio
+import io
 import logging
+import os
+import re
 import sys
-
-from errbot.backends.base import AWAY, DND, OFFLINE, ONLINE, Message, Person, Presence
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional
+
+from errbot.backends.base import (
+    AWAY,
+    DND,
+    OFFLINE,
+    ONLINE,
+    REACTION_ADDED,
+    REACTION_REMOVED,
+    Message,
+    Person,
+    Presence,
+    Reaction,
+)
 from errbot.core import ErrBot
 
+from discordlib.acl import AclFilter, AclIdentity
+from discordlib.appcommands import AppCommandSync
+from discordlib.attachment import AttachmentStore
+from discordlib.breaker import CircuitBreaker
+from discordlib.bridge import DEFAULT, LoopBridge
+from discordlib.cache import LRUCache
+from discordlib.card import CardBatcher, build_embed
+from discordlib.dedup import MessageDeduplicator
+from discordlib.packer import pack_message
+from discordlib.permissions import PermissionCache
 from discordlib.person import DiscordPerson, DiscordSender
-from discordlib.room import DiscordCategory, DiscordRoom, DiscordRoomOccupant
+from discordlib.presence import STATUSES, PresenceScheduler
+from discordlib.raw import dispatch_raw_events
+from discordlib.registry import RoomRegistry
+from discordlib.replay import GatewayRecorder
+from discordlib.room import (
+    DiscordCategory,
+    DiscordRoom,
+    DiscordRoomOccupant,
+    text_channel_name,
+)
+from discordlib.scheduler import FairScheduler, GuildStats
+from discordlib.shared import SharedEventLoop
+from discordlib.snapshot import IdentitySnapshot
+from discordlib.webhook import WebhookSender
 
 log = logging.getLogger("errbot-backend-discord")
 
@@ -17,19 +55,59 @@ except ImportError:
     log.fatal("The required discord module could not be found.")
     sys.exit(1)
 
-COLOURS = {
-    "red": 0xFF0000,
-    "green": 0x008000,
-    "yellow": 0xFFA500,
-    "blue": 0x0000FF,
-    "white": 0xFFFFFF,
-    "cyan": 0x00FFFF,
-}
+# Discord's upload size limit for bots without boosted guilds.
+MAX_ATTACHMENT_SIZE = 8 * 1024 * 1024
+
+# Discord status values received in raw presence updates -> errbot presence.
+PRESENCE_STATUSES = {status.value: presence for presence, status in STATUSES.items()}
+
+# Grammar of the identifier text representations supported by build_identifier.
+# The name of the last matched group identifies the form of the representation.
+RE_IDENTIFIER = re.compile(
+    r"<@!?(?P<user_id>[0-9]+)>"
+    r"|<#(?P<channel_id>[0-9]+)>"
+    r"|#(?P<channel_name>[^@]+)(?:@(?P<guild_id>[0-9]+))?"
+    r"|@(?P<username>[^#]+)(?:#(?P<discriminator>[0-9]+))?"
+    r"|(?P<snowflake>[0-9]{17,})"
+)
+
+
+class BroadcastResult(NamedTuple):
+    """
+    Outcome of a broadcast to a single target.
+    """
+
+    target: DiscordSender
+    message: Optional[discord.Message]
+    error: Optional[BaseException]
+
+
+class PrewarmResult(NamedTuple):
+    """
+    Outcome of opening the DM channel of a single person.
+    """
+
+    person: DiscordPerson
+    channel: Optional[discord.abc.Messageable]
+    error: Optional[BaseException]
+
+
+class ProvisionResult(NamedTuple):
+    """
+    Outcome of provisioning a single room.
+    """
+
+    name: str
+    room: Optional[DiscordRoom]
+    error: Optional[BaseException]
 
 
 class DiscordBackend(ErrBot):
     """
     Discord backend for Errbot.
+
+    Every backend instance has its own discord client, the class attribute is only the
+    default until a client is initialised.
     """
 
     client = None
@@ -49,6 +127,114 @@ class DiscordBackend(ErrBot):
             sys.exit(1)
 
         self.bot_identifier = None
+        self.room_registry = RoomRegistry()
+        self.identifier_cache = LRUCache(config.BOT_IDENTITY.get("identifier_cache_size", 1024))
+        # (user id, guild id) -> ACL identity of the user in the guild.
+        self.acl_identities = LRUCache(config.BOT_IDENTITY.get("identifier_cache_size", 1024))
+        self.acl_filter = None
+        if config.BOT_IDENTITY.get("fast_acls", True):
+            self.acl_filter = AclFilter(self, self.acl_identity)
+        # message id -> last processed content, used to skip edits that don't change content.
+        self.processed_messages = LRUCache(config.BOT_IDENTITY.get("message_edit_cache_size", 1024))
+        self.message_edit_window = config.BOT_IDENTITY.get("message_edit_window", 300)
+        self.webhook_rooms = config.BOT_IDENTITY.get("webhook_rooms", None)
+        self.webhook_name = config.BOT_IDENTITY.get("webhook_name", "errbot")
+        self.webhook_sender = None
+        self.send_timeout = config.BOT_IDENTITY.get("send_timeout", 5)
+        self.bridge = None
+        self.presence_rate = config.BOT_IDENTITY.get("presence_updates_per_minute", 5)
+        self.presence_scheduler = None
+        self.app_commands_enabled = config.BOT_IDENTITY.get("app_commands", False)
+        self.app_command_guilds = config.BOT_IDENTITY.get("app_command_guilds", [])
+        self.app_commands = None
+        self.broadcast_concurrency = config.BOT_IDENTITY.get("broadcast_concurrency", 10)
+        self.dm_prewarm_rate = config.BOT_IDENTITY.get("dm_prewarm_rate", 5)
+        self.attachment_threshold = config.BOT_IDENTITY.get("attachment_threshold", 8000)
+        self.attachment_preview_size = config.BOT_IDENTITY.get("attachment_preview_size", 300)
+        self.attachment_cache_mb = config.BOT_IDENTITY.get("attachment_cache_mb", 256)
+        self.attachment_store = None
+        self.card_batcher = CardBatcher(
+            self._send, window=config.BOT_IDENTITY.get("card_batch_window", 0.25)
+        )
+        self.gateway_record_file = config.BOT_IDENTITY.get("gateway_record_file", None)
+        self.gateway_recorder = None
+        self.identity_snapshot_interval = config.BOT_IDENTITY.get("identity_snapshot_interval", 300)
+        self.identity_snapshot = None
+        self.identity_snapshot_task = None
+        self.shared_event_loop = config.BOT_IDENTITY.get("shared_event_loop", False)
+        self.permission_precheck = config.BOT_IDENTITY.get("permission_precheck", True)
+        self.unsendable_ttl = config.BOT_IDENTITY.get("unsendable_ttl", 600)
+        self.permission_cache = None
+        self.breaker_threshold = config.BOT_IDENTITY.get("breaker_threshold", 3)
+        self.breaker_delay = config.BOT_IDENTITY.get("breaker_delay", 5)
+        self.breaker_max_delay = config.BOT_IDENTITY.get("breaker_max_delay", 300)
+        self.circuit_breaker = None
+        self.raw_events = config.BOT_IDENTITY.get("raw_events", False)
+        # user id -> last status received in a raw presence update, for online users.
+        self.statuses: Dict[int, str] = {}
+        self._stop_requested = False
+        if self.identity_snapshot_interval:
+            self.identity_snapshot = IdentitySnapshot(
+                os.path.join(config.BOT_DATA_DIR, "discord_identities.json"),
+                config.BOT_IDENTITY.get("identity_snapshot_size", 100000),
+            )
+            self.identity_snapshot.load()
+        self.message_dedup = None
+        self.message_dedup_file = None
+        dedup_window = config.BOT_IDENTITY.get("message_dedup_window", 300)
+        if dedup_window:
+            self.message_dedup = MessageDeduplicator(
+                dedup_window, config.BOT_IDENTITY.get("message_dedup_size", 20000)
+            )
+            if config.BOT_IDENTITY.get("message_dedup_persist", False):
+                self.message_dedup_file = os.path.join(
+                    config.BOT_DATA_DIR, "discord_processed_messages.json"
+                )
+                self.message_dedup.load(self.message_dedup_file)
+
+    @property
+    def thread_pool(self):
+        return getattr(self, "_command_scheduler", None)
+
+    @thread_pool.setter
+    def thread_pool(self, pool):
+        """
+        errbot creates, and replaces for admin commands, the thread pool running commands.
+        Commands are dispatched to it fairly across guilds.
+        """
+        scheduler = getattr(self, "_command_scheduler", None)
+        if scheduler is not None:
+            scheduler.replace_pool(pool)
+            return
+        identity = self.bot_config.BOT_IDENTITY
+        self._command_scheduler = FairScheduler(
+            pool,
+            workers=self.bot_config.BOT_ASYNC_POOLSIZE,
+            key=self._command_key,
+            guild_limit=identity.get("command_guild_concurrency", 0),
+            user_limit=identity.get("command_user_concurrency", 0),
+            weights={int(k): v for k, v in identity.get("command_guild_weights", {}).items()},
+        )
+
+    @staticmethod
+    def _command_key(args: tuple, kwds: dict):
+        """
+        Return the (guild id, user id) a command is run for, guild id None for direct messages.
+        """
+        msg = kwds.get("msg")
+        frm = getattr(msg, "frm", None)
+        if frm is None:
+            return None, None
+        room = getattr(frm, "room", None)
+        return (None if room is None else room.guild), frm.id
+
+    def command_stats(self) -> Dict[Hashable, GuildStats]:
+        """
+        Command queue depth, running commands and wait times per guild id, None for
+        direct messages.  Empty when BOT_ASYNC is disabled.
+        """
+        scheduler = getattr(self, "_command_scheduler", None)
+        return {} if scheduler is None else scheduler.stats()
 
     def set_message_size_limit(self, limit=2000, hard_limit=2000):
         """
@@ -68,26 +254,167 @@ class DiscordBackend(ErrBot):
         # Call connect only after successfully connected and ready to service Discord events.
         self.connect_callback()
 
-        log.debug(
-            f"Logged in as {DiscordBackend.client.user.name}, {DiscordBackend.client.user.id}"
-        )
+        log.debug(f"Logged in as {self.client.user.name}, {self.client.user.id}")
         if self.bot_identifier is None:
-            self.bot_identifier = DiscordPerson(DiscordBackend.client.user.id)
+            self.bot_identifier = DiscordPerson(self.client.user.id, client=self.client)
+
+        self.room_registry.rebuild(self.client.get_all_channels())
+        self.invalidate_identifiers()
+        self.invalidate_permissions()
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.clear()
+        log.debug(f"Found {len(self.room_registry)} channels.")
+
+        if self.identity_snapshot is not None and self.identity_snapshot_task is None:
+            await self.save_identities()
+            self.identity_snapshot_task = asyncio.create_task(self._persist_identities())
+
+        if self.app_commands is not None:
+            try:
+                await self.app_commands.sync(self.commands)
+            except discord.HTTPException as e:
+                log.error(f"Failed to sync application commands: {e}")
+
+    async def save_identities(self):
+        """
+        Refresh the identity snapshot from the client caches and write it if it changed.
+        """
+        try:
+            if self.identity_snapshot.refresh(self.client):
+                await asyncio.get_running_loop().run_in_executor(None, self.identity_snapshot.save)
+                log.debug(f"Saved {len(self.identity_snapshot)} identities.")
+        except OSError as e:
+            log.error(f"Failed to save the identity snapshot: {e}")
+
+    async def _persist_identities(self):
+        while True:
+            await asyncio.sleep(self.identity_snapshot_interval)
+            await self.save_identities()
+
+    async def on_guild_join(self, guild: discord.Guild):
+        """
+        Guild join event handler
+        """
+        for channel in guild.channels:
+            self.room_registry.add(channel)
+        self.invalidate_identifiers()
+        self.destination_recovered(*(channel.id for channel in guild.channels))
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        """
+        Guild remove event handler
+        """
+        self.room_registry.remove_guild(guild.id)
+        self.invalidate_identifiers()
+        self.invalidate_permissions(guild.id)
+
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        """
+        Guild channel create event handler
+        """
+        self.room_registry.add(channel)
+        self.invalidate_identifiers()
+        self.destination_recovered(channel.id)
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        """
+        Guild channel delete event handler
+        """
+        self.room_registry.remove(channel.id)
+        if self.webhook_sender is not None:
+            self.webhook_sender.forget(channel.id)
+        self.invalidate_identifiers()
+        self.invalidate_permissions(channel.guild.id)
+
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ):
+        """
+        Guild channel update event handler
+        """
+        self.room_registry.update(after)
+        self.invalidate_identifiers()
+        self.destination_recovered(after.id)
+        # Overwrites of a category or parent channel apply to threads and other channels.
+        self.invalidate_permissions(after.guild.id)
 
-        for channel in DiscordBackend.client.get_all_channels():
-            log.debug(f"Found channel: {channel}")
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        """
+        Guild role update event handler
+        """
+        self.invalidate_permissions(after.guild.id)
+        self.destination_recovered(*(channel.id for channel in after.guild.channels))
 
-    async def on_message_edit(self, before, after):
+    async def on_guild_role_delete(self, role: discord.Role):
         """
-        Edit message event handler
+        Guild role delete event handler
         """
-        log.warning("Message editing not supported.")
+        self.invalidate_permissions(role.guild.id)
+        self.acl_identities.clear()
 
-    async def on_message(self, msg: discord.Message):
+    async def on_member_join(self, member: discord.Member):
+        """
+        Member join event handler
+        """
+        self.invalidate_identifiers()
+        self.destination_recovered(member.id)
+
+    async def on_member_remove(self, member: discord.Member):
+        """
+        Member remove event handler
+        """
+        self.invalidate_identifiers()
+
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        """
+        Raw edit message event handler
+
+        Edits of recent messages are processed again as if they were new messages so
+        commands can be corrected without retyping them.  The raw event is used so
+        edits are seen even when the message isn't in discord's message cache.
+        """
+        content = payload.data.get("content")
+        # Edits without content are embed/link preview updates from discord.
+        if content is None or "author" not in payload.data:
+            return
+
+        if self.message_edit_window <= 0:
+            return
+
+        age = discord.utils.utcnow() - discord.utils.snowflake_time(payload.message_id)
+        if age.total_seconds() > self.message_edit_window:
+            log.debug(f"Ignoring edit of message {payload.message_id} older than {age}.")
+            return
+
+        if self.processed_messages.get(payload.message_id) == content:
+            return
+
+        channel = self.client.get_channel(payload.channel_id)
+        if channel is None:
+            channel = await self.client.fetch_channel(payload.channel_id)
+
+        try:
+            msg = discord.Message(state=self.client._connection, channel=channel, data=payload.data)
+        except KeyError as e:
+            log.debug(f"Incomplete edit payload for message {payload.message_id}, missing {e}.")
+            return
+
+        await self.on_message(msg, edited=True)
+
+    async def on_message(self, msg: discord.Message, edited: bool = False):
         """
         Message event handler
+
+        Messages delivered again by the gateway are skipped, edits are processed again
+        as commands but don't notify their mentions again.
         """
-        err_msg = Message(msg.content, extras=msg.embeds)
+        err_msg = Message(
+            msg.content,
+            extras={
+                "embeds": msg.embeds,
+                "attachments": [self.attachment_store.handle(a) for a in msg.attachments],
+            },
+        )
 
         # if the message coming in is from a webhook, it will not have a username
         # this will cause the whole process to fail.  In those cases, return without
@@ -96,12 +423,18 @@ class DiscordBackend(ErrBot):
         if msg.author.bot:
             return
 
-        if isinstance(msg.channel, discord.abc.PrivateChannel):
-            err_msg.frm = DiscordPerson(msg.author.id)
-            err_msg.to = self.bot_identifier
-        else:
-            err_msg.to = DiscordRoom.from_id(msg.channel.id)
-            err_msg.frm = DiscordRoomOccupant(msg.author.id, msg.channel.id)
+        if not edited and self.message_dedup is not None and self.message_dedup.seen(msg.id):
+            log.debug(f"Skipping already processed message {msg.id}.")
+            return
+
+        self.processed_messages.put(msg.id, msg.content)
+
+        err_msg.frm, err_msg.to = self._message_endpoints(
+            msg.author.id,
+            msg.channel.id,
+            isinstance(msg.channel, discord.abc.PrivateChannel),
+            msg.author,
+        )
 
         if self.process_message(err_msg):
             # Message contains a command
@@ -113,12 +446,47 @@ class DiscordBackend(ErrBot):
             async with recipient.get_discord_object().typing():
                 self._dispatch_to_plugins("callback_message", err_msg)
 
-        if msg.mentions:
+        if msg.mentions and not edited:
             self.callback_mention(
                 err_msg,
-                [DiscordRoomOccupant(mention.id, msg.channel.id) for mention in msg.mentions],
+                [
+                    DiscordRoomOccupant(mention.id, msg.channel.id, self.client)
+                    for mention in msg.mentions
+                ],
             )
 
+    def _message_endpoints(
+        self, author_id: int, channel_id: int, private: bool, author: discord.abc.User = None
+    ):
+        """
+        Return the errbot (frm, to) identifiers of a message.  The author received with the
+        message is used rather than looking it up in the member cache.
+        """
+        if private:
+            return DiscordPerson(author_id, client=self.client, user=author), self.bot_identifier
+        return (
+            DiscordRoomOccupant(author_id, channel_id, self.client, user=author),
+            DiscordRoom.from_id(channel_id, self.client),
+        )
+
+    async def _on_app_command(self, interaction: discord.Interaction, name: str, arguments: str):
+        """
+        Application command handler, the command is processed like a prefixed text command.
+        """
+        body = f"{self.bot_config.BOT_PREFIX}{name} {arguments}".strip()
+        # Acknowledge the interaction by echoing the command, errbot replies in the channel.
+        await interaction.response.send_message(body)
+
+        err_msg = Message(body, extras={"embeds": [], "attachments": []})
+        err_msg.frm, err_msg.to = self._message_endpoints(
+            interaction.user.id,
+            interaction.channel_id,
+            interaction.guild_id is None,
+            interaction.user,
+        )
+        if self.process_message(err_msg):
+            self._dispatch_to_plugins("callback_message", err_msg)
+
     def is_from_self(self, msg: Message) -> bool:
         """
         Test if message is from the bot instance.
@@ -132,8 +500,20 @@ class DiscordBackend(ErrBot):
         """
         Member update event handler
         """
+        if after.id == self.client.user.id:
+            # The bot's roles may have changed.
+            self.invalidate_permissions(after.guild.id)
+            self.destination_recovered(*(channel.id for channel in after.guild.channels))
+
+        if (
+            before.name != after.name
+            or before.discriminator != after.discriminator
+            or before.roles != after.roles
+        ):
+            self.invalidate_identifiers()
+
         if before.status != after.status:
-            person = DiscordPerson(after.id)
+            person = DiscordPerson(after.id, client=self.client)
 
             log.debug(f"Person {person} changed status to {after.status} from {before.status}")
             if after.status == discord.Status.online:
@@ -147,6 +527,75 @@ class DiscordBackend(ErrBot):
         else:
             log.debug("Unrecognised member update, ignoring...")
 
+    async def on_raw_member_update(self, data: dict):
+        """
+        Raw member update event handler, replaces on_member_update with `raw_events`.
+        """
+        # Without the member cache the previous name isn't known.
+        self.invalidate_identifiers()
+        if int(data["user"]["id"]) == self.client.user.id:
+            guild = self.client.get_guild(int(data["guild_id"]))
+            if guild is not None:
+                self.invalidate_permissions(guild.id)
+                self.destination_recovered(*(channel.id for channel in guild.channels))
+
+    async def on_raw_presence_update(self, data: dict):
+        """
+        Raw presence update event handler, used with `raw_events`.
+        """
+        user_id = int(data["user"]["id"])
+        status = data.get("status", discord.Status.offline.value)
+        if self.statuses.get(user_id, discord.Status.offline.value) == status:
+            return
+        if status == discord.Status.offline.value:
+            self.statuses.pop(user_id, None)
+        else:
+            self.statuses[user_id] = status
+
+        person = DiscordPerson(user_id, client=self.client, user=discord.Object(user_id))
+        log.debug(f"Person {person} changed status to {status}")
+        if status in PRESENCE_STATUSES:
+            self.callback_presence(Presence(person, PRESENCE_STATUSES[status]))
+
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        """
+        Raw reaction add event handler
+        """
+        self._reaction(payload, REACTION_ADDED)
+
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        """
+        Raw reaction remove event handler
+        """
+        self._reaction(payload, REACTION_REMOVED)
+
+    def _reaction(self, payload: discord.RawReactionActionEvent, action: str) -> None:
+        """
+        Build an errbot reaction from a raw reaction event, without the message cache.
+        """
+        if payload.user_id == self.client.user.id:
+            return
+        user = payload.member or discord.Object(payload.user_id)
+        if payload.guild_id is None:
+            reactor = DiscordPerson(payload.user_id, client=self.client, user=user)
+        else:
+            reactor = DiscordRoomOccupant(
+                payload.user_id, payload.channel_id, self.client, user=user
+            )
+        self.callback_reaction(
+            Reaction(
+                reactor=reactor,
+                action=action,
+                timestamp=discord.utils.utcnow().isoformat(),
+                reaction_name=str(payload.emoji),
+                reacted_to={
+                    "message_id": payload.message_id,
+                    "channel_id": payload.channel_id,
+                    "guild_id": payload.guild_id,
+                },
+            )
+        )
+
     def query_room(self, room):
         """
         Query room.
@@ -159,72 +608,391 @@ class DiscordBackend(ErrBot):
         :param room:
         :return:
         """
-        if len(DiscordBackend.client.guilds) == 0:
+        if len(self.client.guilds) == 0:
             log.error(f"Unable to join room '{room}' because no guilds were found!")
             return None
 
-        guild = DiscordBackend.client.guilds[0]
+        guild = self.client.guilds[0]
 
         room_name = room
         if room_name.startswith("##"):
-            return DiscordCategory(room_name[2:], guild.id)
+            return DiscordCategory(room_name[2:], guild.id, client=self.client)
         elif room_name.startswith("#"):
-            return DiscordRoom(room_name[1:], guild.id)
+            return DiscordRoom(room_name[1:], guild.id, client=self.client)
         else:
-            return DiscordRoom(room_name, guild.id)
+            return DiscordRoom(room_name, guild.id, client=self.client)
 
-    def send_message(self, msg: Message):
-        super().send_message(msg)
+    async def _send(self, recipient: DiscordSender, **kwargs):
+        """
+        Send to a recipient, routing rooms designated for webhooks through the webhook sender.
+        """
+        if "embeds" not in kwargs:
+            # Keep cards queued before this message in order.
+            batch = self.card_batcher.flush(recipient)
+            if batch is not None:
+                # Failures are reported to the cards' senders, not to this message.
+                await asyncio.shield(batch)
+
+        if self.webhook_sender is not None:
+            room = recipient.room if isinstance(recipient, DiscordRoomOccupant) else recipient
+            if isinstance(room, DiscordRoom) and self.webhook_sender.handles(room.id):
+                return await self.webhook_sender.send(room.id, **kwargs)
+
+        return await recipient.send(**kwargs)
+
+    def _split_body(self, body: str) -> List[str]:
+        """
+        Split a message body into chunks that fit in a single discord message.
+        """
+        return list(pack_message(body, self.message_size_limit))
+
+    def split_and_send_message(self, msg: Message) -> None:
+        """
+        The body is sent whole, send_message packs it into messages or attaches it.
+        """
+        self.send_message(msg)
 
-        if not isinstance(msg.to, DiscordSender):
+    @staticmethod
+    def _check_recipient(recipient) -> None:
+        if not isinstance(recipient, DiscordSender):
             raise RuntimeError(
-                f"{msg.to} doesn't support sending messages."
-                f"  Expected DiscordSender object but got {type(msg.to)}."
+                f"{recipient} doesn't support sending messages."
+                f"  Expected DiscordSender object but got {type(recipient)}."
             )
 
+    async def _send_message(self, msg: Message) -> Optional[discord.Message]:
+        if self.attachment_threshold and len(msg.body) > self.attachment_threshold:
+            data = msg.body.encode("utf-8")
+            if len(data) <= MAX_ATTACHMENT_SIZE:
+                return await self._send_attachment(msg.to, msg.body, data)
+            log.warning(f"Message of {len(data)} bytes is too large to attach, splitting it.")
+
+        message = None
+        for chunk in self._split_body(msg.body):
+            message = await self._send(msg.to, content=chunk)
+        return message
+
+    def send_message(self, msg: Message):
+        super().send_message(msg)
+        self._check_recipient(msg.to)
+
         log.debug(
             f"Message to:{msg.to}({type(msg.to)}) from:{msg.frm}({type(msg.frm)}),"
             f" is_direct:{msg.is_direct} extras: {msg.extras} size: {len(msg.body)}"
         )
 
-        for message in [
-            msg.body[i : i + self.message_size_limit]
-            for i in range(0, len(msg.body), self.message_size_limit)
-        ]:
-            asyncio.run_coroutine_threadsafe(
-                msg.to.send(content=message), loop=DiscordBackend.client.loop
-            )
+        # All the chunks of the message are handed to the event loop at once.
+        self.bridge.run_soon(self._send_message(msg))
+
+    async def send_message_async(self, msg: Message) -> Optional[discord.Message]:
+        """
+        Awaitable counterpart of send_message for plugins running on the discord event loop.
+
+        :return: the last discord message sent.
+        """
+        super().send_message(msg)
+        self._check_recipient(msg.to)
+        return await self.bridge.wait(self._send_message(msg))
+
+    async def _send_attachment(self, recipient: DiscordSender, body: str, data: bytes):
+        """
+        Send a message body as a text file attachment with a short inline preview.
+        """
+        preview = body[: self.attachment_preview_size]
+        # Cut the preview on a line boundary when possible.
+        if len(body) > len(preview) and "\n" in preview:
+            preview = preview[: preview.rindex("\n")]
+        if preview.count("```") % 2:
+            preview += "\n```"
+        preview = f"{preview}\n... ({len(body)} characters, full message attached)"
+
+        # BytesIO shares the encoded buffer, the upload is streamed without a copy.
+        file = discord.File(io.BytesIO(data), filename="message.txt")
+        return await self._send(recipient, content=preview, file=file)
+
+    async def _send_card(self, card, wait: bool) -> Optional[discord.Message]:
+        em = build_embed(card)
+
+        if self.card_batcher.window <= 0:
+            return await self._send(card.to, embed=em)
+
+        future = self.card_batcher.add(card.to, em)
+        return await future if wait else None
 
     def send_card(self, card):
-        recipient = card.to
+        """
+        Queue a card for its recipient, cards sent within `card_batch_window` are packed
+        in a single message.  The card is sent in the background: sending failures are
+        logged rather than raised, use send_card_async to get the message or the error.
+        """
+        self._check_recipient(card.to)
+        # Batched cards are sent in the background, only wait for them to be queued.
+        self.bridge.run(self._send_card(card, wait=False))
 
-        if not isinstance(recipient, DiscordSender):
-            raise RuntimeError(
-                f"{recipient} doesn't support sending messages."
-                f"  Expected {DiscordSender} but got {type(recipient)}"
-            )
+    async def send_card_async(self, card) -> Optional[discord.Message]:
+        """
+        Awaitable counterpart of send_card for plugins running on the discord event loop.
 
-        if card.color:
-            color = COLOURS.get(card.color, int(card.color.replace("#", "0x"), 16))
-        else:
-            color = None
+        :return: the discord message containing the card.
+        """
+        self._check_recipient(card.to)
+        return await self.bridge.wait(self._send_card(card, wait=True))
+
+    async def broadcast_async(
+        self,
+        targets: Iterable[DiscordSender],
+        content: str = None,
+        embed: discord.Embed = None,
+        concurrency: int = None,
+    ) -> List[BroadcastResult]:
+        """
+        Awaitable counterpart of broadcast for plugins running on the discord event loop.
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.broadcast_concurrency)
+        chunks = self._split_body(content) if content else [None]
 
-        # Create Embed object
-        em = discord.Embed(title=card.title, description=card.body, color=color)
+        async def send_to(target):
+            if not isinstance(target, DiscordSender):
+                return BroadcastResult(
+                    target, None, RuntimeError(f"{target} doesn't support sending messages.")
+                )
 
-        if card.image:
-            em.set_image(url=card.image)
+            async with semaphore:
+                message = None
+                try:
+                    for i, chunk in enumerate(chunks):
+                        # The embed is attached to the last chunk of the content.
+                        last = i == len(chunks) - 1
+                        message = await self._send(
+                            target, content=chunk, embed=embed if last else None
+                        )
+                except Exception as e:
+                    log.warning(f"Broadcast to {target} failed: {e}")
+                    return BroadcastResult(target, message, e)
+                return BroadcastResult(target, message, None)
+
+        return await asyncio.gather(*(send_to(target) for target in targets))
+
+    def broadcast(
+        self,
+        targets: Iterable[DiscordSender],
+        content: str = None,
+        embed: discord.Embed = None,
+        concurrency: int = None,
+        timeout: float = None,
+    ) -> List[BroadcastResult]:
+        """
+        Send the same message to many rooms and/or people concurrently.
+
+        Sends are issued on the client event loop with at most `concurrency` in flight,
+        discord's rate limits are honoured by the discord client.  A failure to send to
+        one target doesn't affect the others.
+
+        :param targets: DiscordSender objects to send to.
+        :param content: Message text.
+        :param embed: Optional discord.Embed sent with the message.
+        :param concurrency: Maximum number of concurrent sends, defaults to the
+                            `broadcast_concurrency` setting.
+        :param timeout: Seconds to wait for the whole broadcast, None waits indefinitely.
+        :return: A BroadcastResult per target, in the order of the targets.
+        """
+        return self.bridge.run(
+            self.broadcast_async(targets, content=content, embed=embed, concurrency=concurrency),
+            timeout=timeout,
+        )
 
-        if card.thumbnail:
-            em.set_thumbnail(url=card.thumbnail)
+    async def prewarm_dm_channels_async(
+        self, people: Iterable[DiscordPerson], concurrency: int = None, rate: float = None
+    ) -> List[PrewarmResult]:
+        """
+        Awaitable counterpart of prewarm_dm_channels for plugins running on the discord
+        event loop.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency or self.broadcast_concurrency)
+        rate = self.dm_prewarm_rate if rate is None else rate
+        interval = 1 / rate if rate else 0
+        next_start = loop.time()
+
+        async def open_dm(person):
+            nonlocal next_start
+            if not isinstance(person, DiscordPerson):
+                return PrewarmResult(
+                    person, None, RuntimeError(f"{person} doesn't have a DM channel.")
+                )
 
-        if card.fields:
-            for key, value in card.fields:
-                em.add_field(name=key, value=value, inline=True)
+            channel = await person.dm_channel(create=False)
+            if channel is not None:
+                return PrewarmResult(person, channel, None)
+
+            async with semaphore:
+                # Requests are spaced out so a large prewarm doesn't hit the rate limits.
+                now = loop.time()
+                start = max(now, next_start)
+                next_start = start + interval
+                await asyncio.sleep(start - now)
+                try:
+                    return PrewarmResult(person, await person.dm_channel(), None)
+                except Exception as e:
+                    log.warning(f"Failed to open the DM channel of {person}: {e}")
+                    return PrewarmResult(person, None, e)
+
+        results = await asyncio.gather(*(open_dm(person) for person in people))
+        if self.identity_snapshot is not None:
+            await self.save_identities()
+        return results
+
+    def prewarm_dm_channels(
+        self,
+        people: Iterable[DiscordPerson],
+        concurrency: int = None,
+        rate: float = None,
+        timeout: float = None,
+    ) -> List[PrewarmResult]:
+        """
+        Open the DM channels of many people ahead of sending them messages, so each
+        message then costs a single request.
+
+        Channels already known, from the client cache or the identity snapshot, are not
+        opened again.  The ones opened are saved to the identity snapshot.  Requests
+        are paced to `rate` per second, discord's rate limits are honoured by the
+        discord client.
+
+        :param people: DiscordPerson objects to open DM channels with.
+        :param concurrency: Maximum number of concurrent requests, defaults to the
+                            `broadcast_concurrency` setting.
+        :param rate: Maximum number of requests started per second, defaults to the
+                     `dm_prewarm_rate` setting, 0 for no pacing.
+        :param timeout: Seconds to wait for the whole prewarm, None waits indefinitely.
+        :return: A PrewarmResult per person, in the order of the people.
+        """
+        return self.bridge.run(
+            self.prewarm_dm_channels_async(people, concurrency=concurrency, rate=rate),
+            timeout=timeout,
+        )
 
-        asyncio.run_coroutine_threadsafe(
-            recipient.send(embed=em), loop=DiscordBackend.client.loop
-        ).result(5)
+    async def _provision_category(self, guild: discord.Guild, name: str):
+        for category in guild.categories:
+            if category.name == name:
+                return category
+        category = await guild.create_category(name)
+        log.info(f"Created category {name} in guild {guild.name}")
+        return category
+
+    async def provision_rooms_async(
+        self,
+        guild_id,
+        names: Iterable[str],
+        category: str = None,
+        members: Iterable[DiscordPerson] = (),
+        concurrency: int = None,
+        timeout=DEFAULT,
+    ) -> List[ProvisionResult]:
+        """
+        Awaitable counterpart of provision_rooms for plugins running on the discord event
+        loop.
+        """
+        guild = self.client.get_guild(int(guild_id))
+        if guild is None:
+            raise ValueError(f"Guild id:{guild_id} doesn't exist!")
+        members = list(members)
+        for person in members:
+            if not isinstance(person, DiscordPerson):
+                raise RuntimeError("Can't invite non Discord Users")
+
+        parent = None
+        if category is not None:
+            parent = await self.bridge.wait(self._provision_category(guild, category), timeout)
+
+        # Channels are created with the overwrites of their category, which they would
+        # otherwise sync to, and the members' access in the same request.
+        targets = {}
+        if parent is not None:
+            targets = {target.id: (target, o) for target, o in parent.overwrites.items()}
+        for person in members:
+            target, overwrite = targets.get(
+                person.id, (discord.Object(person.id), discord.PermissionOverwrite())
+            )
+            overwrite.update(read_messages=True)
+            targets[person.id] = (target, overwrite)
+        overwrites = dict(targets.values())
+
+        existing = {
+            channel.name: channel
+            for channel in (parent.text_channels if parent is not None else guild.text_channels)
+            if parent is not None or channel.category is None
+        }
+        semaphore = asyncio.Semaphore(concurrency or self.broadcast_concurrency)
+
+        async def provision(name):
+            async with semaphore:
+                try:
+                    channel = existing.get(name)
+                    if channel is None:
+                        channel = await self.bridge.wait(
+                            guild.create_text_channel(name, category=parent, overwrites=overwrites),
+                            timeout,
+                        )
+                        log.info(f"Created channel {name} in guild {guild.name}")
+                        return ProvisionResult(
+                            name, DiscordRoom.from_channel(channel, self.client), None
+                        )
+
+                    room = DiscordRoom.from_channel(channel, self.client)
+                    invited = await self.bridge.wait(room.invite_async(*members), timeout)
+                    errors = [result.error for result in invited if result.error is not None]
+                    return ProvisionResult(name, room, errors[0] if errors else None)
+                except Exception as e:
+                    log.warning(f"Failed to provision channel {name}: {e}")
+                    return ProvisionResult(name, None, e)
+
+        # Names discord gives the same channel are provisioned once.
+        names = list(names)
+        unique = list(dict.fromkeys(text_channel_name(name) for name in names))
+        results = dict(zip(unique, await asyncio.gather(*(provision(name) for name in unique))))
+        return [results[text_channel_name(name)]._replace(name=name) for name in names]
+
+    def provision_rooms(
+        self,
+        guild_id,
+        names: Iterable[str],
+        category: str = None,
+        members: Iterable[DiscordPerson] = (),
+        concurrency: int = None,
+        timeout=DEFAULT,
+    ) -> List[ProvisionResult]:
+        """
+        Create many text channels, optionally in a category, and give people access to
+        them concurrently.
+
+        Each channel is created with its permission overwrites in a single request, at
+        most `concurrency` in flight.  The category is created if it doesn't exist yet.
+        Channels that already exist are kept and the people are invited to them, so a
+        failed provisioning can be retried.  Names are matched as discord stores them,
+        lowercase with hyphens instead of spaces, and names of the same channel are
+        provisioned once.  A failure to provision one channel doesn't affect the others.
+
+        :param guild_id: id of the guild to create the channels in.
+        :param names: names of the text channels.
+        :param category: name of the category of the channels, None for no category.
+        :param members: DiscordPerson objects allowed to read the channels.
+        :param concurrency: Maximum number of concurrent requests, defaults to the
+                            `broadcast_concurrency` setting.
+        :param timeout: Seconds to wait for each channel, defaults to the
+                        `send_timeout` setting, None waits indefinitely.
+        :return: A ProvisionResult per channel name, in the order of the names.
+        """
+        return self.bridge.run(
+            self.provision_rooms_async(
+                guild_id,
+                names,
+                category=category,
+                members=members,
+                concurrency=concurrency,
+                timeout=timeout,
+            ),
+            timeout=None,
+        )
 
     def build_reply(self, mess, text=None, private=False, threaded=False):
         response = self.build_message(text)
@@ -236,8 +1004,10 @@ class DiscordBackend(ErrBot):
             if not isinstance(mess.frm, DiscordRoomOccupant):
                 raise RuntimeError("Non-Direct messages must come from a room occupant")
 
-            response.frm = DiscordRoomOccupant(self.bot_identifier.id, mess.frm.room.id)
-            response.to = DiscordPerson(mess.frm.id) if private else mess.to
+            response.frm = DiscordRoomOccupant(
+                self.bot_identifier.id, mess.frm.room.id, self.client
+            )
+            response.to = DiscordPerson(mess.frm.id, client=self.client) if private else mess.to
         return response
 
     def config_intents(self):
@@ -307,24 +1077,97 @@ class DiscordBackend(ErrBot):
         """
 
         bot_intents = self.config_intents()
-        DiscordBackend.client = discord.Client(intents=bot_intents)
+        self.room_registry.clear()
+        self.card_batcher.clear()
+        self.identity_snapshot_task = None
+        self.statuses.clear()
+        options = {}
+        if self.raw_events:
+            # Edits, reactions and member updates are handled from the event payloads.
+            options = dict(
+                max_messages=None,
+                member_cache_flags=discord.MemberCacheFlags.none(),
+                chunk_guilds_at_startup=False,
+            )
+        self.client = discord.Client(
+            intents=bot_intents, enable_debug_events=bool(self.gateway_record_file), **options
+        )
 
         # Register discord event coroutines.
-        for func in [
+        if self.raw_events:
+            dispatch_raw_events(self.client)
+            member_handlers = [self.on_raw_member_update, self.on_raw_presence_update]
+        else:
+            member_handlers = [self.on_member_update]
+        for func in member_handlers + [
             self.on_ready,
             self.on_message,
-            self.on_member_update,
-            self.on_message_edit,
-            self.on_member_update,
+            self.on_raw_message_edit,
+            self.on_raw_reaction_add,
+            self.on_raw_reaction_remove,
+            self.on_guild_join,
+            self.on_guild_remove,
+            self.on_guild_channel_create,
+            self.on_guild_channel_delete,
+            self.on_guild_channel_update,
+            self.on_guild_role_update,
+            self.on_guild_role_delete,
+            self.on_member_join,
+            self.on_member_remove,
         ]:
-            DiscordBackend.client.event(func)
+            self.client.event(func)
+
+        if self.gateway_record_file:
+            self.gateway_recorder = GatewayRecorder(self.gateway_record_file)
+            self.client.event(self.gateway_recorder.on_socket_raw_receive)
+
+        self.bridge = LoopBridge(self.client, timeout=self.send_timeout)
+        self.attachment_store = AttachmentStore(
+            self.bridge,
+            os.path.join(self.bot_config.BOT_DATA_DIR, "discord_attachments"),
+            self.attachment_cache_mb * 1024 * 1024,
+        )
+        self.presence_scheduler = PresenceScheduler(self.client, rate=self.presence_rate, per=60)
+
+        if self.app_commands_enabled:
+            self.app_commands = AppCommandSync(
+                self.client,
+                self._on_app_command,
+                os.path.join(self.bot_config.BOT_DATA_DIR, "discord_app_commands.sha256"),
+                guild_ids=self.app_command_guilds,
+            )
+
+        if self.webhook_rooms:
+            self.webhook_sender = WebhookSender(
+                self.client, self.webhook_rooms, name=self.webhook_name
+            )
+
+        # Identifiers built by the backend are bound to its client.  The client is also
+        # injected as the default of identifiers built without one, as plugins may do.
+        self.permission_cache = None
+        if self.permission_precheck:
+            self.permission_cache = PermissionCache(negative_ttl=self.unsendable_ttl)
 
-        # Use dependency injection to make discord client available to submodule classes.
-        DiscordCategory.client = DiscordBackend.client
-        DiscordRoomOccupant.client = DiscordBackend.client
-        DiscordRoom.client = DiscordBackend.client
-        DiscordPerson.client = DiscordBackend.client
-        DiscordSender.client = DiscordBackend.client
+        self.circuit_breaker = None
+        if self.breaker_threshold:
+            self.circuit_breaker = CircuitBreaker(
+                self.breaker_threshold, self.breaker_delay, self.breaker_max_delay
+            )
+
+        DiscordSender.register_client(
+            self.client,
+            self.identity_snapshot,
+            self.permission_cache,
+            self.circuit_breaker,
+            self.bridge,
+        )
+        self.room_registry.client = self.client
+        DiscordCategory.client = self.client
+        DiscordRoomOccupant.client = self.client
+        DiscordRoom.client = self.client
+        DiscordPerson.client = self.client
+        DiscordSender.client = self.client
+        DiscordSender.identities = self.identity_snapshot
 
     def serve_once(self):
         """
@@ -335,32 +1178,92 @@ class DiscordBackend(ErrBot):
             """
             Start the discord client using asynchronous event loop.
             """
-            async with DiscordBackend.client:
-                await DiscordBackend.client.start(token)
+            try:
+                async with self.client:
+                    await self.client.start(token)
+            finally:
+                if self.webhook_sender is not None:
+                    await self.webhook_sender.close()
+                await self.attachment_store.close()
+                if self.gateway_recorder is not None:
+                    self.gateway_recorder.close()
+                if self.identity_snapshot_task is not None:
+                    # Only a session that got ready has complete caches to save.
+                    self.identity_snapshot_task.cancel()
+                    await self.save_identities()
+                if self.message_dedup_file is not None:
+                    try:
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, self.message_dedup.save, self.message_dedup_file
+                        )
+                    except OSError as e:
+                        log.warning(f"Failed to save processed message ids: {e}")
 
         try:
+            if self._stop_requested:
+                return True
             self.initialise_client()
 
             # Discord.py 2.0's client.run convenience method traps KeyboardInterrupt so it can not be used.
             # The documented manual method is used here so errbot can handle KeyboardInterrupt exceptions.
-            asyncio.run(start_client(self.token))
+            if self.shared_event_loop:
+                SharedEventLoop.get().run(start_client(self.token))
+            else:
+                asyncio.run(start_client(self.token))
+
+            if self._stop_requested:
+                self.disconnect_callback()
+                return True
 
         except KeyboardInterrupt:
             self.disconnect_callback()
             return True
 
+    async def _close_client(self) -> None:
+        # Cards still waiting for their batch window are sent before disconnecting.
+        batches = self.card_batcher.flush_all()
+        if batches:
+            await asyncio.gather(*batches)
+        await self.client.close()
+
+    def stop(self):
+        """
+        Disconnect from discord and make serve_forever return.  Used to stop bots sharing
+        a process, which don't receive KeyboardInterrupt in their own threads.
+        """
+        self._stop_requested = True
+        if self.bridge is None or self.client.is_closed():
+            return
+        try:
+            self.bridge.run_soon(self._close_client())
+        except AttributeError:
+            # The client has no event loop until it starts, serve_once checks the flag.
+            pass
+
     def change_presence(self, status: str = ONLINE, message: str = ""):
         log.debug(f'Presence changed to {status} and activity "{message}".')
-        activity = discord.Activity(name=message)
-        DiscordBackend.client.change_presence(status=status, activity=activity)
+        activity = discord.Game(name=message) if message else None
+
+        async def request():
+            self.presence_scheduler.request(STATUSES.get(status, discord.Status.online), activity)
+
+        self.bridge.run_soon(request())
 
     def prefix_groupchat_reply(self, message, identifier: Person):
         message.body = f"@{identifier.nick} {message.body}"
 
-    def rooms(self):
-        return [
-            DiscordRoom.from_id(channel.id) for channel in DiscordBackend.client.get_all_channels()
-        ]
+    def rooms(self, guild_id=None, channel_type: discord.ChannelType = None):
+        """
+        Return the rooms known to the bot, optionally filtered by guild and channel type.
+
+        The rooms are served from the room registry which is maintained by the guild
+        and channel events, so polling this method doesn't rescan every channel.
+
+        :param guild_id: Only return rooms belonging to this guild.
+        :param channel_type: Only return rooms of this discord.ChannelType.
+        :return: tuple of DiscordRoom
+        """
+        return self.room_registry.rooms(guild_id=guild_id, channel_type=channel_type)
 
     @property
     def mode(self):
@@ -372,11 +1275,15 @@ class DiscordBackend(ErrBot):
         and are often referred to as "servers" in the UI.
 
         Valid forms of strreps:
-        <@userid>                      -> Person
+        <@userid> or <@!userid>        -> Person
         <#channelid>                   -> Room
         @user#discriminator            -> Person
+        @user                          -> Person (a user without discriminator)
         #channel                       -> Room (a uniquely identified channel on any guild)
-        #channel#guild_id              -> Room (a channel on a specific guild)
+        #channel@guild_id              -> Room (a channel on a specific guild)
+        snowflake                      -> Room if the id is a known channel otherwise Person
+
+        Identifiers are memoized, the cache is invalidated by member and channel events.
 
         :param text:  The text the represents an Identifier
         :return: Identifier
@@ -388,53 +1295,115 @@ class DiscordBackend(ErrBot):
         if not text:
             raise ValueError("A string must be provided to build an identifier.")
 
-        log.debug(f"Build_identifier {text}")
+        identifier = self.identifier_cache.get(text)
+        if identifier is None:
+            log.debug(f"Build_identifier {text}")
+            identifier = self._parse_identifier(text)
+            self.identifier_cache.put(text, identifier)
+        return identifier
+
+    def _parse_identifier(self, text: str):
+        match = RE_IDENTIFIER.fullmatch(text)
+        if match is None:
+            raise ValueError(f"Invalid representation {text}")
+
+        kind = match.lastgroup
+        if kind == "user_id":
+            return DiscordPerson(user_id=match["user_id"], client=self.client)
+        if kind == "channel_id":
+            return DiscordRoom(channel_id=match["channel_id"], client=self.client)
+        if kind in ["channel_name", "guild_id"]:
+            return DiscordRoom(match["channel_name"], match["guild_id"], client=self.client)
+        if kind in ["username", "discriminator"]:
+            return DiscordPerson(
+                username=match["username"],
+                discriminator=match["discriminator"] or "0",
+                client=self.client,
+            )
+        # Raw snowflakes are shared by users and channels.
+        if self.client.get_channel(int(match["snowflake"])) is not None:
+            return DiscordRoom(channel_id=match["snowflake"], client=self.client)
+        return DiscordPerson(user_id=match["snowflake"], client=self.client)
 
-        # Mentions are wrapped by <>
-        if text.startswith("<") and text.endswith(">"):
-            text = text[1:-1]
-            if text.startswith("@"):
-                return DiscordPerson(user_id=text[1:])
-            elif text.startswith("#"):
-                # channel id
-                return DiscordRoom(channel_id=text[1:])
-            else:
-                raise ValueError(f"Unsupport identification {text}")
-        # Raw text channel name start with #
-        elif text.startswith("#"):
-            if "@" in text:
-                channel_name, guild_id = text.split("@", 1)
-                return DiscordRoom(channel_name[1:], guild_id)
-            else:
-                return DiscordRoom(text[1:])
-        # Raw text username starts with @
-        elif text.startswith("@"):
-            text = text[1:]
-            if "#" in text:
-                user, discriminator = text.split("#",1)
-                return DiscordPerson(username=user, discriminator=discriminator)
+    def invalidate_identifiers(self, *args, **kwargs):
+        """
+        Discard memoized identifiers.  Registered as handler for member and channel events.
+        """
+        self.identifier_cache.clear()
+        self.acl_identities.clear()
+
+    def acl_identity(self, identifier) -> AclIdentity:
+        """
+        Return the attributes ACLs are matched against for a message author, cached per
+        user and guild.
+        """
+        if not isinstance(identifier, DiscordPerson):
+            return AclIdentity(None, str(getattr(identifier, "aclattr", identifier.person)))
+        guild_id = identifier.room.guild if isinstance(identifier, DiscordRoomOccupant) else None
+        key = (identifier.id, guild_id)
+        identity = self.acl_identities.get(key)
+        if identity is None:
+            identity = identifier.acl_identity(guild_id)
+            self.acl_identities.put(key, identity)
+        return identity
+
+    @staticmethod
+    def _is_acl_plugin(instance) -> bool:
+        return type(instance).__name__ == "ACLS" and hasattr(instance, "acls")
+
+    def inject_command_filters_from(self, instance_to_inject) -> None:
+        """
+        errbot's ACL filter is replaced by an equivalent filter matching precomputed
+        identities, which also supports user id and role ACLs.
+        """
+        super().inject_command_filters_from(instance_to_inject)
+        if self.acl_filter is not None and self._is_acl_plugin(instance_to_inject):
+            with self._gbl:
+                index = self.command_filters.index(instance_to_inject.acls)
+                self.command_filters[index] = self.acl_filter
+
+    def remove_command_filters_from(self, instance_to_inject) -> None:
+        if self.acl_filter is not None and self._is_acl_plugin(instance_to_inject):
+            with self._gbl:
+                if self.acl_filter in self.command_filters:
+                    index = self.command_filters.index(self.acl_filter)
+                    self.command_filters[index] = instance_to_inject.acls
+        super().remove_command_filters_from(instance_to_inject)
+
+    def invalidate_permissions(self, guild_id: int = None) -> None:
+        """
+        Invalidate the cached permissions of a guild's channels, or of all the channels.
+        """
+        if self.permission_cache is None:
+            return
+        if guild_id is None:
+            self.permission_cache.clear()
+        else:
+            self.permission_cache.forget_guild(guild_id)
 
-        raise ValueError(f"Invalid representation {text}")
+    def destination_recovered(self, *destination_ids: int) -> None:
+        """
+        Close the circuits of channels or users an event shows may be reachable again.
+        """
+        if self.circuit_breaker is None:
+            return
+        for destination_id in destination_ids:
+            self.circuit_breaker.reset(destination_id)
 
     def upload_file(self, msg, filename):
-        with open(filename, "r") as f:
-            dest = None
-            if msg.is_direct:
-                dest = DiscordPerson(msg.frm.id).get_discord_object()
-            else:
-                dest = msg.to.get_discord_object()
+        dest = None
+        if msg.is_direct:
+            dest = DiscordPerson(msg.frm.id, client=self.client)
+        else:
+            dest = msg.to
 
-            log.info(f"Sending file {filename} to user {msg.frm}")
-            asyncio.run_coroutine_threadsafe(
-                dest.send(file=discord.File(f, filename=filename)),
-                loop=self.client.loop,
-            )
+        log.info(f"Sending file {filename} to user {msg.frm}")
+        self.bridge.run_soon(self._send(dest, file=discord.File(filename)))
 
     def history(self, channelname, before=None):
         mychannel = discord.utils.get(self.client.get_all_channels(), name=channelname)
 
         async def gethist(mychannel, before=None):
-            return [i async for i in self.client.logs_from(mychannel, limit=10, before=before)]
+            return [i async for i in mychannel.history(limit=10, before=before)]
 
-        future = asyncio.run_coroutine_threadsafe(gethist(mychannel, before), loop=self.client.loop)
-        return future.result(timeout=None)
+        return self.bridge.run(gethist(mychannel, before), timeout=None)
@@ -0,0 +1,92 @@
+import discord
+from errbot.backends.base import RoomOccupant
+from mock import MagicMock
+
+from discordlib.acl import BLOCK_COMMAND, AclFilter, AclIdentity, AclPatterns
+from discordlib.person import DiscordPerson
+
+ADMIN = AclIdentity(1234567890123456789, "admin#0", frozenset({42}))
+USER = AclIdentity(2234567890123456789, "someone#0", frozenset({7}))
+
+
+def test_patterns():
+    patterns = AclPatterns(["admin#0", "<@2234567890123456789>", "role:42", "ops-*#0"])
+
+    assert patterns.matches(ADMIN)
+    assert patterns.matches(USER)
+    assert patterns.matches(AclIdentity(None, "ops-alice#0"))
+    assert patterns.matches("ops-bob#0")
+    assert not patterns.matches(AclIdentity(3, "dev#0", frozenset({7})))
+    assert AclPatterns("<@&7>").matches(USER)
+    assert AclPatterns("*").matches("anything")
+
+
+def make_bot(access_controls, admin_only=False):
+    bot = MagicMock()
+    bot.bot_config.BOT_ADMINS = ("role:42",)
+    bot.bot_config.ACCESS_CONTROLS_DEFAULT = {}
+    bot.bot_config.ACCESS_CONTROLS = access_controls
+    bot.bot_config.HIDE_RESTRICTED_ACCESS = False
+
+    class Deploy:
+        name = "Deploy"
+
+        def deploy(self, msg, args):
+            pass
+
+        deploy._err_command_admin_only = admin_only
+
+    bot.all_commands = {"deploy": Deploy().deploy}
+    return bot
+
+
+def make_msg(group=False):
+    msg = MagicMock(is_group=group)
+    if group:
+        msg.frm = MagicMock(spec=RoomOccupant)
+        msg.frm.room = "<#1>"
+    return msg
+
+
+def test_filter_users_and_roles():
+    bot = make_bot({"Deploy:*": {"allowusers": ["role:42", "<@2234567890123456789>"]}})
+    identities = {"admin": ADMIN, "user": USER, "other": AclIdentity(3, "other#0")}
+    acl_filter = AclFilter(bot, lambda frm: identities[frm])
+
+    msg = make_msg()
+    for frm in ("admin", "user"):
+        msg.frm = frm
+        assert acl_filter(msg, "deploy", "", False) == (msg, "deploy", "")
+    msg.frm = "other"
+    assert acl_filter(msg, "deploy", "", False) == BLOCK_COMMAND
+    bot.send_simple_reply.assert_called_once()
+
+
+def test_filter_rooms_and_admins():
+    bot = make_bot({"deploy": {"denyrooms": ["<#1>"], "allowmuc": True}}, admin_only=True)
+    acl_filter = AclFilter(bot, lambda frm: ADMIN)
+
+    assert acl_filter(make_msg(group=True), "deploy", "", True) == BLOCK_COMMAND
+    msg = make_msg()
+    assert acl_filter(msg, "deploy", "", True) == (msg, "deploy", "")
+
+    acl_filter = AclFilter(bot, lambda frm: USER)
+    assert acl_filter(make_msg(), "deploy", "", True) == BLOCK_COMMAND
+    bot.send_simple_reply.assert_not_called()
+
+
+def test_person_acl_identity():
+    client = MagicMock()
+    member = MagicMock(spec=discord.Member, id=USER.id, discriminator="0", roles=[MagicMock(id=7)])
+    member.name = "someone"
+    member.guild.id = 5
+    client.guilds = [member.guild]
+    member.guild.get_member.return_value = member
+
+    person = DiscordPerson(client=client, user=member)
+    assert person.acl_identity(5) == USER
+    assert person.acl_identity() == USER
+
+    member.name = "renamed"
+    # The ACL attribute is computed once.
+    assert person.aclattr == "someone#0"
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import os
+from tempfile import mkdtemp
+
+import pytest
+from mock import AsyncMock, MagicMock
+
+from discordlib.appcommands import AppCommandSync, command_definitions
+
+log = logging.getLogger(__name__)
+
+
+def command(doc=None, hidden=False):
+    def method():
+        pass
+
+    method.__doc__ = doc
+    method._err_command_hidden = hidden
+    return method
+
+
+COMMANDS = {
+    "help": command("Returns a help string listing available options.\n\nMore details."),
+    "status": command(),
+    "secret": command("Hidden command.", hidden=True),
+    "Upper": command("Not a valid application command name."),
+    "plugin_info": command("x" * 200),
+}
+
+
+def test_command_definitions():
+    definitions = dict(command_definitions(COMMANDS))
+    assert sorted(definitions) == ["help", "plugin_info", "status"]
+    assert definitions["help"] == "Returns a help string listing available options."
+    assert definitions["status"] == "Run the status command."
+    assert len(definitions["plugin_info"]) == 100
+
+
+@pytest.fixture
+def sync():
+    client = MagicMock()
+    client._connection._command_tree = None
+    sync = AppCommandSync(client, AsyncMock(), os.path.join(mkdtemp(), "hash"))
+    sync.tree.sync = AsyncMock()
+    return sync
+
+
+def test_sync_only_when_definitions_change(sync):
+    assert asyncio.run(sync.sync(COMMANDS))
+    assert not asyncio.run(sync.sync(COMMANDS))
+    assert sync.tree.sync.await_count == 1
+    assert sorted(c.name for c in sync.tree.get_commands()) == ["help", "plugin_info", "status"]
+
+    assert asyncio.run(sync.sync(dict(COMMANDS, deploy=command("Deploy."))))
+    assert sync.tree.sync.await_count == 2
+
+
+def test_callback_dispatches(sync):
+    sync.register([("help", "Help.")])
+    interaction = MagicMock()
+    asyncio.run(sync.tree.get_command("help").callback(interaction, "full"))
+    sync.dispatch.assert_awaited_once_with(interaction, "help", "full")
@@ -0,0 +1,93 @@
+import asyncio
+import os
+from tempfile import mkdtemp
+
+import pytest
+from aiohttp import web
+from mock import MagicMock
+
+from discordlib.attachment import AttachmentStore
+
+CONTENT = b"0123456789" * 100
+
+
+def attachment(attachment_id, filename="report.txt", size=len(CONTENT), url="/file"):
+    return MagicMock(
+        id=attachment_id, filename=filename, size=size, content_type="text/plain", url=url
+    )
+
+
+async def serve(test):
+    """
+    Run a test coroutine against a local server, return the number of requests served.
+    """
+    requests = []
+
+    async def handler(request):
+        requests.append(request.path)
+        return web.Response(body=CONTENT)
+
+    app = web.Application()
+    app.router.add_get("/file", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        await test(f"http://127.0.0.1:{port}/file")
+    finally:
+        await runner.cleanup()
+    return len(requests)
+
+
+def test_download_cached_and_shared():
+    store = AttachmentStore(MagicMock(), mkdtemp(), max_size=10 * len(CONTENT))
+
+    async def test(url):
+        handle = store.handle(attachment(1, url=url))
+        paths = await asyncio.gather(handle.download_async(), handle.download_async())
+        assert await handle.download_async() == paths[0] == paths[1]
+        assert os.path.basename(paths[0]) == "1.txt"
+        with open(paths[0], "rb") as f:
+            assert f.read() == CONTENT
+        await store.close()
+
+    assert asyncio.run(serve(test)) == 1
+    assert store.size == len(CONTENT)
+
+
+def test_least_recently_used_evicted():
+    directory = mkdtemp()
+    store = AttachmentStore(MagicMock(), directory, max_size=2 * len(CONTENT))
+
+    async def test(url):
+        handles = [store.handle(attachment(i, filename="x.$$$", url=url)) for i in range(3)]
+        await handles[0].download_async()
+        await handles[1].download_async()
+        await handles[0].download_async()
+        await handles[2].download_async()
+        await store.close()
+
+    asyncio.run(serve(test))
+    assert sorted(os.listdir(directory)) == ["0", "2"]
+
+    # The cache is rebuilt from the directory, partial downloads are removed.
+    open(os.path.join(directory, ".attachment-partial"), "w").close()
+    assert AttachmentStore(MagicMock(), directory, max_size=len(CONTENT)).size == len(CONTENT)
+    assert len(os.listdir(directory)) == 1
+
+
+def test_large_attachments_streamed():
+    store = AttachmentStore(MagicMock(), mkdtemp(), max_size=len(CONTENT) - 1)
+
+    async def test(url):
+        handle = store.handle(attachment(1, url=url))
+        with pytest.raises(ValueError):
+            await handle.download_async()
+        chunks = [chunk async for chunk in handle.chunks(chunk_size=100)]
+        assert b"".join(chunks) == CONTENT
+        assert await handle.read_async() == CONTENT
+        await store.close()
+
+    assert asyncio.run(serve(test)) == 2
@@ -1,20 +1,26 @@
+import asyncio
+import datetime
 import json
 import logging
 import os
 import pdb
 import sys
+import time
 from tempfile import mkdtemp
 
 
 import importlib  # Use importlib because of "-" in module name.
+import discord
 import pytest
 
+from discordlib.bridge import LoopBridge
+from discordlib.person import DiscordPerson, DiscordSender
 from discordlib.room import DiscordRoom
 
 from errbot.backends.base import Message
 from errbot.bootstrap import bot_config_defaults
 
-from mock import MagicMock
+from mock import AsyncMock, MagicMock
 
 log = logging.getLogger(__name__)
 
@@ -67,3 +73,425 @@ def todo_extract_identifiers(backend):
 
 def todo_send_message(backend):
     raise NotImplementedError
+
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    client.get_channel.side_effect = lambda channel_id: (
+        MagicMock(id=channel_id) if channel_id == 1234567890123456789 else None
+    )
+    for cls in [DiscordBackend, DiscordPerson, DiscordRoom]:
+        setattr(cls, "client", client)
+    return client
+
+
+def test_build_identifier_mentions(backend, client):
+    assert backend.build_identifier("<@2345678901234567890>").id == 2345678901234567890
+    assert backend.build_identifier("<@!2345678901234567890>").id == 2345678901234567890
+    assert isinstance(backend.build_identifier("<#1234567890123456789>"), DiscordRoom)
+
+
+def test_build_identifier_snowflake(backend, client):
+    assert isinstance(backend.build_identifier("1234567890123456789"), DiscordRoom)
+    assert isinstance(backend.build_identifier("2345678901234567890"), DiscordPerson)
+
+
+def test_build_identifier_17_digit_snowflake(backend, client):
+    person = backend.build_identifier("81384788765712384")
+    assert isinstance(person, DiscordPerson)
+    assert person.id == 81384788765712384
+    assert backend.build_identifier("<@81384788765712384>").id == 81384788765712384
+
+
+def test_build_identifier_channel_at_guild(backend, client):
+    channel = MagicMock(id=1234567890123456789)
+    channel.name = "general"
+    client.get_guild.return_value.channels = [channel]
+
+    room = backend.build_identifier("#general@3456789012345678901")
+    client.get_guild.assert_called_with(3456789012345678901)
+    assert room.id == 1234567890123456789
+
+
+def test_build_identifier_invalid(backend, client):
+    with pytest.raises(ValueError):
+        backend.build_identifier("<$1234567890123456789>")
+    with pytest.raises(ValueError):
+        backend.build_identifier("#general@guild")
+
+
+def test_build_identifier_is_memoized(backend, client):
+    person = backend.build_identifier("<@2345678901234567890>")
+    assert backend.build_identifier("<@2345678901234567890>") is person
+
+    backend.invalidate_identifiers()
+    assert backend.build_identifier("<@2345678901234567890>") is not person
+
+
+def edit_payload(content="!help", age=0):
+    created = discord.utils.utcnow() - datetime.timedelta(seconds=age)
+    payload = MagicMock()
+    payload.message_id = discord.utils.time_snowflake(created)
+    payload.channel_id = 1234567890123456789
+    payload.data = {"id": str(payload.message_id), "author": {}, "content": content}
+    return payload
+
+
+@pytest.fixture
+def edited(backend, client, monkeypatch):
+    monkeypatch.setattr(discord, "Message", MagicMock())
+    backend.on_message = AsyncMock()
+    return backend
+
+
+def test_message_edit_redispatched(edited):
+    asyncio.run(edited.on_raw_message_edit(edit_payload()))
+    edited.on_message.assert_awaited_once()
+
+
+def test_message_edit_same_content_ignored(edited):
+    payload = edit_payload()
+    edited.processed_messages.put(payload.message_id, "!help")
+    asyncio.run(edited.on_raw_message_edit(payload))
+    edited.on_message.assert_not_awaited()
+
+
+def test_message_edit_without_content_ignored(edited):
+    payload = edit_payload()
+    del payload.data["content"]
+    asyncio.run(edited.on_raw_message_edit(payload))
+    edited.on_message.assert_not_awaited()
+
+
+def test_message_edit_outside_window_ignored(edited):
+    asyncio.run(edited.on_raw_message_edit(edit_payload(age=3600)))
+    edited.on_message.assert_not_awaited()
+
+
+def test_redelivered_message_processed_once(backend):
+    backend.process_message = MagicMock(return_value=False)
+    backend._message_endpoints = MagicMock(return_value=(MagicMock(), MagicMock()))
+    msg = MagicMock(content="!deploy", id=discord.utils.time_snowflake(discord.utils.utcnow()))
+    msg.author.bot = False
+    msg.mentions = []
+
+    asyncio.run(backend.on_message(msg))
+    asyncio.run(backend.on_message(msg))
+    assert backend.process_message.call_count == 1
+
+    asyncio.run(backend.on_message(msg, edited=True))
+    assert backend.process_message.call_count == 2
+
+
+def test_message_edit_does_not_notify_mentions_again(backend, client):
+    backend.process_message = MagicMock(return_value=False)
+    backend.callback_mention = MagicMock()
+    msg = MagicMock(
+        content="hi <@2345678901234567890>", id=discord.utils.time_snowflake(discord.utils.utcnow())
+    )
+    msg.author.bot = False
+    msg.author.id = 2345678901234567890
+    msg.channel.id = 1234567890123456789
+    msg.mentions = [MagicMock(id=2345678901234567890)]
+
+    asyncio.run(backend.on_message(msg))
+    asyncio.run(backend.on_message(msg, edited=True))
+
+    assert backend.process_message.call_count == 2
+    backend.callback_mention.assert_called_once()
+
+
+class FakeSender(DiscordSender):
+    in_flight = 0
+    peak = 0
+
+    def __init__(self, fail=False):
+        self.id = id(self)
+        self.fail = fail
+        self.sent = []
+
+    async def send(self, content=None, embed=None, **kwargs):
+        FakeSender.in_flight += 1
+        FakeSender.peak = max(FakeSender.peak, FakeSender.in_flight)
+        await asyncio.sleep(0.01)
+        FakeSender.in_flight -= 1
+        if self.fail:
+            raise RuntimeError("send failed")
+        self.sent.append((content, embed))
+        self.kwargs = kwargs
+        return content
+
+    def get_discord_object(self):
+        return None
+
+
+def test_broadcast_concurrency_and_results(backend):
+    targets = [FakeSender(fail=i == 3) for i in range(12)]
+    FakeSender.peak = 0
+
+    results = asyncio.run(backend.broadcast_async(targets, content="hello", concurrency=4))
+
+    assert FakeSender.peak == 4
+    assert [r.target for r in results] == targets
+    assert [r.error is None for r in results] == [i != 3 for i in range(12)]
+    assert results[0].message == "hello"
+
+
+def test_broadcast_splits_long_content(backend):
+    target = FakeSender()
+    embed = MagicMock()
+    asyncio.run(backend.broadcast_async([target], content="x" * 4500, embed=embed))
+    assert [(len(content), e) for content, e in target.sent] == [
+        (2000, None),
+        (2000, None),
+        (500, embed),
+    ]
+
+
+def test_send_attachment(backend):
+    target = FakeSender()
+    body = "\n".join(f"line {i}" for i in range(2000))
+
+    asyncio.run(backend._send_attachment(target, body, body.encode()))
+
+    content, _ = target.sent[0]
+    assert content.startswith("line 0\nline 1\n")
+    assert len(content) < 400
+    assert target.kwargs["file"].filename == "message.txt"
+    assert target.kwargs["file"].fp.read() == body.encode()
+
+
+def test_split_and_send_message_sends_whole_body(backend):
+    backend.send_message = MagicMock()
+    msg = Message("x" * 5000)
+    backend.split_and_send_message(msg)
+    backend.send_message.assert_called_once_with(msg)
+
+
+def test_command_key():
+    occupant = MagicMock()
+    occupant.id = 2345678901234567890
+    occupant.room.guild = 3456789012345678901
+    person = MagicMock(spec=["id"], id=2345678901234567890)
+
+    assert DiscordBackend._command_key((), {"msg": MagicMock(frm=occupant)}) == (
+        3456789012345678901,
+        2345678901234567890,
+    )
+    assert DiscordBackend._command_key((), {"msg": MagicMock(frm=person)}) == (
+        None,
+        2345678901234567890,
+    )
+    assert DiscordBackend._command_key(("stream",), {}) == (None, None)
+
+
+def test_commands_dispatched_through_fair_scheduler(backend):
+    assert backend.command_stats() == {}
+    backend.thread_pool = MagicMock()
+    assert backend.thread_pool.pool is not None
+    backend.thread_pool.apply_async(lambda msg: None, kwds={"msg": None})
+    backend.thread_pool.pool.apply_async.assert_called_once()
+    assert backend.command_stats()[None].running == 1
+
+
+def prewarm_person(known=False, error=None):
+    person = MagicMock(spec=DiscordPerson)
+
+    async def dm_channel(create=True):
+        if known or create:
+            if error is not None:
+                raise error
+            return MagicMock()
+        return None
+
+    person.dm_channel.side_effect = dm_channel
+    return person
+
+
+def test_prewarm_dm_channels_paced(backend):
+    people = [prewarm_person(), prewarm_person(), prewarm_person(error=RuntimeError("closed"))]
+    people += [prewarm_person(known=True) for _ in range(10)]
+
+    started = time.monotonic()
+    results = asyncio.run(backend.prewarm_dm_channels_async(people + ["nobody"], rate=50))
+
+    # Only the channels that aren't known are paced.
+    assert 0.04 <= time.monotonic() - started < 0.5
+    assert [result.person for result in results] == people + ["nobody"]
+    failed = [result.error is not None for result in results]
+    assert failed == [False, False, True] + [False] * 10 + [True]
+
+
+def test_raw_presence_update(backend, client):
+    backend.callback_presence = MagicMock()
+    data = {"user": {"id": "2345678901234567890"}, "guild_id": "1", "status": "idle"}
+
+    asyncio.run(backend.on_raw_presence_update(data))
+    asyncio.run(backend.on_raw_presence_update(data))
+    asyncio.run(backend.on_raw_presence_update(dict(data, status="offline")))
+
+    statuses = [call.args[0].status for call in backend.callback_presence.call_args_list]
+    assert statuses == ["away", "offline"]
+    assert backend.callback_presence.call_args.args[0].identifier.id == 2345678901234567890
+    assert backend.statuses == {}
+
+
+def test_raw_reaction(backend, client):
+    backend.callback_reaction = MagicMock()
+    payload = MagicMock(
+        user_id=2345678901234567890,
+        channel_id=1234567890123456789,
+        guild_id=1,
+        message_id=3,
+        member=None,
+        emoji="👍",
+    )
+
+    asyncio.run(backend.on_raw_reaction_add(payload))
+
+    reaction = backend.callback_reaction.call_args.args[0]
+    assert reaction.action == "added"
+    assert reaction.reaction_name == "👍"
+    assert reaction.reactor.id == 2345678901234567890
+    assert reaction.reactor.room.id == 1234567890123456789
+    assert reaction.reacted_to["message_id"] == 3
+
+
+def test_acl_filter_replaces_errbot_filter(backend):
+    class ACLS:
+        def acls(self, msg, cmd, args, dry_run):
+            return msg, cmd, args
+
+        acls._err_command_filter = True
+
+    plugin = ACLS()
+    backend.inject_command_filters_from(plugin)
+    assert backend.command_filters == [backend.acl_filter]
+
+    backend.remove_command_filters_from(plugin)
+    assert backend.command_filters == []
+
+
+def test_acl_identity_cached(backend):
+    person = MagicMock(spec=DiscordPerson, id=2345678901234567890)
+    person.acl_identity.return_value = "identity"
+
+    assert backend.acl_identity(person) == "identity"
+    assert backend.acl_identity(person) == "identity"
+    person.acl_identity.assert_called_once_with(None)
+
+    backend.invalidate_identifiers()
+    backend.acl_identity(person)
+    assert person.acl_identity.call_count == 2
+
+
+def provision_guild():
+    guild = MagicMock(id=1)
+    existing = MagicMock(id=3, guild=guild)
+    existing.name = "existing"
+    existing.set_permissions = AsyncMock()
+    category = MagicMock(id=2, text_channels=[existing], overwrites={})
+    category.name = "project"
+    guild.categories = [category]
+
+    async def create_text_channel(name, category=None, overwrites=None):
+        await asyncio.sleep(1 if name == "slow" else 0.1)
+        if name == "invalid":
+            raise RuntimeError("Invalid channel name")
+        channel = MagicMock(id=4, guild=guild)
+        channel.name = name
+        return channel
+
+    guild.create_text_channel = AsyncMock(side_effect=create_text_channel)
+    return guild
+
+
+def test_provision_rooms_concurrently(backend, client):
+    guild = provision_guild()
+    client.get_guild.return_value = guild
+    backend.bridge = LoopBridge(client, timeout=0.5)
+    person = DiscordPerson(2345678901234567890, client=client)
+    names = ["a", "b", "c", "invalid", "existing", "slow"]
+
+    started = time.monotonic()
+    results = asyncio.run(backend.provision_rooms_async(1, names, "project", [person]))
+
+    assert time.monotonic() - started < 0.8
+    assert [result.name for result in results] == names
+    assert [result.error is None for result in results] == [True] * 3 + [False, True, False]
+    assert isinstance(results[-1].error, TimeoutError)
+    assert results[0].room.name == "a"
+    guild.create_category.assert_not_called()
+    # The members' access is granted with the channel creation.
+    overwrites = guild.create_text_channel.await_args.kwargs["overwrites"]
+    assert [(target.id, o.read_messages) for target, o in overwrites.items()] == [
+        (2345678901234567890, True)
+    ]
+    guild.categories[0].text_channels[0].set_permissions.assert_awaited_once()
+
+
+def test_provision_rooms_unknown_guild(backend, client):
+    client.get_guild.return_value = None
+    backend.bridge = LoopBridge(client)
+
+    with pytest.raises(ValueError):
+        asyncio.run(backend.provision_rooms_async(1, ["a"]))
+
+
+def test_queued_cards_sent_before_message(backend):
+    sent = []
+    recipient = MagicMock(spec=DiscordPerson, id=2345678901234567890)
+
+    async def send(content=None, embeds=None, **kwargs):
+        sent.append(("start", "embeds" if embeds else "text"))
+        await asyncio.sleep(0.01)
+        sent.append(("end", "embeds" if embeds else "text"))
+
+    recipient.send.side_effect = send
+
+    async def run():
+        future = backend.card_batcher.add(recipient, discord.Embed(title="card"))
+        await backend._send(recipient, content="text")
+        await future
+
+    asyncio.run(run())
+
+    assert sent == [("start", "embeds"), ("end", "embeds"), ("start", "text"), ("end", "text")]
+
+
+def test_provision_rooms_normalises_names(backend, client):
+    guild = provision_guild()
+    guild.categories[0].text_channels[0].name = "ops-alerts"
+    client.get_guild.return_value = guild
+    backend.bridge = LoopBridge(client)
+    names = ["Ops Alerts", "ops-alerts", "New Room", "new  room"]
+
+    results = asyncio.run(backend.provision_rooms_async(1, names, "project"))
+
+    assert [result.name for result in results] == names
+    assert all(result.error is None for result in results)
+    assert results[0].room is results[1].room
+    assert results[0].room.id == 3
+    created = [call.args[0] for call in guild.create_text_channel.await_args_list]
+    assert created == ["new-room"]
+
+
+def test_queued_cards_sent_before_disconnecting(backend):
+    sent = []
+    recipient = MagicMock(spec=DiscordPerson, id=2345678901234567890)
+
+    async def send(embeds=None, **kwargs):
+        sent.append("card")
+
+    recipient.send.side_effect = send
+    backend.client = MagicMock()
+    backend.client.close = AsyncMock(side_effect=lambda: sent.append("close"))
+
+    async def run():
+        backend.card_batcher.add(recipient, discord.Embed(title="card"))
+        await backend._close_client()
+
+    asyncio.run(run())
+
+    assert sent == ["card", "close"]
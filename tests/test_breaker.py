@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import discord
+import pytest
+from mock import AsyncMock, MagicMock
+
+from discordlib.breaker import CircuitBreaker, DestinationUnavailable
+from discordlib.person import DiscordSender
+from discordlib.room import DiscordRoom
+
+CHANNEL_ID = 1234567890123456789
+
+
+def not_found():
+    return discord.NotFound(MagicMock(status=404, reason="Not Found"), {"code": 10003})
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(threshold=2, delay=60)
+
+    breaker.failure(CHANNEL_ID)
+    breaker.check(CHANNEL_ID)
+    breaker.failure(CHANNEL_ID)
+    with pytest.raises(DestinationUnavailable):
+        breaker.check(CHANNEL_ID)
+
+    breaker.success(CHANNEL_ID)
+    breaker.check(CHANNEL_ID)
+    assert len(breaker) == 0
+
+
+def test_backoff_and_single_retry():
+    breaker = CircuitBreaker(threshold=1, delay=0.01, max_delay=0.02)
+    assert [breaker._backoff(failures) for failures in (1, 2, 3, 10)] == [0.01, 0.02, 0.02, 0.02]
+
+    breaker.failure(CHANNEL_ID)
+    assert breaker.is_open(CHANNEL_ID)
+    time.sleep(0.02)
+    # A single operation is let through once the delay elapsed.
+    assert not breaker.is_open(CHANNEL_ID)
+    assert breaker.is_open(CHANNEL_ID)
+
+
+def test_backoff_capped_for_destinations_failing_for_good():
+    breaker = CircuitBreaker(threshold=3, delay=5.0, max_delay=300)
+
+    for _ in range(1100):
+        breaker.failure(CHANNEL_ID)
+
+    assert breaker._backoff(1100) == 300
+    with pytest.raises(DestinationUnavailable):
+        breaker.check(CHANNEL_ID)
+
+
+def test_room_send_short_circuited():
+    client = MagicMock()
+    channel = MagicMock(spec=discord.TextChannel, id=CHANNEL_ID)
+    channel.send = AsyncMock(side_effect=not_found())
+    client.get_channel.return_value = channel
+    breaker = CircuitBreaker(threshold=2, delay=60)
+    DiscordSender.register_client(client, breaker=breaker)
+
+    room = DiscordRoom(channel_id=CHANNEL_ID, client=client)
+    for _ in range(2):
+        with pytest.raises(discord.NotFound):
+            asyncio.run(room.send(content="hello"))
+    with pytest.raises(DestinationUnavailable):
+        asyncio.run(room.send(content="hello"))
+    assert channel.send.await_count == 2
+
+    breaker.reset(CHANNEL_ID)
+    channel.send.side_effect = None
+    asyncio.run(room.send(content="hello"))
+    assert len(breaker) == 0
+
+
+def test_from_id_short_circuited():
+    client = MagicMock()
+    client.get_channel.return_value = None
+    breaker = CircuitBreaker(threshold=2, delay=60)
+    DiscordSender.register_client(client, breaker=breaker)
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            DiscordRoom.from_id(CHANNEL_ID, client)
+    assert breaker.is_open(CHANNEL_ID)
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import threading
+
+import pytest
+from mock import MagicMock
+
+from discordlib.bridge import LoopBridge
+
+log = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def bridge():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield LoopBridge(MagicMock(loop=loop), timeout=1)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+async def double(value):
+    return value * 2
+
+
+def test_run(bridge):
+    assert bridge.run(double(21)) == 42
+
+
+def test_run_timeout_cancels(bridge):
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        bridge.run(slow(), timeout=0.05)
+    assert cancelled.wait(1)
+
+
+def test_submissions_share_a_handoff(bridge):
+    loop = bridge.loop
+    bridge.client.loop = MagicMock(wraps=loop)
+
+    gate = threading.Event()
+    loop.call_soon_threadsafe(gate.wait)
+    futures = [bridge.submit(double(i)) for i in range(10)]
+    gate.set()
+
+    assert [f.result(1) for f in futures] == [i * 2 for i in range(10)]
+    assert bridge.client.loop.call_soon_threadsafe.call_count == 1
+
+
+def test_run_from_loop_raises(bridge):
+    async def nested():
+        with pytest.raises(RuntimeError):
+            bridge.run(double(1))
+        return True
+
+    assert bridge.run(nested())
+
+
+def test_wait_timeout(bridge):
+    async def waiter():
+        with pytest.raises(TimeoutError):
+            await bridge.wait(asyncio.sleep(10), timeout=0.01)
+        return await bridge.wait(double(2))
+
+    assert bridge.run(waiter()) == 4
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+import discord
+import pytest
+from errbot.backends.base import Card
+from mock import MagicMock
+
+from discordlib.card import CardBatcher, build_embed, parse_colour
+
+log = logging.getLogger(__name__)
+
+
+def test_parse_colour():
+    assert parse_colour("red") == 0xFF0000
+    assert parse_colour("#00ff00") == 0x00FF00
+    assert parse_colour(None) is None
+
+
+def test_build_embed():
+    card = Card(
+        body="status ok",
+        title="Build",
+        color="green",
+        fields=(("branch", "main"), ("result", "pass")),
+    )
+    em = build_embed(card)
+    assert em.title == "Build"
+    assert em.description == "status ok"
+    assert em.colour.value == 0x008000
+    assert [(f.name, f.value) for f in em.fields] == [("branch", "main"), ("result", "pass")]
+
+    # Embeds built from the same template don't share mutable state.
+    em.add_field(name="extra", value="1")
+    assert len(build_embed(card).fields) == 2
+    em.set_field_at(0, name="branch", value="release")
+    assert build_embed(card).fields[0].value == "main"
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    async def __call__(self, recipient, embeds):
+        self.sent.append((recipient.id, len(embeds)))
+        return MagicMock()
+
+
+def run_batcher(batcher, queue):
+    async def run():
+        futures = queue()
+        return await asyncio.gather(*futures)
+
+    return asyncio.run(run())
+
+
+def test_batches_are_packed_up_to_embed_limit():
+    send = Recorder()
+    batcher = CardBatcher(send, window=0.01)
+    room = MagicMock(spec=["id"], id=1)
+
+    results = run_batcher(
+        batcher, lambda: [batcher.add(room, discord.Embed(title=str(i))) for i in range(12)]
+    )
+
+    assert send.sent == [(1, 10), (1, 2)]
+    assert len(results) == 12
+
+
+def test_batches_are_per_recipient():
+    send = Recorder()
+    batcher = CardBatcher(send, window=0.01)
+    rooms = [MagicMock(spec=["id"], id=i) for i in range(2)]
+
+    run_batcher(
+        batcher,
+        lambda: [batcher.add(rooms[i % 2], discord.Embed(title=str(i))) for i in range(6)],
+    )
+
+    assert sorted(send.sent) == [(0, 3), (1, 3)]
+
+
+def test_batch_respects_total_size():
+    send = Recorder()
+    batcher = CardBatcher(send, window=0.01)
+    room = MagicMock(spec=["id"], id=1)
+
+    run_batcher(
+        batcher,
+        lambda: [batcher.add(room, discord.Embed(description="x" * 2500)) for i in range(3)],
+    )
+
+    assert send.sent == [(1, 2), (1, 1)]
+
+
+def test_failed_batch_sets_exception():
+    async def send(recipient, embeds):
+        raise RuntimeError("boom")
+
+    batcher = CardBatcher(send, window=0.01)
+    room = MagicMock(spec=["id"], id=1)
+
+    with pytest.raises(RuntimeError):
+        run_batcher(batcher, lambda: [batcher.add(room, discord.Embed(title="x"))])
@@ -0,0 +1,62 @@
+import time
+from tempfile import mkdtemp
+
+import discord
+
+from discordlib.dedup import MessageDeduplicator
+
+
+def snowflake(age=0, sequence=0):
+    created = discord.utils.utcnow().timestamp() - age
+    return discord.utils.time_snowflake(discord.utils.utcnow().fromtimestamp(created)) + sequence
+
+
+def test_seen_once():
+    dedup = MessageDeduplicator()
+    message_id = snowflake()
+
+    assert not dedup.seen(message_id)
+    assert dedup.seen(message_id)
+    assert not dedup.seen(message_id + 1)
+
+
+def test_messages_older_than_window_are_processed_once():
+    # Messages replayed when a session is resumed after an outage.
+    dedup = MessageDeduplicator(window=60)
+    message_id = snowflake(age=3600)
+
+    assert not dedup.seen(message_id)
+    assert dedup.seen(message_id)
+
+
+def test_memory_is_bounded():
+    dedup = MessageDeduplicator(window=60, maxsize=10)
+    ids = [snowflake(sequence=n) for n in range(25)]
+    for message_id in ids:
+        dedup.seen(message_id)
+
+    assert len(dedup) == 10
+    assert dedup.seen(ids[-1])
+
+    # Ids are forgotten once they leave the window.
+    later = time.time() + 120
+    dedup.seen(snowflake(sequence=100), now=later)
+    assert len(dedup) == 1
+    assert not dedup.seen(ids[-1], now=later)
+
+
+def test_save_and_load():
+    path = mkdtemp() + "/messages.json"
+    dedup = MessageDeduplicator()
+    ids = [snowflake(sequence=n) for n in range(3)]
+    for message_id in ids:
+        dedup.seen(message_id)
+    dedup.save(path)
+
+    loaded = MessageDeduplicator()
+    loaded.load(path)
+    assert all(loaded.seen(message_id) for message_id in ids)
+
+    missing = MessageDeduplicator()
+    missing.load(path + ".missing")
+    assert len(missing) == 0
@@ -0,0 +1,72 @@
+import logging
+import random
+
+import pytest
+
+from discordlib.packer import pack_message
+
+log = logging.getLogger(__name__)
+
+
+def fences(chunk):
+    return sum(1 for line in chunk.splitlines() if line.strip().startswith("```"))
+
+
+def test_short_body_is_unchanged():
+    assert list(pack_message("hello", 2000)) == ["hello"]
+    assert list(pack_message("", 2000)) == []
+
+
+def test_split_on_line_boundaries():
+    body = "\n".join("x" * 9 for _ in range(10))
+    chunks = list(pack_message(body, 25))
+    assert chunks == ["x" * 9 + "\n" + "x" * 9] * 5
+
+
+def test_code_block_is_reopened():
+    body = "text\n```python\n" + "\n".join(f"print({i})" for i in range(10)) + "\n```\nend"
+    chunks = list(pack_message(body, 60))
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 60
+        assert fences(chunk) % 2 == 0
+    assert chunks[1].startswith("```python\n")
+    assert chunks[-1].endswith("end")
+
+
+def test_long_line_is_cut():
+    chunks = list(pack_message("a" * 50 + "\nb", 20))
+    assert chunks == ["a" * 20, "a" * 20, "a" * 10 + "\nb"]
+
+
+def test_unterminated_code_block_is_closed():
+    chunks = list(pack_message("```\n" + "line\n" * 10, 20))
+    assert all(fences(chunk) % 2 == 0 for chunk in chunks)
+
+
+def test_invalid_limit():
+    with pytest.raises(ValueError):
+        list(pack_message("x" * 100, 4))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_bodies(seed):
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(rnd.randint(1, 300)):
+        kind = rnd.random()
+        if kind < 0.1:
+            lines.append("```" + rnd.choice(["", "python", "json"]))
+        else:
+            lines.append("w" * rnd.randint(0, 120))
+    body = "\n".join(lines)
+    limit = rnd.choice([50, 100, 2000])
+
+    chunks = list(pack_message(body, limit))
+
+    assert all(0 < len(chunk) <= limit for chunk in chunks)
+    assert all(fences(chunk) % 2 == 0 for chunk in chunks)
+    # Nothing but fences and line breaks is added or lost.
+    text = lambda s: "".join(line for line in s.splitlines() if not line.startswith("```"))
+    assert text("\n".join(chunks)) == text(body)
@@ -0,0 +1,100 @@
+import asyncio
+
+import discord
+import pytest
+from mock import AsyncMock, MagicMock
+
+from discordlib.permissions import PermissionCache, SendForbidden
+from discordlib.person import DiscordSender
+from discordlib.room import DiscordRoom
+
+CHANNEL_ID = 1234567890123456789
+GUILD_ID = 2234567890123456789
+USER_ID = 3234567890123456789
+
+
+def make_channel(permissions, cls=discord.TextChannel, channel_id=CHANNEL_ID):
+    channel = MagicMock(spec=cls, id=channel_id)
+    channel.guild.id = GUILD_ID
+    channel.guild.me.is_timed_out.return_value = False
+    channel.permissions_for.return_value = permissions
+    channel.send = AsyncMock()
+    return channel
+
+
+def forbidden(code):
+    return discord.Forbidden(MagicMock(status=403, reason="Forbidden"), {"code": code})
+
+
+def test_permissions_cached_until_guild_invalidated():
+    cache = PermissionCache()
+    channel = make_channel(discord.Permissions(read_messages=True, send_messages=True))
+
+    cache.check_channel(channel)
+    cache.check_channel(channel)
+    assert channel.permissions_for.call_count == 1
+
+    cache.forget_guild(GUILD_ID)
+    channel.permissions_for.return_value = discord.Permissions(read_messages=True)
+    with pytest.raises(SendForbidden):
+        cache.check_channel(channel)
+
+
+def test_embeds_files_and_threads():
+    cache = PermissionCache()
+    channel = make_channel(discord.Permissions(read_messages=True, send_messages=True))
+
+    with pytest.raises(SendForbidden):
+        cache.check_channel(channel, embeds=True)
+    with pytest.raises(SendForbidden):
+        cache.check_channel(channel, files=True)
+
+    thread = make_channel(
+        discord.Permissions(read_messages=True, send_messages=True), cls=discord.Thread
+    )
+    with pytest.raises(SendForbidden):
+        cache.check_channel(thread)
+
+    # Partial channels can't be checked.
+    cache.check_channel(MagicMock(spec=discord.PartialMessageable))
+
+
+def test_refused_destinations_cached():
+    cache = PermissionCache(negative_ttl=60)
+    channel = make_channel(discord.Permissions.all())
+
+    cache.channel_refused(channel, forbidden(50013))
+    with pytest.raises(SendForbidden):
+        cache.check_channel(channel)
+
+    cache.user_refused(USER_ID, forbidden(50001))
+    cache.check_user(USER_ID)
+    cache.user_refused(USER_ID, forbidden(50007))
+    with pytest.raises(SendForbidden):
+        cache.check_user(USER_ID)
+
+    cache.negative_ttl = 0
+    cache.user_refused(USER_ID, forbidden(50007))
+    cache.check_user(USER_ID)
+
+
+def test_room_send_fails_locally():
+    client = MagicMock()
+    channel = make_channel(discord.Permissions(read_messages=True))
+    client.get_channel.return_value = channel
+    cache = PermissionCache()
+    DiscordSender.register_client(client, permissions=cache)
+
+    room = DiscordRoom(channel_id=CHANNEL_ID, client=client)
+    with pytest.raises(SendForbidden):
+        asyncio.run(room.send(content="hello"))
+    channel.send.assert_not_awaited()
+
+    cache.forget_guild(GUILD_ID)
+    channel.permissions_for.return_value = discord.Permissions.all()
+    channel.send.side_effect = forbidden(50013)
+    with pytest.raises(discord.Forbidden):
+        asyncio.run(room.send(content="hello"))
+    with pytest.raises(SendForbidden):
+        asyncio.run(room.send(content="hello"))
+    assert channel.send.await_count == 1
@@ -8,7 +8,7 @@ from errbot.backends.base import RoomDoesNotExistError
 import pytest
 from mock import MagicMock
 
-from discordlib.person import DiscordPerson
+from discordlib.person import DiscordPerson, DiscordSender
 
 log = logging.getLogger(__name__)
 
@@ -100,3 +100,32 @@ def todo_equal():
 
 def todo_hash():
     raise NotImplementedError
+
+
+def bound_client(user_id):
+    client = MagicMock()
+    client.get_user.return_value = MagicMock(id=user_id)
+    return client
+
+
+def test_person_bound_to_its_client():
+    first, second = bound_client(1234567890123456789), bound_client(1234567890123456789)
+
+    DiscordPerson(user_id="1234567890123456789", client=first)
+    DiscordPerson(user_id="1234567890123456789", client=second)
+
+    first.get_user.assert_called_once_with(1234567890123456789)
+    second.get_user.assert_called_once_with(1234567890123456789)
+
+
+def test_person_uses_identities_registered_for_its_client():
+    client = bound_client(None)
+    client.get_user.return_value = None
+    identities = MagicMock()
+    identities.user_name.return_value = ("someone", "0")
+    DiscordSender.register_client(client, identities)
+
+    person = DiscordPerson(user_id="1234567890123456789", client=client)
+
+    assert person.fullname == "someone#0"
+    identities.user_name.assert_called_with(1234567890123456789)
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+import discord
+import pytest
+from mock import AsyncMock, MagicMock
+
+from discordlib.presence import PresenceScheduler
+
+log = logging.getLogger(__name__)
+
+
+def make_client():
+    client = MagicMock()
+    client.change_presence = AsyncMock()
+    return client
+
+
+def test_updates_are_coalesced_within_rate_limit():
+    client = make_client()
+
+    async def rotate():
+        scheduler = PresenceScheduler(client, rate=2, per=0.2)
+        for i in range(20):
+            scheduler.request(discord.Status.online, discord.Game(name=f"status {i}"))
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.3)
+
+    asyncio.run(rotate())
+
+    sent = [call.kwargs["activity"].name for call in client.change_presence.await_args_list]
+    assert len(sent) <= 4
+    assert sent[-1] == "status 19"
+
+
+def test_unchanged_presence_is_not_sent():
+    client = make_client()
+
+    async def repeat():
+        scheduler = PresenceScheduler(client, rate=5, per=1)
+        for _ in range(3):
+            scheduler.request(discord.Status.idle, discord.Game(name="busy"))
+            await asyncio.sleep(0.01)
+
+    asyncio.run(repeat())
+
+    client.change_presence.assert_awaited_once()
+    assert client.status == discord.Status.idle
+
+
+def test_rate_must_allow_updates():
+    with pytest.raises(ValueError):
+        PresenceScheduler(make_client(), rate=0)
@@ -0,0 +1,16 @@
+from mock import MagicMock
+
+from discordlib.raw import dispatch_raw_events
+
+
+def test_raw_events_dispatched_after_parsing():
+    client = MagicMock()
+    parse = MagicMock()
+    client._connection.parsers = {"GUILD_MEMBER_UPDATE": parse, "MESSAGE_CREATE": MagicMock()}
+
+    dispatch_raw_events(client, {"GUILD_MEMBER_UPDATE": "raw_member_update"})
+    data = {"guild_id": "1", "user": {"id": "2"}}
+    client._connection.parsers["GUILD_MEMBER_UPDATE"](data)
+
+    parse.assert_called_once_with(data)
+    client.dispatch.assert_called_once_with("raw_member_update", data)
@@ -0,0 +1,86 @@
+import logging
+
+import discord
+import pytest
+from mock import MagicMock
+
+from discordlib.registry import RoomRegistry
+from discordlib.room import DiscordRoom
+
+log = logging.getLogger(__name__)
+
+
+def make_channel(channel_id, guild_id, channel_type=discord.ChannelType.text):
+    channel = MagicMock()
+    channel.id = channel_id
+    channel.guild.id = guild_id
+    channel.type = channel_type
+    return channel
+
+
+@pytest.fixture
+def registry():
+    channels = {
+        channel.id: channel
+        for channel in [
+            make_channel(1234567890123456781, 1000000000000000001),
+            make_channel(1234567890123456782, 1000000000000000001, discord.ChannelType.voice),
+            make_channel(1234567890123456783, 1000000000000000002),
+            make_channel(1234567890123456784, 1000000000000000002),
+        ]
+    }
+    client = MagicMock()
+    client.get_channel.side_effect = channels.get
+    setattr(DiscordRoom, "client", client)
+
+    registry = RoomRegistry(client)
+    registry.rebuild(list(channels.values())[:3])
+    registry.channels = channels
+    return registry
+
+
+def test_rooms_all(registry):
+    assert [room.id for room in registry.rooms()] == [
+        1234567890123456781,
+        1234567890123456782,
+        1234567890123456783,
+    ]
+
+
+def test_rooms_filtered(registry):
+    assert [room.id for room in registry.rooms(guild_id="1000000000000000001")] == [
+        1234567890123456781,
+        1234567890123456782,
+    ]
+    assert [room.id for room in registry.rooms(channel_type=discord.ChannelType.voice)] == [
+        1234567890123456782
+    ]
+
+
+def test_rooms_view_is_cached(registry):
+    assert registry.rooms() is registry.rooms()
+
+
+def test_channel_events_refresh_view(registry):
+    view = registry.rooms()
+    registry.add(registry.channels[1234567890123456784])
+    assert len(registry.rooms()) == 4
+    assert registry.rooms() is not view
+
+    registry.remove(1234567890123456781)
+    assert 1234567890123456781 not in registry
+    assert len(registry.rooms()) == 3
+
+
+def test_remove_guild(registry):
+    registry.remove_guild(1000000000000000001)
+    assert [room.id for room in registry.rooms()] == [1234567890123456783]
+
+
+def test_rooms_bound_to_registry_client(registry):
+    # Another bot initialised later replaces the class client.
+    setattr(DiscordRoom, "client", MagicMock())
+    registry.rebuild(list(registry.channels.values()))
+
+    assert len(registry.rooms()) == 4
+    assert all(room._client is registry.client for room in registry.rooms())
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+from tempfile import mkdtemp
+
+import pytest
+from mock import MagicMock
+
+from discordlib.replay import GatewayRecorder, GatewayReplayer, read_events
+
+
+def raw(op, t=None, d=None):
+    return json.dumps({"op": op, "t": t, "s": None, "d": d})
+
+
+def test_recorder_only_records_dispatch_events():
+    path = os.path.join(mkdtemp(), "gateway.jsonl")
+    recorder = GatewayRecorder(path)
+
+    asyncio.run(recorder.on_socket_raw_receive(raw(11)))
+    asyncio.run(recorder.on_socket_raw_receive(raw(0, "MESSAGE_CREATE", {"id": "1"})))
+    asyncio.run(recorder.on_socket_raw_receive(raw(0, "TYPING_START", {"user_id": "2"})))
+    recorder.close()
+
+    events = list(read_events(path))
+    assert [(event, data) for _, event, data in events] == [
+        ("MESSAGE_CREATE", {"id": "1"}),
+        ("TYPING_START", {"user_id": "2"}),
+    ]
+    assert recorder.recorded == 2
+
+
+def test_recorder_event_filter_and_append():
+    path = os.path.join(mkdtemp(), "gateway.jsonl")
+    for content in ["first", "second"]:
+        recorder = GatewayRecorder(path, events=["MESSAGE_CREATE"])
+        recorder.record(raw(0, "MESSAGE_CREATE", {"content": content}))
+        recorder.record(raw(0, "TYPING_START", {}))
+        recorder.close()
+
+    assert [data["content"] for _, _, data in read_events(path)] == ["first", "second"]
+
+
+def test_read_events_skips_truncated_line():
+    path = os.path.join(mkdtemp(), "gateway.jsonl")
+    with open(path, "w") as f:
+        f.write('[1.0,"MESSAGE_CREATE",{"id":"1"}]\n[2.0,"MESSAGE_CR')
+
+    assert list(read_events(path)) == [(1.0, "MESSAGE_CREATE", {"id": "1"})]
+
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    client._connection.parsers = {"MESSAGE_CREATE": MagicMock(), "GUILD_CREATE": MagicMock()}
+    return client
+
+
+def test_replayer_feeds_parsers_in_order(client):
+    events = [
+        (1.0, "GUILD_CREATE", {"id": "1"}),
+        (1.0, "UNKNOWN_EVENT", {}),
+        (1.0, "MESSAGE_CREATE", {"id": "2"}),
+    ]
+
+    count = asyncio.run(GatewayReplayer(client, speed=0).replay(events))
+
+    assert count == 2
+    client._connection.parsers["GUILD_CREATE"].assert_called_once_with({"id": "1"})
+    client._connection.parsers["MESSAGE_CREATE"].assert_called_once_with({"id": "2"})
+
+
+def test_replayer_speed_and_max_delay(client):
+    events = [
+        (0.0, "MESSAGE_CREATE", {}),
+        (0.2, "MESSAGE_CREATE", {}),
+        (3600, "MESSAGE_CREATE", {}),
+    ]
+    replayer = GatewayReplayer(client, speed=2, max_delay=0.1)
+
+    async def replay():
+        start = asyncio.get_running_loop().time()
+        await replayer.replay(events)
+        return asyncio.get_running_loop().time() - start
+
+    # 0.2s at double speed, then the hour long gap is capped.
+    assert 0.19 <= asyncio.run(replay()) < 0.5
+
+
+def test_replayer_continues_after_parser_failure(client):
+    client._connection.parsers["GUILD_CREATE"].side_effect = KeyError("avatar")
+    events = [(0, "GUILD_CREATE", {}), (0, "MESSAGE_CREATE", {})]
+
+    assert asyncio.run(GatewayReplayer(client, speed=0).replay(events)) == 1
+    client._connection.parsers["MESSAGE_CREATE"].assert_called_once()
+
+
+def test_replayer_rejects_negative_speed(client):
+    with pytest.raises(ValueError):
+        GatewayReplayer(client, speed=-1)
@@ -1,8 +1,11 @@
+import asyncio
 import logging
 
+import discord
 import pytest
-from mock import MagicMock
+from mock import AsyncMock, MagicMock
 
+from discordlib.person import DiscordPerson
 from discordlib.room import DiscordRoom
 
 log = logging.getLogger(__name__)
@@ -41,3 +44,40 @@ def test_create_room_with_id(discord_room):
 def test_create_room_with_name_and_guild_id(discord_room):
     room = discord_room(channel_name="#testing_ground", guild_id="2345678901234567890")
     assert room.id == 1234567890132456789
+
+
+def test_invite_concurrently():
+    client = MagicMock()
+    channel = MagicMock(id=1234567890123456789)
+    channel.overwrites_for.side_effect = lambda target: discord.PermissionOverwrite()
+    channel.set_permissions = AsyncMock(
+        side_effect=[None, discord.Forbidden(MagicMock(status=403), "Missing Access")]
+    )
+    client.get_channel.return_value = channel
+    client.http.edit_channel_permissions = AsyncMock()
+    room = DiscordRoom(channel_id="1234567890123456789", client=client)
+    people = [
+        DiscordPerson(1234567890123456789, client=client),
+        DiscordPerson(2345678901234567890, client=client),
+        # Missing from the client cache.
+        DiscordPerson(client=client, user=discord.Object(3456789012345678901)),
+    ]
+    client.get_user.return_value = None
+
+    results = asyncio.run(room.invite_async(*people))
+
+    assert [result.person for result in results] == people
+    assert [result.error is None for result in results] == [True, False, True]
+    assert channel.set_permissions.await_count == 2
+    assert client.http.edit_channel_permissions.await_args.args[:2] == (
+        1234567890123456789,
+        3456789012345678901,
+    )
+
+
+def test_invite_non_discord_users():
+    client = MagicMock()
+    room = DiscordRoom(channel_id="1234567890123456789", client=client)
+
+    with pytest.raises(RuntimeError):
+        room.invite("someone")
@@ -0,0 +1,141 @@
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from discordlib.scheduler import FairScheduler
+
+
+def key(args, kwds):
+    return kwds["guild"], kwds["user"]
+
+
+@pytest.fixture
+def pool():
+    pool = ThreadPool(2)
+    yield pool
+    pool.terminate()
+
+
+def blocking(event):
+    def call(guild, user):
+        event.wait(5)
+
+    return call
+
+
+def recorder():
+    order = []
+    lock = threading.Lock()
+
+    def call(guild, user, delay=0.01):
+        with lock:
+            order.append(guild)
+        time.sleep(delay)
+        return guild
+
+    return order, call
+
+
+def test_guilds_take_turns(pool):
+    order, call = recorder()
+    scheduler = FairScheduler(pool, workers=1, key=key)
+
+    results = [scheduler.apply_async(call, kwds={"guild": "busy", "user": 1}) for _ in range(5)]
+    results.append(scheduler.apply_async(call, kwds={"guild": "quiet", "user": 2}))
+    for result in results:
+        result.wait(5)
+
+    # The quiet guild doesn't wait for the busy guild's backlog.
+    assert order.index("quiet") <= 2
+    assert results[-1].get() == "quiet"
+
+
+def test_weights(pool):
+    order, call = recorder()
+    scheduler = FairScheduler(pool, workers=1, key=key, weights={"heavy": 2})
+    blocker = threading.Event()
+    scheduler.apply_async(blocking(blocker), kwds={"guild": "setup", "user": 0})
+
+    results = [
+        scheduler.apply_async(call, kwds={"guild": guild, "user": 1, "delay": 0})
+        for guild in ["heavy"] * 4 + ["light"] * 4
+    ]
+    blocker.set()
+    for result in results:
+        result.wait(5)
+
+    assert order[:6] == ["heavy", "heavy", "light", "heavy", "heavy", "light"]
+
+
+def test_guild_limit(pool):
+    running = {"guild": 0, "peak_guild": 0}
+    lock = threading.Lock()
+
+    def call(guild, user):
+        with lock:
+            running["guild"] += 1
+            running["peak_guild"] = max(running["peak_guild"], running["guild"])
+        time.sleep(0.01)
+        with lock:
+            running["guild"] -= 1
+
+    scheduler = FairScheduler(pool, workers=2, key=key, guild_limit=1)
+    results = [scheduler.apply_async(call, kwds={"guild": 1, "user": i}) for i in range(4)]
+    for result in results:
+        result.wait(5)
+
+    assert running["peak_guild"] == 1
+    assert scheduler.stats()[1].executed == 4
+
+
+def test_user_limit_lets_other_users_through(pool):
+    order, call = recorder()
+    scheduler = FairScheduler(pool, workers=2, key=key, user_limit=1)
+    blocker = threading.Event()
+
+    first = scheduler.apply_async(blocking(blocker), kwds={"guild": "g", "user": "spammer"})
+    queued = scheduler.apply_async(call, kwds={"guild": "g", "user": "spammer"})
+    other = scheduler.apply_async(call, kwds={"guild": "g", "user": "other"})
+
+    other.wait(5)
+    assert other.ready() and not queued.ready()
+    blocker.set()
+    for result in [first, queued]:
+        result.wait(5)
+    assert queued.successful()
+
+
+def test_stats_and_failures(pool):
+    scheduler = FairScheduler(pool, workers=2, key=key)
+
+    def fail(guild, user):
+        raise RuntimeError("failed")
+
+    result = scheduler.apply_async(fail, kwds={"guild": "g", "user": 1})
+    result.wait(5)
+
+    assert not result.successful()
+    with pytest.raises(RuntimeError):
+        result.get()
+    stats = scheduler.stats()["g"]
+    assert (stats.queued, stats.running, stats.executed) == (0, 0, 1)
+
+
+def test_close_join_and_replace_pool(pool):
+    order, call = recorder()
+    scheduler = FairScheduler(pool, workers=2, key=key)
+    results = [scheduler.apply_async(call, kwds={"guild": "g", "user": i}) for i in range(4)]
+
+    scheduler.close()
+    with pytest.raises(ValueError):
+        scheduler.apply_async(call, kwds={"guild": "g", "user": 1})
+    scheduler.join()
+    assert all(result.ready() for result in results)
+
+    new_pool = ThreadPool(1)
+    scheduler.replace_pool(new_pool)
+    assert scheduler.apply_async(call, kwds={"guild": "g", "user": 1}).get(5) == "g"
+    assert scheduler.stats()["g"].executed == 5
+    new_pool.terminate()
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+import pytest
+
+from discordlib.shared import SharedEventLoop
+
+
+def test_shared_loop_is_a_singleton():
+    assert SharedEventLoop.get() is SharedEventLoop.get()
+
+
+def test_run_waits_for_result_from_loop_thread():
+    shared = SharedEventLoop.get()
+
+    async def where():
+        await asyncio.sleep(0)
+        return threading.current_thread(), asyncio.get_running_loop()
+
+    thread, loop = shared.run(where())
+    assert thread is shared.thread
+    assert loop is shared.loop
+
+
+def test_concurrent_clients_share_the_loop():
+    shared = SharedEventLoop.get()
+    started = []
+
+    async def serve(name):
+        started.append(name)
+        # Both coroutines must be running at the same time to finish.
+        while len(started) < 2:
+            await asyncio.sleep(0.001)
+        return name
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda n=name: results.append(shared.run(serve(n))))
+        for name in ["first", "second"]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert sorted(results) == ["first", "second"]
+
+
+def test_run_propagates_exceptions():
+    async def fail():
+        raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError):
+        SharedEventLoop.get().run(fail())
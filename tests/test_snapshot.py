@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+from tempfile import mkdtemp
+
+import discord
+import pytest
+from mock import AsyncMock, MagicMock
+
+from discordlib.person import DiscordPerson, DiscordSender
+from discordlib.room import DiscordRoom
+from discordlib.snapshot import IdentitySnapshot
+
+USER_ID = 1234567890123456789
+CHANNEL_ID = 2234567890123456789
+GUILD_ID = 3234567890123456789
+DM_CHANNEL_ID = 4234567890123456789
+
+
+def make_client(users=(), channels=(), private_channels=(), members=True):
+    client = MagicMock()
+    client.users = list(users)
+    client.get_all_channels.return_value = list(channels)
+    client.private_channels = list(private_channels)
+    client.intents.members = members
+    client.get_user.return_value = None
+    client.get_channel.return_value = None
+    client.get_guild.return_value = None
+    return client
+
+
+def make_user(user_id=USER_ID, name="someone", discriminator="0"):
+    user = MagicMock(id=user_id, discriminator=discriminator)
+    user.name = name
+    return user
+
+
+def make_channel(channel_id=CHANNEL_ID, name="general", guild_id=GUILD_ID):
+    channel = MagicMock(id=channel_id)
+    channel.name = name
+    channel.guild.id = guild_id
+    return channel
+
+
+@pytest.fixture
+def snapshot():
+    snapshot = IdentitySnapshot(os.path.join(mkdtemp(), "discord_identities.json"))
+    client = make_client(
+        users=[make_user()],
+        channels=[make_channel()],
+        private_channels=[MagicMock(id=DM_CHANNEL_ID, recipient=make_user())],
+    )
+    assert snapshot.refresh(client)
+    return snapshot
+
+
+@pytest.fixture
+def identities(snapshot):
+    clients = DiscordPerson.client, DiscordRoom.client
+    DiscordSender.identities = snapshot
+    DiscordPerson.client = DiscordRoom.client = make_client()
+    yield snapshot
+    DiscordSender.identities = None
+    DiscordPerson.client, DiscordRoom.client = clients
+
+
+def test_save_and_load(snapshot):
+    snapshot.save()
+
+    loaded = IdentitySnapshot(snapshot.path)
+    loaded.load()
+
+    assert loaded.users == {USER_ID: ("someone", "0")}
+    assert loaded.channels == {CHANNEL_ID: ("general", GUILD_ID)}
+    assert loaded.dm_channels == {USER_ID: DM_CHANNEL_ID}
+    assert os.listdir(os.path.dirname(snapshot.path)) == ["discord_identities.json"]
+
+
+def test_load_ignores_missing_and_unknown_version(snapshot):
+    snapshot.load()
+    assert len(snapshot) == 3
+
+    with open(snapshot.path, "w") as f:
+        json.dump({"version": 0}, f)
+    loaded = IdentitySnapshot(snapshot.path)
+    loaded.load()
+    assert len(loaded) == 0
+
+
+def test_refresh_reports_changes(snapshot):
+    client = make_client(users=[make_user()], channels=[make_channel()])
+    assert not snapshot.refresh(client)
+
+    client.users = [make_user(name="renamed")]
+    assert snapshot.refresh(client)
+    assert snapshot.user_id(client, "someone") is None
+    assert snapshot.user_id(client, "renamed") == USER_ID
+    # DM channels are accumulated.
+    assert snapshot.dm_channel_id(USER_ID) == DM_CHANNEL_ID
+
+
+def test_refresh_keeps_unseen_users_without_members_intent(snapshot):
+    other = make_user(user_id=USER_ID + 1, name="other")
+    snapshot.refresh(make_client(users=[other], members=False))
+    assert set(snapshot.users) == {USER_ID, USER_ID + 1}
+
+    snapshot.refresh(make_client(users=[other], members=True))
+    assert set(snapshot.users) == {USER_ID + 1}
+
+
+def test_refresh_bounds_accumulated_users(snapshot):
+    snapshot.maxsize = 2
+    first, second, third = (make_user(USER_ID + i, f"user{i}") for i in range(3))
+    client = make_client(users=[first, second], members=False)
+    snapshot.refresh(client)
+
+    # The first user is seen again, the second one is the least recently seen.
+    client.users = [third, first]
+    snapshot.refresh(client)
+    assert list(snapshot.users) == [third.id, first.id]
+
+
+def test_lookups_are_validated_against_live_cache(snapshot):
+    client = make_client()
+    assert snapshot.user_id(client, "someone", "1234") == USER_ID
+    assert snapshot.channel_id(client, "general", GUILD_ID) == CHANNEL_ID
+
+    client.get_user.return_value = make_user(name="renamed")
+    client.get_channel.return_value = make_channel(name="renamed")
+    assert snapshot.user_id(client, "someone") is None
+    assert snapshot.channel_id(client, "general", GUILD_ID) is None
+
+
+def test_person_resolved_from_snapshot(identities):
+    person = DiscordPerson(username="someone", discriminator="0")
+
+    assert person.id == USER_ID
+    assert person.fullname == "someone#0"
+    assert person.get_discord_object() is DiscordPerson.client.get_partial_messageable.return_value
+    DiscordPerson.client.get_partial_messageable.assert_called_with(
+        DM_CHANNEL_ID, type=discord.ChannelType.private
+    )
+
+
+def test_unknown_person_still_fails(identities):
+    with pytest.raises(ValueError):
+        DiscordPerson(user_id=USER_ID + 1)
+
+
+def test_room_resolved_from_snapshot_before_guild_is_received(identities):
+    room = DiscordRoom("general", GUILD_ID)
+
+    assert room.id == CHANNEL_ID
+    assert room.name == "general"
+
+    with pytest.raises(ValueError):
+        DiscordRoom("unknown", GUILD_ID)
+
+
+def test_dm_channels_added_as_opened(snapshot):
+    client = make_client(users=[make_user()], channels=[make_channel()])
+    snapshot.add_dm_channel(USER_ID + 1, DM_CHANNEL_ID + 1)
+
+    assert snapshot.dm_channel_id(USER_ID + 1) == DM_CHANNEL_ID + 1
+    assert snapshot.refresh(client)
+    assert not snapshot.refresh(client)
+
+
+def test_person_dm_channel_opened_once(identities):
+    client = DiscordPerson.client
+    client.get_user.return_value = make_user(user_id=USER_ID + 1, name="other")
+    client.get_user.return_value.dm_channel = None
+    client.http.start_private_message = AsyncMock(return_value={"id": str(DM_CHANNEL_ID + 1)})
+    client._connection.add_dm_channel.return_value = MagicMock(id=DM_CHANNEL_ID + 1)
+    person = DiscordPerson(USER_ID + 1)
+
+    assert asyncio.run(person.dm_channel(create=False)) is None
+    assert asyncio.run(person.dm_channel()) is client._connection.add_dm_channel.return_value
+    assert identities.dm_channel_id(USER_ID + 1) == DM_CHANNEL_ID + 1
+
+    assert asyncio.run(person.dm_channel()) is client.get_partial_messageable.return_value
+    client.http.start_private_message.assert_awaited_once_with(USER_ID + 1)
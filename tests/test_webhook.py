@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+import discord
+import pytest
+from mock import AsyncMock, MagicMock
+
+from discordlib.webhook import WebhookSender
+
+log = logging.getLogger(__name__)
+
+CHANNEL_ID = 1234567890123456789
+
+
+@pytest.fixture
+def client():
+    existing = MagicMock(id=2345678901234567890, token="t" * 68)
+    existing.name = "errbot"
+    channel = MagicMock()
+    channel.webhooks = AsyncMock(return_value=[existing])
+    channel.create_webhook = AsyncMock()
+
+    client = MagicMock(user=None)
+    client.get_channel.return_value = channel
+    return client
+
+
+def test_handles():
+    sender = WebhookSender(MagicMock(), [str(CHANNEL_ID)])
+    assert sender.handles(CHANNEL_ID)
+    assert not sender.handles(3456789012345678901)
+    assert not sender.handles(None)
+
+
+def test_webhook_is_reused(client, monkeypatch):
+    webhook = MagicMock(send=AsyncMock())
+    monkeypatch.setattr(discord.Webhook, "partial", MagicMock(return_value=webhook))
+    sender = WebhookSender(client, [CHANNEL_ID])
+
+    async def send_many():
+        messages = await asyncio.gather(
+            *(sender.send(CHANNEL_ID, content=str(i)) for i in range(10))
+        )
+        await sender.close()
+        return messages
+
+    messages = asyncio.run(send_many())
+    assert messages == [webhook.send.return_value] * 10
+    assert webhook.send.await_args.kwargs["wait"] is True
+    client.get_channel.return_value.webhooks.assert_awaited_once()
+    client.get_channel.return_value.create_webhook.assert_not_awaited()
+    assert webhook.send.await_count == 10
+
+
+def test_deleted_webhook_is_forgotten(client, monkeypatch):
+    response = MagicMock(status=404)
+    webhook = MagicMock(send=AsyncMock(side_effect=discord.NotFound(response, "Unknown")))
+    monkeypatch.setattr(discord.Webhook, "partial", MagicMock(return_value=webhook))
+    sender = WebhookSender(client, [CHANNEL_ID])
+
+    async def send():
+        try:
+            await sender.send(CHANNEL_ID, content="alert")
+        finally:
+            await sender.close()
+
+    with pytest.raises(discord.NotFound):
+        asyncio.run(send())
+    assert sender._webhooks == {}